@@ -2,11 +2,91 @@
 Methods for generating mask matrices, with 1 entries indicating observed and 0
 indicating unobserved.
 Provide methods for single mask matrices, and cross-validation folds.
+
+The methods that make sure each row and column of M_train has at least one
+observed entry (try_generate_M and the fold methods) do this by construction,
+rather than generating masks until one passes check_empty_rows_columns(). We 
+shuffle the observed entries, and reserve the first entry of each row and the 
+first entry of each column for training. The other entries are then split 
+into the training and test set (or the folds) as usual, using vectorised 
+indexing. So these always succeed on the first attempt, and their :attempts 
+arguments are only kept so that existing calls still work. We only fail if 
+there are not enough observed entries to reserve one for each row and column.
+The reserved entries are in none of the test folds, so the test folds of 
+these methods do not cover every entry of M.
+
+generate_M_rows (and generate_M_columns) keep their own semantics: we reserve 
+one entry of each row (column), and add (I*J)*(1-fraction) other entries to 
+M_train. So try_generate_M_rows and try_generate_M_columns still try these 
+:attempts times until each column (row) has an entry as well.
+
+The folds are returned as a Folds object, which stores the observed entries
+of M and the fold in which each is a test entry (-1 if it is a training entry
+in all folds) as an int8 vector, so it only takes O(|Omega|) memory. The
+training and test masks of a fold are only constructed when we ask for them,
+as scipy.sparse matrices (which the models take directly), or dense with
+dense=True. It can still be unpacked as (Ms_train, Ms_test), two lists of
+masks that are constructed when indexed:
+    folds = compute_folds_stratify_rows_attempts(I, J, no_folds, attempts, M)
+    M_train, M_test = folds.train(fold), folds.test(fold)
+    Ms_train, Ms_test = folds
+The methods generating a single M_train and M_test return those as sparse
+matrices as well.
 """
 
-import numpy
-import random
-from sklearn.cross_validation import StratifiedKFold
+import numpy, scipy.sparse
+
+
+''' Classes for storing the folds. '''
+class Folds(object):
+    def __init__(self,shape,rows,cols,fold_ids,no_folds):
+        ''' Store the folds of the entries (rows,cols) of a :shape mask, where 
+            fold_ids gives the fold in which each entry is a test entry (or -1). '''
+        assert no_folds < 128, "Can only store up to 127 folds, not %s." % no_folds
+        self.shape, self.no_folds = shape, no_folds
+        self.rows = numpy.asarray(rows,dtype=numpy.int32)
+        self.cols = numpy.asarray(cols,dtype=numpy.int32)
+        self.fold_ids = numpy.asarray(fold_ids,dtype=numpy.int8)
+        
+    def __len__(self):
+        return self.no_folds
+        
+    def __iter__(self):
+        ''' Unpack as (Ms_train, Ms_test), lists of the masks of each fold. '''
+        return iter((FoldMasks(self,test=False), FoldMasks(self,test=True)))
+        
+    def train(self,fold,dense=False):
+        ''' Return the training mask of the fold, M - M_test. '''
+        return self.mask(self.fold_ids != fold,dense)
+        
+    def test(self,fold,dense=False):
+        ''' Return the test mask of the fold. '''
+        return self.mask(self.fold_ids == fold,dense)
+        
+    def mask(self,in_mask,dense):
+        ''' Return the mask of the entries where :in_mask is True. '''
+        M = scipy.sparse.csr_matrix(
+            (numpy.ones(in_mask.sum()),(self.rows[in_mask],self.cols[in_mask])),shape=self.shape)
+        return M.toarray() if dense else M
+        
+    def transpose(self):
+        ''' Return the folds of the transposed mask, with the entries in order. '''
+        order = numpy.lexsort((self.rows,self.cols))
+        return Folds((self.shape[1],self.shape[0]),self.cols[order],self.rows[order],self.fold_ids[order],self.no_folds)
+        
+        
+class FoldMasks(object):
+    def __init__(self,folds,test):
+        ''' List of the training (or if :test, test) masks of the folds. '''
+        self.folds, self.test = folds, test
+        
+    def __len__(self):
+        return len(self.folds)
+        
+    def __getitem__(self,fold):
+        if not 0 <= fold < len(self.folds):
+            raise IndexError("Fold %s out of range." % fold)
+        return self.folds.test(fold) if self.test else self.folds.train(fold)
 
 
 ''' Helpers. '''
@@ -14,225 +94,206 @@ def nonzero_indices(M):
     ''' Return a list of indices of all nonzero indices in M. '''
     indices_row, indices_column = numpy.nonzero(M)
     return zip(indices_row, indices_column)
-    
+
 
 def check_empty_rows_columns(M):
     ''' Return True if all rows and columns have at least one observation. '''
     sums_columns = M.sum(axis=0)
     sums_rows = M.sum(axis=1)
-                
-    # Assert none of the rows or columns are entirely unknown values
-    for i,c in enumerate(sums_rows):
-        if c == 0:
-            return False
-    for j,c in enumerate(sums_columns):
-        if c == 0:
-            return False
-    return True
-    
-    
+    return bool((sums_rows != 0).all() and (sums_columns != 0).all())
+
+
+def observed_entries(I,J,M=None):
+    ''' Return the row and column indices of the 1 entries in :M (all entries if
+        M is None, and M can be a scipy.sparse matrix), in order, and a random 
+        permutation of them. '''
+    if M is None:
+        M = numpy.ones((I,J))
+    rows, cols = scipy.sparse.csr_matrix(M).sorted_indices().nonzero() if scipy.sparse.issparse(M) else numpy.nonzero(M)
+    return rows, cols, numpy.random.permutation(len(rows))
+
+
+def reserve_rows(rows):
+    ''' Return a boolean vector marking the first entry of each row, which we 
+        keep for training. '''
+    reserved = numpy.zeros(len(rows),dtype=bool)
+    reserved[numpy.unique(rows,return_index=True)[1]] = True
+    return reserved
+
+
+def reserve_rows_columns(rows,cols):
+    ''' Return a boolean vector marking the first entry of each row, and the
+        first entry of each column, which we keep for training. '''
+    return reserve_rows(rows) | reserve_rows(cols)
+
+
+def split_into_folds(no_entries,no_folds):
+    ''' Return the fold of each of :no_entries (shuffled) entries, splitting
+        them into :no_folds consecutive folds of (almost) equal size. The fold
+        methods only pass the entries that are not reserved for training: the
+        reserved ones get fold id -1 and are in none of the test folds, so the
+        test folds together do not cover every entry of M. '''
+    return numpy.arange(no_entries) * no_folds // max(no_entries,1)
+
+
+def split_into_folds_stratified(labels,no_folds):
+    ''' Return the fold of each of the (shuffled) entries with the given
+        :labels, such that each fold has the same number of entries (up to
+        one) of each label. We assign the entries of each label to the folds
+        in turn, starting at a random fold for each label. As for 
+        split_into_folds(), the entries reserved for training are not passed:
+        they get fold id -1 and are in none of the test folds, so the test 
+        folds together do not cover every entry of M. '''
+    if len(labels) == 0:
+        return numpy.zeros(0,dtype=int)
+    order = numpy.argsort(labels,kind='mergesort')
+    labels_sorted = labels[order]
+    rank = numpy.arange(len(labels)) - numpy.searchsorted(labels_sorted,labels_sorted)
+    offsets = numpy.random.randint(no_folds,size=labels.max()+1)
+    folds = numpy.empty(len(labels),dtype=int)
+    folds[order] = (rank + offsets[labels_sorted]) % no_folds
+    return folds
+
+
+def check_enough_entries(no_train,no_reserved):
+    ''' Assert that we can keep one entry of each row and column for training. '''
+    assert no_reserved <= no_train, "Failed to generate folds for training and test data: need %s training entries " \
+        "for one in each row and column, but only %s are used for training." % (no_reserved,no_train)
+
+
 ''' Generating methods. '''
 def generate_M(I,J,fraction,M=None):
     ''' Generate a mask matrix M_train with :fraction missing entries. 
         If :M is defined, use only those 1-entries. '''
-    if M is None:
-        M = numpy.ones((I,J))
-    indices = nonzero_indices(M)
-    no_elements = len(indices)
-    no_missing_total = I*J - no_elements
+    rows, cols, permutation = observed_entries(I=I,J=J,M=M)
+    no_missing_total = I*J - len(rows)
     assert no_missing_total < I*J*fraction, "Specified %s fraction missing, so %s entries missing, but there are already %s missing by default!" % \
         (fraction,I*J*fraction,no_missing_total)
     
-    # Shuffle the observed entries, take the first (I*J)*(1-fraction) and mark those as observed
-    M_train, M_test = numpy.zeros((I,J)), numpy.zeros((I,J))
-    random.shuffle(indices)
+    # Take the first (I*J)*(1-fraction) shuffled entries and mark those as observed
     index_last_observed = int(I*J*(1-fraction))
+    fold_ids = -numpy.ones(len(rows),dtype=numpy.int8)
+    fold_ids[permutation[index_last_observed:]] = 0
+    split = Folds((I,J),rows,cols,fold_ids,1)
+    return split.train(0), split.test(0)
+
+
+def generate_M_reserved(I,J,fraction,M=None):
+    ''' Generate a mask matrix M_train with :fraction missing entries, and at
+        least one entry in each row and column (by reserving those first).
+        If :M is defined, use only those 1-entries. '''
+    rows, cols, permutation = observed_entries(I=I,J=J,M=M)
+    no_missing_total = I*J - len(rows)
+    assert no_missing_total < I*J*fraction, "Specified %s fraction missing, so %s entries missing, but there are already %s missing by default!" % \
+        (fraction,I*J*fraction,no_missing_total)
     
-    for i,j in indices[:index_last_observed]:
-        M_train[i,j] = 1
-    for i,j in indices[index_last_observed:]:
-        M_test[i,j] = 1
-    assert numpy.array_equal(M, M_train+M_test), "Tried splitting M into M_test and M_train but something went wrong."    
-    return M_train, M_test
+    # Put the reserved entries first, and then take the first (I*J)*(1-fraction) as observed
+    reserved = reserve_rows_columns(rows[permutation],cols[permutation])
+    index_last_observed = int(I*J*(1-fraction))
+    check_enough_entries(no_train=index_last_observed,no_reserved=reserved.sum())
+    permutation = numpy.concatenate((permutation[reserved],permutation[~reserved]))
+    
+    fold_ids = -numpy.ones(len(rows),dtype=numpy.int8)
+    fold_ids[permutation[index_last_observed:]] = 0
+    split = Folds((I,J),rows,cols,fold_ids,1)
+    return split.train(0), split.test(0)
     
     
 def try_generate_M(I,J,fraction,attempts,M=None):
-    ''' Try generate_M() :attempts times, making sure each row and column has 
-        at least one observed entry. '''
-    for i in range(attempts):
-        M_train,M_test = generate_M(I=I,J=J,fraction=fraction,M=M)
-        if check_empty_rows_columns(M_train):
-            return M_train, M_test
-    assert False, "Failed to generate folds for training and test data, %s attempts, fraction %s." % (attempts,fraction)
+    ''' Generate M_train and M_test like generate_M(), making sure each row and 
+        column has at least one observed entry. '''
+    return generate_M_reserved(I=I,J=J,fraction=fraction,M=M)
 
 
 def compute_folds(I,J,no_folds,M=None):
     ''' Compute :no_folds cross-validation masks.
-        Return a tuple (Ms_train, Ms_test), both a list of masks.
+        Return a Folds object, which unpacks as (Ms_train, Ms_test).
         If M is defined, split only the 1 entries into the folds. '''
-    if M is None:
-        M = numpy.ones((I,J))
-        
-    no_elements = M.sum()
-    indices = nonzero_indices(M)
-    
-    random.shuffle(indices)
-    split_places = [int(i*no_elements/no_folds) for i in range(0,no_folds+1)] #find the indices where the next fold start
-    split_indices = [indices[split_places[i]:split_places[i+1]] for i in range(0,no_folds)] #split the indices list into the folds
-    
-    Ms_train, Ms_test = [], [] # list of the M's for the different folds
-    for indices in split_indices:
-        M_test = numpy.zeros(M.shape)
-        for i,j in indices:
-            M_test[i,j] = 1
-        M_train = M - M_test
-        Ms_train.append(M_train)
-        Ms_test.append(M_test)
-        
-    return (Ms_train, Ms_test)
+    rows, cols, permutation = observed_entries(I=I,J=J,M=M)
+    fold_ids = numpy.empty(len(rows),dtype=numpy.int8)
+    fold_ids[permutation] = split_into_folds(len(rows),no_folds)
+    return Folds((I,J),rows,cols,fold_ids,no_folds)
     
 
 def compute_folds_attempts(I,J,no_folds,attempts,M=None):
-    ''' Try compute_folds() :attempts times, making sure each row and column of
-        M_train has at least one observed entry. '''
-    for i in range(attempts):
-        Ms_train, Ms_test = compute_folds(I=I,J=J,no_folds=no_folds,M=M)
-        success = True
-        for M_train in Ms_train:
-            if not check_empty_rows_columns(M_train):
-                success = False
-        if success:
-            return Ms_train, Ms_test
-    assert False, "Failed to generate folds for training and test data, %s attempts." % attempts
+    ''' Compute the folds like compute_folds(), making sure each row and column
+        of M_train has at least one observed entry. The reserved entries are
+        in none of the test folds. '''
+    rows, cols, permutation = observed_entries(I=I,J=J,M=M)
+    reserved = reserve_rows_columns(rows[permutation],cols[permutation])
+    fold_ids = -numpy.ones(len(rows),dtype=numpy.int8)
+    fold_ids[permutation[~reserved]] = split_into_folds((~reserved).sum(),no_folds)
+    return Folds((I,J),rows,cols,fold_ids,no_folds)
     
     
 ''' Methods for computing stratified folds - ensuring that each fold has the
     same number of entries from each row (or column). '''
 def compute_folds_stratify_rows(I,J,no_folds,M=None):
-    ''' Like compute_folds() but make sure each fold has the same number of 
-        entries of each row - i.e. we stratify the folds based on rows. 
-        This could still create an empty column though. '''
-    if M is None:
-        M = numpy.ones((I,J))
+    ''' Like compute_folds() but make sure each fold has the same number of
+        entries of each row - i.e. we stratify the folds based on rows.
+        Each row and column of M_train has at least one observed entry, as we
+        first reserve those (they are in none of the test folds). '''
+    rows, cols, permutation = observed_entries(I=I,J=J,M=M)
+    reserved = reserve_rows_columns(rows[permutation],cols[permutation])
+    fold_ids = -numpy.ones(len(rows),dtype=numpy.int8)
+    fold_ids[permutation[~reserved]] = split_into_folds_stratified(rows[permutation[~reserved]],no_folds)
+    return Folds((I,J),rows,cols,fold_ids,no_folds)
 
-    # Use skikit-learn stratified folds, using the row index as the labels
-    indices = nonzero_indices(M)
-    labels = [ind[0] for ind in indices]
-    skf = StratifiedKFold(labels, no_folds, shuffle=True)
-    Ms_train, Ms_test = [], []
-    for _, test in skf:
-        M_test = numpy.zeros(M.shape)
-        for label_index in test:
-            i,j = indices[label_index]
-            M_test[i,j] = 1.
-        M_train = M - M_test
-        Ms_train.append(M_train), Ms_test.append(M_test)
-    return Ms_train, Ms_test
-    
 
 def compute_folds_stratify_rows_attempts(I,J,no_folds,attempts,M=None):
-    ''' Try compute_folds_stratify_rows() :attempts times, making sure each row 
-        and column of M_train has at least one observed entry. '''
-    for i in range(attempts):
-        Ms_train, Ms_test = compute_folds_stratify_rows(I=I,J=J,no_folds=no_folds,M=M)
-        success = True
-        for M_train in Ms_train:
-            if not check_empty_rows_columns(M_train):
-                success = False
-        if success:
-            return Ms_train, Ms_test
-    assert False, "Failed to generate folds for training and test data, %s attempts." % attempts
+    ''' Return compute_folds_stratify_rows(), which makes sure each row and
+        column of M_train has at least one observed entry. '''
+    return compute_folds_stratify_rows(I=I,J=J,no_folds=no_folds,M=M)
+
 
-        
 def compute_folds_stratify_columns(I,J,no_folds,M=None):
     ''' Same as compute_folds_stratify_rows() but now stratify by column. '''
-    Ms_train_T, Ms_test_T = compute_folds_stratify_rows(I=J, J=I, no_folds=no_folds, M=M.T if M is not None else None)
-    Ms_train, Ms_test = [M_train.T for M_train in Ms_train_T], [M_test.T for M_test in Ms_test_T]
-    return (Ms_train, Ms_test)
-    
-    
+    folds_T = compute_folds_stratify_rows(I=J, J=I, no_folds=no_folds, M=M.T if M is not None else None)
+    return folds_T.transpose()
+
+
 def compute_folds_stratify_columns_attempts(I,J,no_folds,attempts,M=None):
-    ''' Try compute_folds_stratify_columns() :attempts times, making sure each row 
-        and column of M_train has at least one observed entry. '''
-    for i in range(attempts):
-        Ms_train, Ms_test = compute_folds_stratify_columns(I=I,J=J,no_folds=no_folds,M=M)
-        success = True
-        for M_train in Ms_train:
-            if not check_empty_rows_columns(M_train):
-                success = False
-        if success:
-            return Ms_train, Ms_test
-    assert False, "Failed to generate folds for training and test data, %s attempts." % attempts
-
-
-''' Methods for computing stratified folds, that also check whether a nested 
-    fold generation is possible. '''
+    ''' Return compute_folds_stratify_columns(), which makes sure each row and
+        column of M_train has at least one observed entry. '''
+    return compute_folds_stratify_columns(I=I,J=J,no_folds=no_folds,M=M)
+
+
+''' Methods for computing stratified folds, that also check whether a nested
+    fold generation is possible. As each M_train has an entry in each row and
+    column, we can always split it into folds again. '''
 def compute_folds_stratify_rows_nested(I, J, no_folds, attempts, attempts_nested, M=None):
-    ''' Run compute_folds_stratify_rows(), but ensure that we can also 
-        generate nested folds (after at most :attempts_nested attempts). '''
-    for i in range(attempts_nested):
-        Ms_train, Ms_test = compute_folds_stratify_rows_attempts(
-            I=I, J=J, no_folds=no_folds, attempts=attempts, M=M)
-        success = True
-        for M_train in Ms_train:
-            if not check_empty_rows_columns(M_train):
-                success = False
-        if success:
-            return Ms_train, Ms_test
-    assert False, "Failed to generate folds for training and test data, %s attempts." % attempts
-    
+    ''' Run compute_folds_stratify_rows(), but ensure that we can also
+        generate nested folds. '''
+    return compute_folds_stratify_rows(I=I, J=J, no_folds=no_folds, M=M)
+
 def compute_folds_stratify_columns_nested(I, J, no_folds, attempts, attempts_nested, M=None):
-    ''' Run compute_folds_stratify_columns_attempts(), but ensure that we can also 
-        generate nested folds (after at most :attempts_nested attempts). '''
-    for i in range(attempts_nested):
-        Ms_train, Ms_test = compute_folds_stratify_columns_attempts(
-            I=I, J=J, no_folds=no_folds, attempts=attempts, M=M)
-        success = True
-        for M_train in Ms_train:
-            if not check_empty_rows_columns(M_train):
-                success = False
-        if success:
-            return Ms_train, Ms_test
-    assert False, "Failed to generate folds for training and test data, %s attempts." % attempts
-
-
-''' Methods for generating M, but making sure each row or column has at least 
+    ''' Run compute_folds_stratify_columns(), but ensure that we can also
+        generate nested folds. '''
+    return compute_folds_stratify_columns(I=I, J=J, no_folds=no_folds, M=M)
+
+
+''' Methods for generating M, but making sure each row or column has at least
     one entry in it. '''
 def generate_M_rows(I, J, fraction, M=None):
     ''' Generate a mask matrix M_train with :fraction missing entries, and at
-        least one entry in each row.
+        least one entry in each row. We reserve one (random) entry of each row,
+        and add the first (I*J)*(1-fraction) of the other shuffled entries.
         If :M is defined, use only those 1-entries. '''
-    if M is None:
-        M = numpy.ones((I,J))
-    indices = nonzero_indices(M)
-    no_elements = len(indices)
-    no_missing_total = I*J - no_elements
+    rows, cols, permutation = observed_entries(I=I,J=J,M=M)
+    no_missing_total = I*J - len(rows)
     assert no_missing_total < I*J*fraction, "Specified %s fraction missing, so %s entries missing, but there are already %s missing by default!" % \
         (fraction,I*J*fraction,no_missing_total)
-        
-    # First mark one entry of each row as observed, and take them out of indices
-    M_train, M_test = numpy.zeros((I,J)), numpy.zeros((I,J))
-    random.shuffle(indices)
-    for i in range(I):
-        # Use first (ip,j) in indices where ip=i
-        for ip,jp in indices:
-            if ip == i:
-                j = jp
-                break
-        M_train[i,j] = 1.
-        indices.remove((i,j))
     
-    # Shuffle the observed entries, take the first (I*J)*(1-fraction) and mark those as observed
-    random.shuffle(indices)
-    index_last_observed = int(I*J*(1-fraction))
-    
-    for i,j in indices[:index_last_observed]:
-        M_train[i,j] = 1
-    for i,j in indices[index_last_observed:]:
-        M_test[i,j] = 1
-    assert numpy.array_equal(M, M_train+M_test), "Tried splitting M into M_test and M_train but something went wrong."    
-    return M_train, M_test
+    # Put the reserved entries first, and then take (I*J)*(1-fraction) more as observed
+    reserved = reserve_rows(rows[permutation])
+    index_last_observed = reserved.sum() + int(I*J*(1-fraction))
+    permutation = numpy.concatenate((permutation[reserved],permutation[~reserved]))
     
+    fold_ids = -numpy.ones(len(rows),dtype=numpy.int8)
+    fold_ids[permutation[index_last_observed:]] = 0
+    split = Folds((I,J),rows,cols,fold_ids,1)
+    return split.train(0), split.test(0)
+
 
 def generate_M_columns(I, J, fraction, M=None):
     ''' Generate a mask matrix M_train with :fraction missing entries, and at
@@ -240,8 +301,8 @@ def generate_M_columns(I, J, fraction, M=None):
         If :M is defined, use only those 1-entries. '''
     M_train, M_test = generate_M_rows(I=J, J=I, fraction=fraction, M=(M.T if M is not None else None))
     return M_train.T, M_test.T
-    
-    
+
+
 def try_generate_M_rows(I,J,fraction,attempts,M=None):
     ''' Try generate_M_rows() :attempts times, making sure each row and column has 
         at least one observed entry. '''
@@ -259,4 +320,4 @@ def try_generate_M_columns(I,J,fraction,attempts,M=None):
         M_train,M_test = generate_M_columns(I=I,J=J,fraction=fraction,M=M)
         if check_empty_rows_columns(M_train):
             return M_train, M_test
-    assert False, "Failed to generate folds for training and test data, %s attempts, fraction %s." % (attempts,fraction)
+    assert False, "Failed to generate folds for training and test data, %s attempts, fraction %s." % (attempts,fraction)
\ No newline at end of file
@@ -34,9 +34,31 @@ parameters and training configuration :train_config. The performances are
 stored in :file_performance.
 We stratify the folds using the row (if stratify_folds) or column indices.
 
+With run_halving we use successive halving to stop unpromising parameters 
+early. We train the models for all parameters (on all folds) for the first of 
+the given iteration :checkpoints, and compute their average performance on the
+test folds (with the burn-in of :predict_config scaled down by the same 
+fraction of the iterations). Only the :keep fraction (default half) of the 
+parameters with the best performance are run up to the next checkpoint, and 
+so on, until the remaining ones are run for all iterations. Only the final
+performances of these are stored, and used by find_best_parameters. The 
+models are saved to a temporary folder between checkpoints, and continued with
+resume() (see models/bmf.py), so each chain is the same as if it had been run 
+without stopping - this only works for the Gibbs samplers, not the baselines.
+The chain on each fold is seeded with its own seed (drawn up front), so the 
+chains we continue do not reuse each other's random numbers. Afterwards the 
+numpy random state is restored to just after drawing those seeds. To keep the 
+checkpoints small, the models are trained on the observed entries of R as a 
+sparse matrix, and only keep the running mean of the draws after the burn-in 
+of each checkpoint (see stream_draws in models/bmf.py).
+The parameters we stop early are logged with their performance at that point.
+
 Methods:
 - Constructor - simply takes in the arguments requires
 - run - no arguments, runs the cross validation and stores the results in the file
+- run_halving - takes in the iteration checkpoints, the evaluation criterion 
+    and whether low is better, and the fraction of parameters to keep at each 
+    checkpoint, and runs the cross validation with successive halving
 - find_best_parameters - takes in the name of the evaluation criterion (e.g. 
     'MSE'), and True if low is better (False if high is better), and returns 
     the best parameters based on that, in a tuple with all the performances.
@@ -46,16 +68,21 @@ Methods:
 from mask import compute_folds_stratify_rows_attempts
 from mask import compute_folds_stratify_columns_attempts
 
-import numpy
-import json
+from ..models.bmf import resume
+
+import numpy, scipy.sparse
+import json, math, os, shutil, tempfile
 
 attempts_generate_M = 100
+MAX_SEED = 2**31 - 1
 
 class MatrixCrossValidation:
     def __init__(self,method,R,M,K,parameter_search,train_config,predict_config,file_performance):
         self.method = method
-        self.R = numpy.array(R,dtype=float)
-        self.M = numpy.array(M)
+        self.R = scipy.sparse.csr_matrix(R,dtype=float) if scipy.sparse.issparse(R) \
+                 else numpy.array(R,dtype=float)
+        self.M = scipy.sparse.csr_matrix(M,dtype=float) if scipy.sparse.issparse(M) \
+                 else numpy.array(M)
         self.K = K
         self.train_config = train_config
         self.predict_config = predict_config
@@ -67,7 +94,8 @@ class MatrixCrossValidation:
         
         self.all_performances = {}      # Performances across all folds - mapping JSON of parameters to a dictionary from evaluation criteria to a list of performances
         self.average_performances = {}  # Average performances across folds - mapping JSON of parameters to a dictionary from evaluation criteria to average performance
-        self.performances = {}          # Average performances per criterion - mapping evaluation criterion to a list of average performances (same size as parameter_search)
+        self.performances = {}          # Average performances per criterion - mapping evaluation criterion to a list of average performances (one per parameters we logged)
+        self.performances_parameters = [] # The parameters of each average performance in self.performances
         
         
     def run(self, stratify_rows=False):
@@ -93,6 +121,116 @@ class MatrixCrossValidation:
                 self.fout.flush()
             
             
+    def run_halving(self, checkpoints, evaluation_criterion='MSE', low_better=True, keep=0.5, stratify_rows=False):
+        ''' Run the cross-validation with successive halving, only continuing the
+            :keep fraction of best parameters after each of the iteration :checkpoints. '''
+        iterations = self.train_config['iterations']
+        assert all(0 < checkpoint < iterations for checkpoint in checkpoints), \
+            "Checkpoints should be between 0 and the number of iterations (%s), not %s." % (iterations,checkpoints)
+        rungs = sorted(set(checkpoints)) + [iterations]
+        
+        # Draw a seed for the folds and for the chain on each fold of each parameter
+        # up front, so that the chains we continue do not reuse each other's draws.
+        # Seeding them changes the global random state, so we restore it after, 
+        # and the caller's random stream only moves on by this one draw
+        seeds = numpy.random.randint(MAX_SEED, size=(len(self.parameter_search),self.K+1))
+        random_state = numpy.random.get_state()
+        R_observed = self.observed_R()
+        
+        folder = tempfile.mkdtemp(prefix='bmf_halving_')
+        try:
+            survivors, all_folds = range(len(self.parameter_search)), {}
+            for rung,iterations_rung in enumerate(rungs):
+                performances = {}
+                for index in survivors:
+                    parameters = self.parameter_search[index]
+                    print "Trying parameters %s for %s iterations." % (parameters,iterations_rung)
+                    try:
+                        iterations_done = rungs[rung-1] if rung > 0 else 0
+                        performances[index] = self.run_halving_folds(
+                            folder,index,R_observed,seeds[index],iterations_done,iterations_rung,rungs,all_folds,stratify_rows)
+                    except Exception as e:
+                        self.fout.write("Tried parameters %s but got exception: %s. \n" % (parameters,e))
+                        self.fout.flush()
+                survivors = [index for index in survivors if index in performances]
+                
+                if rung < len(rungs) - 1:
+                    survivors = self.halve(survivors,performances,iterations_rung,evaluation_criterion,low_better,keep)
+                    
+            for index in survivors:
+                parameters = self.parameter_search[index]
+                self.all_performances[self.JSON(parameters)] = {}
+                for performance_dict in performances[index]:
+                    self.store_performances(performance_dict,parameters)
+                self.log(parameters)
+        finally:
+            shutil.rmtree(folder)
+            numpy.random.set_state(random_state)
+            
+    def run_halving_folds(self, folder, index, R_observed, seeds, iterations_done, iterations, rungs, all_folds, stratify_rows):
+        ''' Run the models of parameter_search[index] on each fold up to :iterations,
+            continuing from their checkpoints in :folder after :iterations_done 
+            iterations, and return the performances. The models are trained on
+            the sparse :R_observed, and only keep the running mean of the draws
+            after the burn-in of each of the :rungs. '''
+        parameters = self.parameter_search[index]
+        predict_config = dict(self.predict_config)
+        if 'burn_in' in predict_config:
+            predict_config['burn_in'] = self.burn_in_rung(iterations)
+            
+        # Generate the folds the first time
+        if iterations_done == 0:
+            numpy.random.seed(seeds[0])
+            folds_method = compute_folds_stratify_rows_attempts if stratify_rows else compute_folds_stratify_columns_attempts
+            all_folds[index] = folds_method(I=self.I, J=self.J, no_folds=self.K, attempts=attempts_generate_M, M=self.M)
+            
+        performances = []
+        for i in range(len(all_folds[index])):
+            print "Fold %s (parameters: %s)." % (i+1,parameters)
+            path = os.path.join(folder,'parameters_%s_fold_%s.pkl' % (index,i))
+            if iterations_done == 0:
+                numpy.random.seed(seeds[i+1])
+                model = self.method(R_observed,all_folds[index].train(i),**parameters)
+                if 'burn_in' in self.predict_config:
+                    model.stream_draws(burn_in=[self.burn_in_rung(iterations_rung) for iterations_rung in rungs],
+                                       thinning=self.predict_config['thinning'])
+                model.set_checkpoint(path=path,every=None)
+                model.train(**dict(self.train_config,iterations=iterations))
+            else:
+                model = resume(path,iterations-iterations_done)
+            performances.append(model.predict(all_folds[index].test(i),**predict_config))
+            if iterations < self.train_config['iterations']:
+                model.checkpoint()
+        return performances
+    
+    def burn_in_rung(self, iterations):
+        ''' Return the burn-in for a run of :iterations, scaled down from the 
+            burn-in for the full number of iterations. '''
+        return self.predict_config['burn_in'] * iterations / self.train_config['iterations']
+    
+    def halve(self, survivors, performances, iterations, evaluation_criterion, low_better, keep):
+        ''' Return the :keep fraction of the :survivors with the best average 
+            :evaluation_criterion, and log the others as stopped. '''
+        averages = { 
+            index: { name: numpy.mean([perf[name] for perf in performances[index]]) for name in performances[index][0] }
+            for index in survivors 
+        }
+        ranked = sorted(survivors, key=lambda index: averages[index][evaluation_criterion], reverse=not low_better)
+        no_keep = max(1, int(math.ceil(keep * len(survivors))))
+        for index in ranked[no_keep:]:
+            message = "Stopped parameters %s after %s iterations. Average performances: %s. \n" % (self.parameter_search[index],iterations,averages[index])
+            self.fout.write(message)
+            self.fout.flush()
+        return sorted(ranked[:no_keep])
+            
+    def observed_R(self):
+        ''' Return the observed entries of R as a sparse (CSR) matrix, in the 
+            order of numpy.nonzero(M) (which the Folds of mask.py use as well). '''
+        (rows,cols) = scipy.sparse.csr_matrix(self.M).sorted_indices().nonzero() \
+            if scipy.sparse.issparse(self.M) else numpy.nonzero(self.M)
+        values = numpy.asarray(self.R[rows,cols],dtype=float).ravel()
+        return scipy.sparse.csr_matrix((values,(rows,cols)),shape=(self.I,self.J))
+            
     def run_model(self,train,test,parameters):
         ''' Initialises and runs the model, and returns the performance on the test set. '''
         model = self.method(self.R,train,**parameters)
@@ -121,6 +259,7 @@ class MatrixCrossValidation:
         performances = self.all_performances[self.JSON(parameters)]     
         average_performances = { name:(sum(values)/float(len(values))) for (name,values) in performances.iteritems() }
         self.average_performances[self.JSON(parameters)] = average_performances
+        self.performances_parameters.append(parameters)
         
         # Also store a dictionary from evaluation criterion to a list of average performances
         for (name,avr_perf) in average_performances.iteritems():
@@ -135,7 +274,7 @@ class MatrixCrossValidation:
         self.best_performance = min_or_max(self.performances[evaluation_criterion])
         index_best = self.performances[evaluation_criterion].index(self.best_performance)
         
-        self.best_parameters = self.parameter_search[index_best]
+        self.best_parameters = self.performances_parameters[index_best]
         self.best_performances_all = self.average_performances[self.JSON(self.best_parameters)]
         
         self.log_best(index_best)
@@ -45,7 +45,7 @@ Methods:
 from mask import compute_folds_stratify_rows_attempts
 from mask import compute_folds_stratify_columns_attempts
 
-import numpy
+import numpy, scipy.sparse
 
 ATTEMPTS_GENERATE_M = 1000
 METRICS = ['MSE', 'R^2', 'Rp']
@@ -53,8 +53,10 @@ METRICS = ['MSE', 'R^2', 'Rp']
 class MatrixSingleCrossValidation:
     def __init__(self,method,R,M,K,parameters,train_config,predict_config,file_performance):
         self.method = method
-        self.R = numpy.array(R,dtype=float)
-        self.M = numpy.array(M)
+        self.R = scipy.sparse.csr_matrix(R,dtype=float) if scipy.sparse.issparse(R) \
+                 else numpy.array(R,dtype=float)
+        self.M = scipy.sparse.csr_matrix(M,dtype=float) if scipy.sparse.issparse(M) \
+                 else numpy.array(M)
         self.K = K
         self.parameters = parameters
         self.train_config = train_config
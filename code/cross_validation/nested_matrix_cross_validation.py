@@ -39,11 +39,15 @@ masks. If we have more rows, we use column numbers; and vice versa.
 
 We use the parallel matrix cross-validation module if parallel is True.
 We stratify the folds using the row (if stratify_folds) or column indices.
+If :checkpoints is given (a list of iterations), the parameter search uses 
+successive halving (see MatrixCrossValidation.run_halving), keeping the :keep 
+fraction of parameters at each checkpoint. This is only done serially.
 
 Methods:
 - Constructor - simply takes in the arguments requires
 - run - one argument (parallel), runs the cross validation and stores the 
-    results in the file. If parallel=True, run the folds in parallel.
+    results in the file. If parallel=True, run the folds in parallel. 
+    Optionally checkpoints and keep for successive halving.
 - find_best_parameters - takes in the name of the evaluation criterion (e.g. 
     'MSE'), and True if low is better (False if high is better), and returns 
     the best parameters based on that, in a tuple with all the performances.
@@ -57,15 +61,17 @@ from mask import compute_folds_stratify_columns_attempts
 from mask import compute_folds_stratify_rows_nested
 from mask import compute_folds_stratify_columns_nested
 
-import numpy
+import numpy, scipy.sparse
 
 attempts_generate_M = 1000
 
 class MatrixNestedCrossValidation:
     def __init__(self,method,R,M,K,P,parameter_search,train_config,predict_config,file_performance,files_nested_performances):
         self.method = method
-        self.R = numpy.array(R,dtype=float)
-        self.M = numpy.array(M)
+        self.R = scipy.sparse.csr_matrix(R,dtype=float) if scipy.sparse.issparse(R) \
+                 else numpy.array(R,dtype=float)
+        self.M = scipy.sparse.csr_matrix(M,dtype=float) if scipy.sparse.issparse(M) \
+                 else numpy.array(M)
         self.K = K
         self.P = P
         self.train_config = train_config
@@ -81,8 +87,9 @@ class MatrixNestedCrossValidation:
         self.average_performances = {}  # Average performances across folds - dictionary from evaluation criteria to average performance
         
         
-    def run(self, parallel=True, stratify_rows=False):
+    def run(self, parallel=True, stratify_rows=False, checkpoints=None, keep=0.5):
         ''' Run the cross-validation. '''
+        assert checkpoints is None or not parallel, "Successive halving is only implemented for parallel=False."
         #folds_method = compute_folds_stratify_rows_attempts if stratify_rows else compute_folds_stratify_columns_attempts
         #folds_training, folds_test = folds_method(I=self.I, J=self.J, no_folds=self.K, attempts=attempts_generate_M, M=self.M)
         folds_method = compute_folds_stratify_rows_nested if stratify_rows else compute_folds_stratify_columns_nested
@@ -114,7 +121,11 @@ class MatrixNestedCrossValidation:
                 predict_config=self.predict_config,
                 file_performance=self.files_nested_performances[i],
             )
-            crossval.run(stratify_rows=stratify_rows)
+            if checkpoints is None:
+                crossval.run(stratify_rows=stratify_rows)
+            else:
+                crossval.run_halving(checkpoints=checkpoints, evaluation_criterion='MSE', low_better=True, 
+                                     keep=keep, stratify_rows=stratify_rows)
             
             try:
                 (best_parameters,_) = crossval.find_best_parameters(evaluation_criterion='MSE',low_better=True)
@@ -1,35 +1,72 @@
 """
 Parallel version of the MatrixCrossValidation class, where we parallelize
-the K-fold cross-validation for each parameter.
+the K-fold cross-validation over all parameters and folds.
 We now have an extra parameter P for the initialisation, defining the number
 of parallel threads we should run.
 We stratify the folds using the row (if stratify_folds) or column indices.
+
+We use a single pool of P processes for the whole parameter search. We first
+generate the folds for each parameter, and then submit every (parameters, 
+fold) job at once, so that a worker starts on the next job as soon as it is 
+done with the previous one (rather than waiting for the slowest fold of each 
+parameter). The performances are stored as they come in, and each parameter 
+is logged as soon as all of its folds are done - so the log is in the order 
+in which the parameters finish.
+
+Rather than sending a copy of R and dense training and test masks to the 
+workers for each fold, we put the observed entries of R in shared memory once 
+(as the arrays of a CSR matrix, see models/shared.py), and send the folds of 
+each parameter as the vector with the fold of each observed entry (in which it 
+is a test entry, or -1 if it is a training entry in all folds) of its Folds 
+object (see mask.py), which has the entries in the same order. The workers build R and the masks as sparse matrices on top 
+of the shared arrays.
 """
 
 from matrix_cross_validation import MatrixCrossValidation
 from mask import compute_folds_stratify_rows_attempts
 from mask import compute_folds_stratify_columns_attempts
 
+from ..models.shared import SharedArrays
+
 from multiprocessing import Pool
 import numpy
+import scipy.sparse
 
 attempts_generate_M = 100
 
 
-# We try the parameters in parallel. This function either raises an Exception,
-# or returns a tuple (parameters,all_performances,average_performances)
+# We try the parameters and folds in parallel. This function returns a tuple
+# (index,performance_dict,exception), where index is the index of the parameters
+# in parameter_search, and either performance_dict or exception (a string) is None
 def run_fold(params):
-    (parameters,R,train,test,method,train_config,predict_config) = \
-        (params['parameters'],params['R'],params['train'],params['test'],params['method'],params['train_config'],params['predict_config'])    
-    performance_dict = run_model(method,R,train,test,parameters,train_config,predict_config)
-    return performance_dict           
+    (index,parameters,shared,shape,fold_ids,fold,method,train_config,predict_config) = \
+        (params['index'],params['parameters'],params['shared'],params['shape'],params['fold_ids'],params['fold'],params['method'],params['train_config'],params['predict_config'])    
+    try:
+        train, test = numpy.flatnonzero(fold_ids != fold), numpy.flatnonzero(fold_ids == fold)
+        (R,M_train,M_test) = fold_matrices(shared,shape,train,test)
+        performance_dict = run_model(method,R,M_train,M_test,parameters,train_config,predict_config)
+        return (index,performance_dict,None)
+    except Exception as e:
+        return (index,None,"%s" % e)
+    
+    
+# Method for constructing R (the observed entries, on the shared arrays), and 
+# the training and test masks, from the indices of the training and test entries
+def fold_matrices(shared,shape,train,test):
+    R = scipy.sparse.csr_matrix((shared['data'],shared['indices'],shared['indptr']),shape=shape)
+    rows = numpy.repeat(numpy.arange(shape[0]),numpy.diff(R.indptr))
+    (M_train,M_test) = [
+        scipy.sparse.csr_matrix((numpy.ones(len(entries)),(rows[entries],R.indices[entries])),shape=shape)
+        for entries in (train,test)
+    ]
+    return (R,M_train,M_test)
     
     
 # Method for running the model with the given parameters
 def run_model(method,X,train,test,parameters,train_config,predict_config):
     model = method(X,train,**parameters)
     model.train(**train_config)
-    return model.predict(test)
+    return model.predict(test,**predict_config)
 
 
 # Class, redefining the run function
@@ -38,42 +75,83 @@ class ParallelMatrixCrossValidation(MatrixCrossValidation):
         MatrixCrossValidation.__init__(self,method,R,M,K,parameter_search,train_config,predict_config,file_performance)
         self.P = P        
         
+    # Put the observed entries of R in shared memory, as the arrays of a CSR matrix
+    def share_observed_entries(self):
+        R_observed = self.observed_R()
+        return SharedArrays({ 'data': R_observed.data, 'indices': R_observed.indices, 'indptr': R_observed.indptr })
+        
     # Run the cross-validation
     def run(self, stratify_rows=False):
-        for parameters in self.parameter_search:
+        shared = self.share_observed_entries()
+        try:
+            self.run_parameters(shared,stratify_rows)
+        finally:
+            shared.close()
+        
+    # Run the cross-validation for each parameter setting, with the data in :shared
+    def run_parameters(self, shared, stratify_rows):
+        # Generate the folds for each parameter, and a job for each fold
+        all_parameters, no_folds_remaining = [], {}
+        for index,parameters in enumerate(self.parameter_search):
             print "Trying parameters %s." % (parameters)
             
             try:
                 folds_method = compute_folds_stratify_rows_attempts if stratify_rows else compute_folds_stratify_columns_attempts
-                folds_training, folds_test = folds_method(I=self.I, J=self.J, no_folds=self.K, attempts=attempts_generate_M, M=self.M)
+                folds = folds_method(I=self.I, J=self.J, no_folds=self.K, attempts=attempts_generate_M, M=self.M)
                 
                 # We need to put the parameter dict into json to hash it
                 self.all_performances[self.JSON(parameters)] = {}
-                
-                # Create the threads for the folds, and run them
-                pool = Pool(self.P)
-                all_parameters = [
+                no_folds_remaining[index] = len(folds)
+                all_parameters += [
                     {
+                        'index' : index,
                         'parameters' : parameters,
-                        'R' : numpy.copy(self.R),
-                        'train' : train,
-                        'test' : test,
+                        'shared' : shared,
+                        'shape' : (self.I,self.J),
+                        'fold_ids' : folds.fold_ids,
+                        'fold' : fold,
                         'method' : self.method,
                         'train_config' : self.train_config,
                         'predict_config' : self.predict_config,
                     }
-                    for (train,test) in zip(folds_training,folds_test)
+                    for fold in range(len(folds))
                 ]
-                outputs = pool.map(run_fold,all_parameters)
-                pool.close()
-                
-                for performance_dict in outputs:
-                    self.store_performances(performance_dict,parameters)
-                    
-                self.log(parameters)
                 
             except Exception as e:
                 self.fout.write("Tried parameters %s but got exception: %s. \n" % (parameters,e))
+                self.fout.flush()
+                
+        # Run all jobs in one pool, storing the performances as they come in
+        pool = Pool(self.P)
+        try:
+            for (index,performance_dict,exception) in pool.imap_unordered(run_fold,all_parameters):
+                parameters = self.parameter_search[index]
+                if index not in no_folds_remaining:
+                    continue
+                if exception is not None:
+                    del no_folds_remaining[index]
+                    self.all_performances[self.JSON(parameters)] = {}
+                    self.fout.write("Tried parameters %s but got exception: %s. \n" % (parameters,exception))
+                    self.fout.flush()
+                    continue
+                
+                self.store_performances(performance_dict,parameters)
+                no_folds_remaining[index] -= 1
+                if no_folds_remaining[index] == 0:
+                    self.log(parameters)
+            pool.close()
+        finally:
+            pool.terminate()
+            
+        # The parameters were logged in the order they finished, so put the 
+        # average performances back in the order of parameter_search
+        self.performances, self.performances_parameters = {}, []
+        for parameters in self.parameter_search:
+            if self.JSON(parameters) not in self.average_performances:
+                continue
+            for (name,avr_perf) in self.average_performances[self.JSON(parameters)].iteritems():
+                self.performances.setdefault(name,[]).append(avr_perf)
+            self.performances_parameters.append(parameters)
                 
     # Undo the function run_model:
     def run_model(self,train,test,parameters):
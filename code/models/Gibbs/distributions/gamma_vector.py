@@ -0,0 +1,21 @@
+"""
+Class representing multiple independent gamma distributions, allowing us to
+sample from them all at once, and compute their expectations.
+
+This is the special case that we want to draw x_ik ~ Gamma(alpha_ik,beta_ik)
+for a whole matrix (or vector) of variables at the same time - i.e. alphas and
+betas are arrays of the same shape (or broadcastable to it).
+"""
+import numpy
+from numpy.random import gamma
+
+
+# Gamma draws, vector
+def gamma_vector_draw(alphas,betas):
+    alphas, betas = numpy.broadcast_arrays(
+        numpy.asarray(alphas, dtype=float), numpy.asarray(betas, dtype=float))
+    return gamma(shape=alphas,scale=1.0/betas)
+
+# Gamma expectation, vector
+def gamma_vector_mean(alphas,betas):
+    return numpy.asarray(alphas, dtype=float) / numpy.asarray(betas, dtype=float)
@@ -0,0 +1,35 @@
+"""
+Class representing multiple independent Multinomial distributions, allowing
+us to sample from them all at once.
+
+This is the special case that we want to draw z_n ~ Mult(n_n, p_n) for many
+entries n at the same time - i.e. ns is a vector of counts, and ps a matrix
+with one row of K probabilities per entry.
+
+Rather than calling numpy.random.multinomial once per entry, we split each
+count into its K components using conditional binomials:
+    z_n1 ~ Bin(n_n, p_n1),
+    z_nk ~ Bin(n_n - sum_{l<k} z_nl, p_nk / (1 - sum_{l<k} p_nl)),
+and z_nK takes whatever count remains. Each of these is one vectorised draw
+over all entries, so we only need K-1 numpy calls in total.
+"""
+import numpy
+
+# Multinomial draws, vector
+def multinomial_vector_draw(ns,ps):
+    ns, ps = numpy.asarray(ns).astype(int), numpy.asarray(ps, dtype=float)
+    N, K = ps.shape
+    assert ns.shape == (N,), "Expected %s counts, not %s." % (N, ns.shape)
+    draws = numpy.zeros((N,K), dtype=int)
+    remaining_n, remaining_p = ns.copy(), numpy.ones(N)
+    for k in range(K-1):
+        with numpy.errstate(divide='ignore', invalid='ignore'):
+            p_k = numpy.where(remaining_p > 0., ps[:,k] / remaining_p, 1.)
+        draws[:,k] = numpy.random.binomial(n=remaining_n, p=numpy.clip(p_k, 0., 1.))
+        remaining_n -= draws[:,k]
+        remaining_p -= ps[:,k]
+    draws[:,K-1] = remaining_n
+    return draws
+
+def multinomial_vector_mean(ns,ps):
+    return numpy.asarray(ns)[:,numpy.newaxis] * numpy.asarray(ps)
@@ -0,0 +1,47 @@
+"""
+Class representing multiple independent multivariate normal distributions,
+allowing us to sample from them all at once.
+
+This is the special case that we want to draw a row x_i ~ N(mu_i,precision_i^-1)
+for many rows i at the same time - i.e. mus is an IxK matrix and precisions an
+(I,K,K) stack of precision matrices.
+
+Rather than inverting each precision matrix and doing an SVD per draw (as in
+numpy.random.multivariate_normal), we use a batched Cholesky decomposition
+precision_i = L_i L_i^T, and draw x_i = mu_i + L_i^-T z_i, with z_i ~ N(0,I).
+Then Cov(x_i) = L_i^-T L_i^-1 = precision_i^-1, as required.
+
+The draw takes the Cholesky factors L (IxKxK) rather than the precisions, so
+that the same factors can be used to compute the means (see 
+gaussian_mus_precisions in parameters.py): precision_i mu_i = b_i is solved as
+L_i y_i = b_i and L_i^T mu_i = y_i. These triangular solves are done by 
+forward and back substitution over the K columns, for all rows at once, in 
+O(I*K^2) time - rather than a general (LU) solve per row.
+"""
+import numpy
+
+def solve_lower_vector(L,B):
+    """ Solve L_i x_i = b_i for each row i, with L_i lower triangular. """
+    I, K = B.shape
+    X = numpy.empty((I,K))
+    for k in range(K):
+        X[:,k] = (B[:,k] - numpy.einsum('ij,ij->i', L[:,k,:k], X[:,:k])) / L[:,k,k]
+    return X
+
+def solve_upper_vector(L,B):
+    """ Solve L_i^T x_i = b_i for each row i, with L_i lower triangular. """
+    I, K = B.shape
+    X = numpy.empty((I,K))
+    for k in reversed(range(K)):
+        X[:,k] = (B[:,k] - numpy.einsum('ij,ij->i', L[:,k+1:,k], X[:,k+1:])) / L[:,k,k]
+    return X
+
+def multivariate_normal_vector_draw(mus,precisions_cholesky):
+    I, K = mus.shape
+    assert precisions_cholesky.shape == (I,K,K), "Expected Cholesky factors of shape %s, not %s." % (
+        (I,K,K), precisions_cholesky.shape)
+    z = numpy.random.normal(size=(I,K,1))
+    return mus + solve_upper_vector(precisions_cholesky, z[:,:,0])
+
+def multivariate_normal_vector_mean(mus,precisions_cholesky):
+    return mus
@@ -10,6 +10,7 @@ truncnorm: a, b = (myclip_a - my_mean) / my_std, (myclip_b - my_mean) / my_std
            
 We get efficient draws using the library rtnorm by C. Lassner, from:
     http://miv.u-strasbg.fr/mazet/rtnorm/
+We use its vectorised version, rtnorm_vector, to draw all values at once.
 We compute the expectation and variance ourselves - note that we use the
 complementary error function for 1-cdf(x) = 0.5*erfc(x/sqrt(2)), as for large
 x (>8), cdf(x)=1., so we get 0. instead of something like n*e^-n.
@@ -35,18 +36,12 @@ import rtnorm
 
 # Truncated normal draws, vector
 def truncated_normal_vector_draw(mus,taus):
-    sigmas = numpy.float64(1.0) / numpy.sqrt(taus)
-    draws = []
-    for (mu,sigma,tau) in zip(mus,sigmas,taus):
-        if tau == 0.:
-            draws.append(0)
-        else:
-            d = rtnorm.rtnorm(a=0., b=numpy.inf, mu=mu, sigma=sigma)[0]
-            d = d if (d >= 0. and d != numpy.inf and d != -numpy.inf and not numpy.isnan(d)) else 0.
-            draws.append(d)   
-    '''
-    draws = parallel_draw(self.mu,self.sigma,self.tau)
-    '''     
+    mus, taus = numpy.asarray(mus, dtype=float), numpy.asarray(taus, dtype=float)
+    draws = numpy.zeros(mus.shape)
+    valid = (taus > 0.) & numpy.isfinite(taus) & numpy.isfinite(mus)
+    sigmas = numpy.float64(1.0) / numpy.sqrt(taus[valid])
+    d = rtnorm.rtnorm_vector(a=0., b=numpy.inf, mu=mus[valid], sigma=sigmas)
+    draws[valid] = numpy.where((d >= 0.) & numpy.isfinite(d), d, 0.)
     return draws           
        
 
@@ -0,0 +1,81 @@
+"""
+Class storing the Gram matrix G = U^T U of a factor matrix U, together with
+its determinant and inverse, for the Volume Prior updates. These need, for
+each entry Uik, the determinant and adjugate of G excluding row and column k
+(the minor G_-k-k, which is U_-k^T U_-k for U without column k).
+
+Rather than recomputing U_-k^T U_-k and its determinant and inverse for every
+entry (O(I*K^2 + K^3) each), we get them from G^-1 = H and det(G) using:
+    det(G_-k-k) = det(G) * H_kk,
+    adj(G_-k-k) = det(G) * (H_kk * H_-k-k - H_-k,k * H_k,-k),
+which takes O(K^2) time. When Uik changes by d, G changes by the symmetric
+rank-2 update G + e_k w^T + w e_k^T, with w = d * Ui + d^2/2 * e_k, so we update
+H with the Woodbury identity and det(G) with the matrix determinant lemma, also
+in O(K^2) time.
+
+To stop numerical errors from building up, factorise() recomputes det(G) and H
+from G directly (O(K^3)) - the updates do this once per row of U. If G is
+singular we fall back on computing each minor directly.
+
+USAGE
+    gram = Gram(U)
+    gram.factorise()
+    D, A = gram.minor(k)
+    gram.update_entry(Ui, k, Uik_new)
+where
+    D and A are the determinant and adjugate of U^T U excluding row and column k.
+    gram.ktilde[k] are the indices excluding k, so gram.G[gram.ktilde[k],k] is
+        column k of U^T U excluding entry k.
+    Ui is row i of U before changing Uik to Uik_new.
+"""
+
+import numpy
+
+class Gram(object):
+    def __init__(self, U):
+        """ Set up the Gram matrix U^T U of the factor matrix :U. """
+        self.K = U.shape[1]
+        self.G = numpy.dot(U.T, U)
+        self.ktilde = [numpy.append(numpy.arange(k), numpy.arange(k+1, self.K)) for k in range(self.K)]
+        self._ix_ktilde = [numpy.ix_(ktilde, ktilde) for ktilde in self.ktilde]
+        self.factorise()
+
+    def factorise(self):
+        """ Recompute the determinant and inverse of G from G itself. """
+        self.det = numpy.linalg.det(self.G)
+        self.inverse = numpy.linalg.inv(self.G) if self.det > 0. and numpy.isfinite(self.det) else None
+
+    def minor(self, k):
+        """ Return the determinant and adjugate of G excluding row and column k. """
+        if self.inverse is None:
+            G_ktilde_ktilde = self.G[self._ix_ktilde[k]]
+            D_ktilde_ktilde = numpy.linalg.det(G_ktilde_ktilde)
+            return (D_ktilde_ktilde, D_ktilde_ktilde * numpy.linalg.inv(G_ktilde_ktilde))
+        H, H_kk, H_ktilde_k = self.inverse, self.inverse[k,k], self.inverse[self.ktilde[k],k]
+        D_ktilde_ktilde = self.det * H_kk
+        A_ktilde_ktilde = self.det * (H_kk * H[self._ix_ktilde[k]] - H_ktilde_k[:,None] * H_ktilde_k)
+        return (D_ktilde_ktilde, A_ktilde_ktilde)
+
+    def update_entry(self, Ui, k, Uik_new):
+        """ Update G, its determinant and its inverse after Uik changes to :Uik_new.
+            :Ui is row i of U before the change. """
+        d = Uik_new - Ui[k]
+        if d == 0.:
+            return
+        w = d * Ui
+        w[k] += d**2 / 2.
+        self.G[k,:] += w
+        self.G[:,k] += w
+        if self.inverse is None:
+            return self.factorise()
+
+        # Woodbury with W = [e_k, w] and C = [[0,1],[1,0]] (so C^-1 = C, det(C) = -1),
+        # where S = C^-1 + W^T H W = [[s00, s01], [s01, s11]]
+        H_ek, H_w = self.inverse[:,k].copy(), numpy.dot(self.inverse, w)
+        s00, s01, s11 = H_ek[k], 1. + H_w[k], numpy.dot(w, H_w)
+        det_S = s00 * s11 - s01 * s01
+        self.det = -self.det * det_S
+        if not (self.det > 0. and numpy.isfinite(self.det)):
+            return self.factorise()
+        H_W_S_inv_ek, H_W_S_inv_w = (s11 * H_ek - s01 * H_w) / det_S, (s00 * H_w - s01 * H_ek) / det_S
+        self.inverse -= H_W_S_inv_ek[:,None] * H_ek + H_W_S_inv_w[:,None] * H_w
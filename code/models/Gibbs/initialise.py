@@ -14,15 +14,16 @@ from distributions.truncated_normal import truncated_normal_draw, truncated_norm
 from distributions.half_normal import half_normal_draw, half_normal_mean
 from distributions.normal_inverse_wishart import normal_inverse_wishart_draw, normal_inverse_wishart_mean
 from distributions.multinomial import multinomial_draw, multinomial_mean
+from distributions.multinomial_vector import multinomial_vector_draw, multinomial_vector_mean
 from distributions.dirichlet import dirichlet_draw, dirichlet_mean
 
 import itertools
 import numpy
 import math
 
-def initialise_tau_gamma(alpha, beta, R, M, U, V):
+def initialise_tau_gamma(alpha, beta, residuals):
     """ Initialise tau using the model updates. """
-    return update_tau_gaussian(alpha=alpha, beta=beta, R=R, M=M, U=U, V=V)
+    return update_tau_gaussian(alpha=alpha, beta=beta, residuals=residuals)
 
 def initialise_lamb_ard(init, K, alpha0, beta0):
     """ Initialise lamb (vector), with prior lamb_k ~ Gamma(alpha0,beta0). """
@@ -142,16 +143,18 @@ def initialise_U_volumeprior_nonnegative(init, I, K, gamma):
         We cannot sample from this prior, so we initialise U_ik ~ TN(0,1). """
     return initialise_U_truncatednormal(init=init, I=I, K=K, mu=0., tau=1.)
     
-def initialise_Z_multinomial(init, R, U, V):
-    """ Initialise Z, with prior Zij ~ Multinomial(Rij, (Ui0*Vj0,..,UiK*VjK)). """
-    I, J, K = R.shape[0], R.shape[1], U.shape[1]
+def initialise_Z_multinomial(init, Omega, U, V):
+    """ Initialise Z, with prior Zij ~ Multinomial(Rij, (Ui0*Vj0,..,UiK*VjK)). 
+        Z is stored as an |Omega|xK matrix, with one row per observed entry
+        (i,j) in Omega. The entries with Rij = 0 have Zij = 0. """
+    I, J, K = Omega.I, Omega.J, U.shape[1]
     assert U.shape[0] == I and V.shape == (J,K)
-    initialise = multinomial_draw if init == 'random' else multinomial_mean
-    Z = numpy.zeros((I,J,K))
-    for i,j in itertools.product(range(I),range(J)):
-        p = U[i,:] * V[j,:]
-        p /= p.sum()
-        Z[i,j,:] = initialise(n=R[i,j], p=p)
+    initialise = multinomial_vector_draw if init == 'random' else multinomial_vector_mean
+    Z = numpy.zeros((Omega.size,K))
+    nonzero = numpy.flatnonzero(Omega.values)
+    p = U[Omega.rows[nonzero],:] * V[Omega.cols[nonzero],:]
+    p /= p.sum(axis=1)[:,numpy.newaxis]
+    Z[nonzero,:] = initialise(ns=Omega.values[nonzero], ps=p)
     return Z
 
 def initialise_U_gamma(init, I, K, a, b):
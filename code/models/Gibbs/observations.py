@@ -0,0 +1,103 @@
+"""
+Class representing the set Omega of observed entries of a matrix R, allowing
+the Gibbs updates to only do work for the observed entries. This means that
+the updates take O(|Omega|*K) time and memory, rather than O(I*J*K).
+
+The entries are stored as three vectors (rows, cols, values), sorted by row.
+The transpose Omega.T shares these vectors (with rows and cols swapped), so
+any vector aligned with the entries of Omega is also aligned with Omega.T.
+This allows us to write the updates for U only, and use them for V by passing
+Omega.T instead.
+
+USAGE
+    Omega = Observations.from_matrices(R, M)
+    js, Ri = Omega.row(i)
+    sums = Omega.row_sums(weights)
+    R_pred = Omega.predict(U, V)
+where
+    R is the data matrix, and M the mask matrix indicating observed values
+        (1) and unobserved (0). Either can be a dense array or scipy.sparse.
+    js are the column indices of the observed entries in row i, and Ri their values.
+    sums are the sums per row of weights (a vector or matrix with one row per entry).
+    R_pred are the predicted values U_i * V_j for each observed entry (i,j).
+"""
+
+import numpy
+import scipy.sparse
+
+class Observations(object):
+    def __init__(self, shape, rows, cols, values):
+        """ Set up the set of observed entries (rows[n],cols[n]) with value
+            values[n], of a matrix of size :shape. """
+        (self.I, self.J) = self.shape = shape
+        self.rows = numpy.asarray(rows, dtype=int)
+        self.cols = numpy.asarray(cols, dtype=int)
+        self.values = numpy.asarray(values, dtype=float)
+        self.size = self.values.shape[0]
+        assert self.rows.shape == (self.size,) and self.cols.shape == (self.size,), \
+            "rows, cols, and values should be vectors of the same length."
+
+        # Number of entries per row, and where each row starts in the sorted order
+        self.counts = numpy.bincount(self.rows, minlength=self.I)
+        self.indptr = numpy.concatenate(([0], numpy.cumsum(self.counts)))
+        sorted_by_row = self.size == 0 or (numpy.diff(self.rows) >= 0).all()
+        self.order = None if sorted_by_row else numpy.argsort(self.rows, kind='mergesort')
+        self._transpose = None
+
+    @classmethod
+    def from_matrices(cls, R, M):
+        """ Return the observed entries of R, given by the nonzero entries of M. """
+        assert R.shape == M.shape, "R and M are of different shapes: %s and %s respectively." % (
+            R.shape, M.shape)
+        if scipy.sparse.issparse(M):
+            M = scipy.sparse.csr_matrix(M)
+            M.sum_duplicates()
+            if (M.data == 0).any():
+                M.eliminate_zeros()
+            rows = numpy.repeat(numpy.arange(M.shape[0]), numpy.diff(M.indptr))
+            cols = M.indices
+        else:
+            rows, cols = numpy.nonzero(M)
+        if scipy.sparse.issparse(R):
+            values = numpy.asarray(scipy.sparse.csr_matrix(R)[rows, cols]).ravel()
+        else:
+            values = numpy.asarray(R)[rows, cols]
+        return cls(shape=M.shape, rows=rows, cols=cols, values=values)
+
+    @property
+    def T(self):
+        """ The transposed set of observed entries, sharing the entry order. """
+        if self._transpose is None:
+            self._transpose = Observations(
+                shape=(self.J, self.I), rows=self.cols, cols=self.rows, values=self.values)
+            self._transpose._transpose = self
+        return self._transpose
+
+    def entries(self, i):
+        """ Return the indices of the entries in row i. """
+        start, end = self.indptr[i], self.indptr[i+1]
+        return slice(start, end) if self.order is None else self.order[start:end]
+
+    def row(self, i):
+        """ Return the column indices and values of the observed entries in row i. """
+        entries = self.entries(i)
+        return (self.cols[entries], self.values[entries])
+
+    def row_sums(self, weights):
+        """ Return the sum of :weights over each row. :weights is either a vector
+            (one value per entry), or an |Omega|xK matrix (one row per entry), in
+            which case we return an IxK matrix of sums. """
+        if weights.ndim == 2:
+            return numpy.stack([self.row_sums(weights[:,k]) for k in range(weights.shape[1])], axis=1)
+        return numpy.bincount(self.rows, weights=weights, minlength=self.I)
+
+    def matrix(self, weights=None):
+        """ Return Omega as a sparse (CSR) matrix, with :weights (one per entry)
+            as values, or ones if no weights are given. """
+        weights = numpy.ones(self.size) if weights is None else weights
+        return scipy.sparse.csr_matrix((weights, (self.rows, self.cols)), shape=self.shape)
+
+    def predict(self, U, V):
+        """ Return the predictions Ui*Vj for each observed entry (i,j). """
+        assert U.shape[0] == self.I and V.shape[0] == self.J and U.shape[1] == V.shape[1]
+        return numpy.einsum('nk,nk->n', U[self.rows], V[self.cols])
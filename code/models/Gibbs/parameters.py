@@ -30,15 +30,17 @@ Other parameters for:
 '''
 
 
+from distributions.multivariate_normal_vector import solve_lower_vector, solve_upper_vector
+
 import numpy
 import math 
 
 
 ''' General Gaussian and Poisson models '''
-def gaussian_tau_alpha_beta(alpha, beta, R, M, U, V):
+def gaussian_tau_alpha_beta(alpha, beta, residuals):
     """ alpha_s and beta_s for tau (noise) in Gaussian models. """
-    alpha_s = alpha + M.sum() / 2.
-    squared_error = (M*(R-numpy.dot(U,V.T))**2).sum()
+    alpha_s = alpha + residuals.Omega.size / 2.
+    squared_error = residuals.squared_error()
     beta_s = beta + squared_error / 2.
     return (alpha_s, beta_s)
 
@@ -60,74 +62,81 @@ def poisson_Zij_n_p(Rij, Ui, Vj):
 #    p /= p_sum
 #    return (n, p)
     
-def poisson_Z_n_p(R, U, V, Omega):
-    """ n (|Omega|) and p (|Omega|xK) for all Zij with Mult(Rij,(Ui0Vj0,..,UiKVjK)) prior. """
+def poisson_Z_n_p(Omega, U, V, entries=None):
+    """ n (|Omega|) and p (|Omega|xK) for all Zij with Mult(Rij,(Ui0Vj0,..,UiKVjK)) prior. 
+        If :entries (indices into Omega) is given, only return those entries. """
     K = U.shape[1]
-    indices_i, indices_j = zip(*Omega)
-    U_list, V_list = U[indices_i,:], V[indices_j,:]
-    n_list = R[indices_i, indices_j]
+    entries = slice(None) if entries is None else entries
+    U_list, V_list = U[Omega.rows[entries],:], V[Omega.cols[entries],:]
+    n_list = Omega.values[entries]
     p_list = U_list * V_list
     p_sum = numpy.repeat(p_list.sum(axis=1)[:,numpy.newaxis], K, axis=1)
     p_list /= p_sum
     return (n_list, p_list)
 
 
+''' Column-wise updates (per k) for models with a Gaussian likelihood. '''
+def gaussian_Uk_sums(k, residuals, U, V):
+    """ Sums per row i (vectors) over the observed j of Vjk^2, and of 
+        (Rij - Ui*Vj + Uik*Vjk) * Vjk, using the current residuals. """
+    Omega = residuals.Omega
+    assert Omega.shape == (U.shape[0], V.shape[0]) and U.shape[1] == V.shape[1]
+    Vk = V[Omega.cols,k]
+    residual_k = residuals.column(k=k, U=U, V=V)
+    return (Omega.row_sums(Vk**2), Omega.row_sums(residual_k * Vk))
+
+
 ''' (Gaussian) Gaussian (univariate posterior). '''
-def gaussian_gaussian_mu_tau(k, lamb, R, M, U, V, tau):
+def gaussian_gaussian_mu_tau(k, lamb, residuals, U, V, tau):
     """ muUk and tauUk (vectors) for Uk with N(0,I/lamb) prior (I=identity matrix). """
-    I, J, K = R.shape[0], R.shape[1], U.shape[1]
-    assert R.shape == M.shape and V.shape == (J,K) and U.shape[0] == I
-    tauUk = lamb + tau * ( M * V[:,k]**2 ).sum(axis=1)   
+    I, J, K = residuals.Omega.I, residuals.Omega.J, U.shape[1]
+    assert V.shape == (J,K) and U.shape[0] == I
+    sum_V2, sum_RV = gaussian_Uk_sums(k=k, residuals=residuals, U=U, V=V)
+    tauUk = lamb + tau * sum_V2
     #muUk = 1. / tauUk * ( tau * ( 
     #    M * ( ( R - numpy.dot(U,V.T) + numpy.outer(U[:,k],V[:,k])) * V[:,k] ) ).sum(axis=1) )
-    V_ktilde = numpy.append(V[:,:k],V[:,k+1:],axis=1)
-    U_ktilde = numpy.append(U[:,:k],U[:,k+1:],axis=1)
-    muUk = 1. / tauUk * ( tau * (
-        numpy.dot(M*R, V[:,k]) - numpy.dot(M*numpy.dot(U_ktilde, V_ktilde.T), V[:,k])) )
+    muUk = 1. / tauUk * ( tau * sum_RV )
     assert muUk.shape == (I,) and tauUk.shape == (I,)
     return (muUk, tauUk)
 
 
+''' Row-wise updates (all rows at once) for models with a Gaussian likelihood. '''
+def gaussian_Ui_sums(Omega, V):
+    """ Sums per row i over the observed j of Vj^T Vj (IxKxK), and of Rij * Vj (IxK). 
+        We compute these as sparse matrix products with Omega, in O(|Omega|*K^2). """
+    (I, J), K = Omega.shape, V.shape[1]
+    assert V.shape[0] == J
+    outer_V = (V[:,:,numpy.newaxis] * V[:,numpy.newaxis,:]).reshape(J,K*K)
+    sum_VV = Omega.matrix().dot(outer_V).reshape(I,K,K)
+    sum_RV = Omega.matrix(Omega.values).dot(V)
+    return (sum_VV, sum_RV)
+
+def gaussian_mus_precisions(precision_prior, mean_prior, Omega, V, tau):
+    """ mus (IxK) and the Cholesky factors L (IxKxK) of the precisions L*L^T for all Ui 
+        with N(mean_prior/precision_prior, precision_prior^-1) prior, so mean_prior is 
+        the precision-weighted prior mean. We factorise the precisions once, and use 
+        the factors for the mus (two triangular solves) and for the draw. """
+    sum_VV, sum_RV = gaussian_Ui_sums(Omega=Omega, V=V)
+    precisions_cholesky = numpy.linalg.cholesky(precision_prior + tau * sum_VV)
+    mus = solve_upper_vector(precisions_cholesky, 
+                             solve_lower_vector(precisions_cholesky, mean_prior + tau * sum_RV))
+    assert mus.shape == sum_RV.shape and precisions_cholesky.shape == sum_VV.shape
+    return (mus, precisions_cholesky)
+
+
 ''' (Gaussian) Gaussian (multivariate posterior). '''
-def gaussian_gaussian_mu_sigma(lamb, Ri, Mi, V, tau):
-    """ mu and sigma for Ui with N(0,I/lamb) prior (I=identity matrix). """
-    assert Ri.shape == Mi.shape and Ri.shape[0] == V.shape[0]
+def gaussian_gaussian_mus_precisions(lamb, Omega, V, tau):
+    """ mus (IxK) and Cholesky factors of the precisions (IxKxK) for all Ui with N(0,I/lamb) prior (I=identity matrix). """
     K = V.shape[1]
-    V_masked = (Mi * V.T).T # zero rows when j not in Mi
-    precision = lamb * numpy.eye(K) + tau * ( numpy.dot(V_masked.T,V_masked) )
-    sigma = numpy.linalg.inv(precision)
-    Ri_masked = Mi * Ri # zero entries when j not in Mi
-    mu = numpy.dot(sigma, tau * numpy.dot(Ri_masked, V))
-    assert mu.shape[0] == V.shape[1] and sigma.shape == (V.shape[1], V.shape[1])
-    return (mu, sigma)
-    
-#def gaussian_gaussian_mu_sigma(lamb, R, M, V, tau):
-#    """ mu (IxKxK) and sigma (IxKxK) for all Ui with N(0,I/lamb) prior (I=identity matrix). """
-#    assert R.shape == M.shape and R.shape[1] == V.shape[0]
-#    I, K = R.shape[0], V.shape[1]   
-#    V_expanded = numpy.repeat(V[numpy.newaxis,:,:], I, axis=0)
-#    M_expanded = numpy.repeat(M[:,:,numpy.newaxis], K, axis=2)
-#    V_masked = (M_expanded * V_expanded)
-#    precision = lamb * numpy.repeat(numpy.eye(K)[numpy.newaxis,:,:], I, axis=0) + \
-#                tau * numpy.repeat(((V_masked * V_masked).sum(axis=1))[:,:,numpy.newaxis], K, axis=2)
-#    sigma = numpy.array([numpy.linalg.inv(prec) for prec in precision])
-#    R_masked = M * R # zero entries when j not in Mi
-#    mu = (sigma * tau * numpy.repeat((numpy.dot(R_masked, V))[:,:,numpy.newaxis], K, axis=2)).sum(axis=2)
-#    assert mu.shape == (I,K) and sigma.shape == (I,K,K)
-#    return (mu, sigma)
+    return gaussian_mus_precisions(
+        precision_prior=lamb * numpy.eye(K), mean_prior=numpy.zeros(K), Omega=Omega, V=V, tau=tau)
 
 
 ''' (Gaussian) Gaussian + Wishart '''
-def gaussian_gaussian_wishart_mu_sigma(muU, sigmaU_inv, Ri, Mi, V, tau):
-    """ mu and sigma for Ui with N(muU,sigmaU) prior. """
-    assert Ri.shape == Mi.shape and Ri.shape[0] == V.shape[0]
-    V_masked = (Mi * V.T).T # zero rows when j not in Mi
-    precision = sigmaU_inv + tau * ( numpy.dot(V_masked.T,V_masked) )
-    sigma = numpy.linalg.inv(precision)
-    Ri_masked = Mi * Ri # zero entries when j not in Mi
-    mu = numpy.dot(sigma, numpy.dot(sigmaU_inv, muU) + tau * numpy.dot(Ri_masked, V))
-    assert mu.shape[0] == V.shape[1] and sigma.shape == (V.shape[1], V.shape[1])
-    return (mu, sigma)
+def gaussian_gaussian_wishart_mus_precisions(muU, sigmaU_inv, Omega, V, tau):
+    """ mus (IxK) and Cholesky factors of the precisions (IxKxK) for all Ui with N(muU,sigmaU) prior. """
+    return gaussian_mus_precisions(
+        precision_prior=sigmaU_inv, mean_prior=numpy.dot(sigmaU_inv, muU), Omega=Omega, V=V, tau=tau)
 
 def gaussian_wishart_beta0_v0_mu0_W0(beta0, v0, mu0, W0, U):
     """ beta0_s, v0_s, mu0_s, W0_s for muU, sigmaU with NIW(beta0,v0,mu0,W0) prior. """
@@ -144,16 +153,12 @@ def gaussian_wishart_beta0_v0_mu0_W0(beta0, v0, mu0, W0, U):
 
 
 ''' (Gaussian) Gaussian + Automatic Relevance Determination '''
-def gaussian_gaussian_ard_mu_sigma(lamb, Ri, Mi, V, tau):
-    """ mu and sigma for Ui with N(0,diag(1/lamb)) prior. lamb is a vector. """
-    assert Ri.shape == Mi.shape and Ri.shape[0] == V.shape[0] and lamb.shape[0] == V.shape[1]
-    V_masked = (Mi * V.T).T # zero rows when j not in Mi
-    precision = numpy.diag(lamb) + tau * ( numpy.dot(V_masked.T,V_masked) )
-    sigma = numpy.linalg.inv(precision)
-    Ri_masked = Mi * Ri # zero entries when j not in Mi
-    mu = numpy.dot(sigma, tau * numpy.dot(Ri_masked, V))
-    assert mu.shape[0] == V.shape[1] and sigma.shape == (V.shape[1], V.shape[1])
-    return (mu, sigma)
+def gaussian_gaussian_ard_mus_precisions(lamb, Omega, V, tau):
+    """ mus (IxK) and Cholesky factors of the precisions (IxKxK) for all Ui with N(0,diag(1/lamb)) prior. lamb is a vector. """
+    K = V.shape[1]
+    assert lamb.shape == (K,)
+    return gaussian_mus_precisions(
+        precision_prior=numpy.diag(lamb), mean_prior=numpy.zeros(K), Omega=Omega, V=V, tau=tau)
 
 def gaussian_ard_alpha_beta(alpha0, beta0, Uk, Vk):
     """ alpha_s and beta_s for lambdak with Gamma(alpha0,beta0) prior. """
@@ -164,15 +169,14 @@ def gaussian_ard_alpha_beta(alpha0, beta0, Uk, Vk):
 
 
 ''' (Gaussian) Laplace. '''
-def gaussian_laplace_mu_precision(Ri, Mi, V, lambdaUi, tau):
-    """ mu and precision for Ui with L(0,lambdaUi) prior. """
-    assert Ri.shape == Mi.shape and Ri.shape[0] == V.shape[0] and lambdaUi.shape[0] == V.shape[1]
-    V_masked = (Mi * V.T).T # zero rows when j not in Mi
-    Ri_masked = Mi * Ri # zero entries when j not in Mi
-    precision = numpy.diag(1./lambdaUi) + tau * ( numpy.dot(V_masked.T,V_masked) )
+def gaussian_laplace_mu_precision(Ri, Vi, lambdaUi, tau):
+    """ mu and precision for Ui with L(0,lambdaUi) prior. 
+        Ri and Vi are the observed values in row i, and the corresponding rows of V. """
+    assert Ri.shape[0] == Vi.shape[0] and lambdaUi.shape[0] == Vi.shape[1]
+    precision = numpy.diag(1./lambdaUi) + tau * ( numpy.dot(Vi.T,Vi) )
     sigma = numpy.linalg.inv(precision)
-    mu = numpy.dot(sigma, tau * numpy.dot(Ri_masked, V))
-    assert mu.shape[0] == V.shape[1] and precision.shape == (V.shape[1], V.shape[1])
+    mu = numpy.dot(sigma, tau * numpy.dot(Ri, Vi))
+    assert mu.shape[0] == Vi.shape[1] and precision.shape == (Vi.shape[1], Vi.shape[1])
     return (mu, precision)
 
 def laplace_lambdaU_mu_tau(Uik, etaUik):
@@ -187,17 +191,14 @@ def laplace_etaU_mu_tau(lambdaUik, a, b):
 
 
 ''' (Gaussian) Gaussian + L^2_1 Prior '''
-def gaussian_l21_mu_tau(k, lamb, R, M, U, V, tau):
+def gaussian_l21_mu_tau(k, lamb, residuals, U, V, tau):
     """ muUik and tauUik for Uik with L21(lamb) prior. 
         We do updates per column of U (so Uk). """
-    assert R.shape == M.shape and R.shape[0] == U.shape[0] and R.shape[1] == V.shape[0]
-    assert U.shape[1] == V.shape[1]
-    tauUk = lamb + tau * ( M * V[:,k]**2 ).sum(axis=1)
+    sum_V2, sum_RV = gaussian_Uk_sums(k=k, residuals=residuals, U=U, V=V)
+    tauUk = lamb + tau * sum_V2
     #muUk = 1. / tauUk * ( -lamb + tau * (M * ( (R-numpy.dot(U,V.T)+numpy.outer(U[:,k],V[:,k]))*V[:,k] )).sum(axis=1))
-    V_ktilde = numpy.append(V[:,:k],V[:,k+1:],axis=1)
-    U_ktilde = numpy.append(U[:,:k],U[:,k+1:],axis=1)
-    muUk = 1. / tauUk * ( -lamb * U_ktilde.sum(axis=1) + tau * (
-        numpy.dot(M*R, V[:,k]) - numpy.dot(M*numpy.dot(U_ktilde, V_ktilde.T), V[:,k])) )
+    U_ktilde_sum = U.sum(axis=1) - U[:,k]
+    muUk = 1. / tauUk * ( -lamb * U_ktilde_sum + tau * sum_RV )
     assert tauUk.shape == muUk.shape
     return (muUk, tauUk)
 
@@ -207,62 +208,57 @@ def adjugate_matrix(matrix):
     """ adj(matrix) = det(matrix) matrix^-1 """
     return numpy.linalg.det(matrix) * numpy.linalg.inv(matrix)
 
-def gaussian_gaussian_volumeprior_mu_sigma(i, k, gamma, Ri, Mi, U, V, tau):
-    """ muUik and tauUik for Uik with Volume Prior, exp{-gamma det(U.T U)}. """
+def gaussian_gaussian_volumeprior_mu_sigma(i, k, gamma, Ri, Vi, U, tau, gram):
+    """ muUik and tauUik for Uik with Volume Prior, exp{-gamma det(U.T U)}. 
+        Ri and Vi are the observed values in row i, and the corresponding rows of V.
+        gram is the Gram matrix U.T U of the current U (see gram.py), which gives 
+        us the determinant and adjugate of U_ktilde.T U_ktilde, and 
+        U_itilde_ktilde.T U_itilde_k = (U.T U)_ktilde,k - U_i_ktilde * Uik. """
     I, K, J = U.shape[0], U.shape[1], Ri.shape[0]
-    assert Mi.shape == (J,) and V.shape == (J, K)
+    assert Vi.shape == (J, K) and gram.G.shape == (K, K)
     U_i_ktilde = numpy.append(U[i,:k],U[i,k+1:]) # vector Ui excl entry k
-    U_itilde_k = numpy.append(U[:i,k],U[i+1:,k]) # vector Uk excl entry i
-    U_ktilde = numpy.append(U[:,:k],U[:,k+1:],axis=1) # matrix U excl column k
-    U_itilde_ktilde = numpy.append(U_ktilde[:i,:],U_ktilde[i+1:,:],axis=0) # matrix U excl row i and column k
-    assert U_i_ktilde.shape == (K-1,) and U_itilde_k.shape == (I-1,)
-    assert U_ktilde.shape == (I,K-1) and U_itilde_ktilde.shape == (I-1,K-1)
-    cov_U_ktilde = numpy.dot(U_ktilde.T, U_ktilde)
-    V_ktilde = numpy.append(V[:,:k],V[:,k+1:],axis=1)
+    assert U_i_ktilde.shape == (K-1,)
+    Vi_ktilde = numpy.append(Vi[:,:k],Vi[:,k+1:],axis=1)
     
     # If K=1, the VP prior bit has no effect
-    tauUik = tau*(Mi*V[:,k]**2).sum()
+    tauUik = tau*(Vi[:,k]**2).sum()
     if K > 1: 
-        D_ktilde_ktilde = numpy.linalg.det(cov_U_ktilde)
-        A_ktilde_ktilde = adjugate_matrix(cov_U_ktilde)
-        assert cov_U_ktilde.shape == (K-1,K-1) and A_ktilde_ktilde.shape == (K-1,K-1)
+        D_ktilde_ktilde, A_ktilde_ktilde = gram.minor(k)
+        assert A_ktilde_ktilde.shape == (K-1,K-1)
+        cov_U_itilde_ktilde_k = gram.G[gram.ktilde[k],k] - U_i_ktilde * U[i,k]
         tauUik += gamma * (D_ktilde_ktilde - numpy.dot(numpy.dot(U_i_ktilde,A_ktilde_ktilde),U_i_ktilde))
         muUik = 1./tauUik * (
-            tau * (numpy.dot(Mi*Ri, V[:,k]) - numpy.dot(numpy.dot(U_i_ktilde, V_ktilde.T), Mi*V[:,k])) +
-            gamma * numpy.dot(numpy.dot(U_i_ktilde,A_ktilde_ktilde), numpy.dot(U_itilde_ktilde.T,U_itilde_k))
+            tau * (numpy.dot(Ri, Vi[:,k]) - numpy.dot(numpy.dot(Vi_ktilde, U_i_ktilde), Vi[:,k])) +
+            gamma * numpy.dot(numpy.dot(U_i_ktilde,A_ktilde_ktilde), cov_U_itilde_ktilde_k)
         )
         #muUik += 1./tauUik * (
         #    tau * (Mi *((Ri-numpy.dot(U[i,:],V.T)+U[i,k]*V[:,k])*V[:,k])).sum() +
         #    gamma * numpy.dot(numpy.dot(U_i_ktilde,A_ktilde_ktilde), numpy.dot(U_itilde_ktilde.T,U_itilde_k)) )
     else:
         muUik = 1./tauUik * ( 
-            tau * (numpy.dot(Mi*Ri, V[:,k]) - numpy.dot(numpy.dot(U_i_ktilde, V_ktilde.T), Mi*V[:,k])) ) 
+            tau * (numpy.dot(Ri, Vi[:,k]) - numpy.dot(numpy.dot(Vi_ktilde, U_i_ktilde), Vi[:,k])) ) 
         #muUik = 1./tauUik * (
         #    tau * (Mi *((Ri-numpy.dot(U[i,:],V.T)+U[i,k]*V[:,k])*V[:,k])).sum() )
     return (muUik, tauUik)
 
 
 ''' (Gausian) Exponential '''
-def gaussian_exponential_mu_tau(k, lamb, R, M, U, V, tau):
+def gaussian_exponential_mu_tau(k, lamb, residuals, U, V, tau):
     """ muUik and tauUik for Uik with Exp(lamb) prior. 
         We do updates per column of U (so Uk). """
-    assert R.shape == M.shape and R.shape[0] == U.shape[0] and R.shape[1] == V.shape[0]
-    assert U.shape[1] == V.shape[1]
-    tauUk = tau * ( M * V[:,k]**2 ).sum(axis=1)
+    sum_V2, sum_RV = gaussian_Uk_sums(k=k, residuals=residuals, U=U, V=V)
+    tauUk = tau * sum_V2
     #muUk = 1. / tauUk * ( -lamb + tau * (M * ( (R-numpy.dot(U,V.T)+numpy.outer(U[:,k],V[:,k]))*V[:,k] )).sum(axis=1))
-    V_ktilde = numpy.append(V[:,:k],V[:,k+1:],axis=1)
-    U_ktilde = numpy.append(U[:,:k],U[:,k+1:],axis=1)
-    muUk = 1. / tauUk * ( -lamb + tau * (
-        numpy.dot(M*R, V[:,k]) - numpy.dot(M*numpy.dot(U_ktilde, V_ktilde.T), V[:,k])) )
+    muUk = 1. / tauUk * ( -lamb + tau * sum_RV )
     assert tauUk.shape == muUk.shape
     return (muUk, tauUk)
 
 
 ''' (Gausian) Exponential + Automatic Relevance Determination '''
-def gaussian_exponential_ard_mu_tau(k, lambdak, R, M, U, V, tau):
+def gaussian_exponential_ard_mu_tau(k, lambdak, residuals, U, V, tau):
     """ mu and tau for Uik with Exp(lambda_k) prior.
         We do updates per column of U (so Uk). """
-    return gaussian_exponential_mu_tau(k=k, lamb=lambdak, R=R, M=M, U=U, V=V, tau=tau)
+    return gaussian_exponential_mu_tau(k=k, lamb=lambdak, residuals=residuals, U=U, V=V, tau=tau)
 
 def exponential_ard_alpha_beta(alpha0, beta0, Uk, Vk):
     """ alpha_s and beta_s for lambdak with Gamma(alpha0,beta0) prior. """
@@ -273,26 +269,22 @@ def exponential_ard_alpha_beta(alpha0, beta0, Uk, Vk):
 
 
 ''' (Gausian) Truncated Normal '''
-def gaussian_tn_mu_tau(k, muU, tauU, R, M, U, V, tau):
+def gaussian_tn_mu_tau(k, muU, tauU, residuals, U, V, tau):
     """ mu and tau for Uik with TN(muU,tauU) prior. 
         We do updates per column of U (so Uk). """
-    assert R.shape == M.shape and R.shape[0] == U.shape[0] and R.shape[1] == V.shape[0]
-    assert U.shape[1] == V.shape[1]
-    tauUk = tauU + tau * ( M * V[:,k]**2 ).sum(axis=1)
+    sum_V2, sum_RV = gaussian_Uk_sums(k=k, residuals=residuals, U=U, V=V)
+    tauUk = tauU + tau * sum_V2
     #muUk = 1. / tauUk * ( muU * tauU + tau * (M * ( (R-numpy.dot(U,V.T)+numpy.outer(U[:,k],V[:,k]))*V[:,k] )).sum(axis=1))
-    V_ktilde = numpy.append(V[:,:k],V[:,k+1:],axis=1)
-    U_ktilde = numpy.append(U[:,:k],U[:,k+1:],axis=1)
-    muUk = 1. / tauUk * ( muU * tauU + tau * (
-        numpy.dot(M*R, V[:,k]) - numpy.dot(M*numpy.dot(U_ktilde, V_ktilde.T), V[:,k])) )
+    muUk = 1. / tauUk * ( muU * tauU + tau * sum_RV )
     assert tauUk.shape == muUk.shape    
     return (muUk, tauUk)
 
 
 ''' (Gausian) Truncated Normal + hierarchical '''
-def gaussian_tn_hierarchical_mu_tau(k, muUk, tauUk, R, M, U, V, tau):
+def gaussian_tn_hierarchical_mu_tau(k, muUk, tauUk, residuals, U, V, tau):
     """ mu and tau for Uik with TN(muUik,tauUik) prior, with hierarchical prior 
         for muUik, tauUik. We do updates per column of U (so Uk). """
-    return gaussian_tn_mu_tau(k=k, muU=muUk, tauU=tauUk, R=R, M=M, U=U, V=V, tau=tau)
+    return gaussian_tn_mu_tau(k=k, muU=muUk, tauU=tauUk, residuals=residuals, U=U, V=V, tau=tau)
 
 def tn_hierarchical_mu_m_t(mu_mu, tau_mu, U, tauU):
     """ m and t for mu^U_ik with hierarchical prior (hyperparams mu_mu, tau_mu).
@@ -313,26 +305,34 @@ def tn_hierarchical_tau_a_b(a, b, U, muU):
 
 
 ''' (Gausian) Half Normal '''
-def gaussian_hn_mu_tau(k, sigma, R, M, U, V, tau):
+def gaussian_hn_mu_tau(k, sigma, residuals, U, V, tau):
     """ mu and tau for Uik with HN(sigma) prior. 
         We do updates per column of U (so Uk). """
-    assert R.shape == M.shape and R.shape[0] == U.shape[0] and R.shape[1] == V.shape[0]
-    assert U.shape[1] == V.shape[1]
-    tauUk = 1. / sigma**2 + tau * ( M * V[:,k]**2 ).sum(axis=1)
+    sum_V2, sum_RV = gaussian_Uk_sums(k=k, residuals=residuals, U=U, V=V)
+    tauUk = 1. / sigma**2 + tau * sum_V2
     #muUk = 1. / tauUk * ( tau * (M * ( (R-numpy.dot(U,V.T)+numpy.outer(U[:,k],V[:,k]))*V[:,k] )).sum(axis=1))
-    V_ktilde = numpy.append(V[:,:k],V[:,k+1:],axis=1)
-    U_ktilde = numpy.append(U[:,:k],U[:,k+1:],axis=1)
-    muUk = 1. / tauUk * ( tau * (
-        numpy.dot(M*R, V[:,k]) - numpy.dot(M*numpy.dot(U_ktilde, V_ktilde.T), V[:,k])) )
+    muUk = 1. / tauUk * ( tau * sum_RV )
     assert tauUk.shape == muUk.shape   
     return (muUk, tauUk)
 
 
 ''' (Poisson) Gamma '''
-def poisson_gamma_a_b(a, b, Mi, Vk, Zik):
-    """ a_s and b_s for Uik with Gamma(a,b) prior. """
-    a_s = a + numpy.dot(Mi, Zik) #(Mi * Zik).sum() #
-    b_s = b + numpy.dot(Mi, Vk) #(Mi * Vk).sum() #
+def poisson_Ui_sums(Omega, V, Z):
+    """ Sums per row i (IxK) over the observed j of Zijk, and of Vjk. 
+        Z is |Omega|xK, with one row per observed entry. Both sums are segmented
+        reductions over the entries of Omega. """
+    assert Omega.J == V.shape[0] and Z.shape == (Omega.size, V.shape[1])
+    Z_sums = Omega.row_sums(Z)
+    V_sums = Omega.matrix().dot(V)
+    return (Z_sums, V_sums)
+
+def poisson_gamma_a_b(a, b, Z_sums, V_sums):
+    """ a_s (IxK) and b_s (IxK) for all Uik with Gamma(a,b) prior. 
+        Z_sums and V_sums (IxK) are the sums of Zijk and Vjk over the observed 
+        j in each row i (see poisson_Ui_sums). """
+    assert Z_sums.shape == V_sums.shape
+    a_s = a + Z_sums
+    b_s = b + V_sums
     return (a_s, b_s)
     
 #def poisson_gamma_a_b(a, b, M, V, Z):
@@ -346,22 +346,25 @@ def poisson_gamma_a_b(a, b, Mi, Vk, Zik):
     
     
 ''' (Poisson) Gamma + hierarchical '''
-def poisson_gamma_hierarchical_a_b(a, hUi, Mi, Vk, Zik):
-    """ a_s and b_s for Uik with Gamma(a,h^U_i) prior, and h^U_i ~ Gamma(ap,ap/bp). """
-    return poisson_gamma_a_b(a=a, b=hUi, Mi=Mi, Vk=Vk, Zik=Zik)
-
-def gamma_hierarchical_hUi_a_b(ap, bp, a, Ui):
-    """ a_s and b_s for h^U_i with Gamma(ap,ap/bp) prior, and Uik ~ Gamma(a,h_i^U). """
-    K = Ui.shape[0]
-    a_s = ap + K * a
-    b_s = ap / float(bp) + Ui.sum()
+def poisson_gamma_hierarchical_a_b(a, hU, Z_sums, V_sums):
+    """ a_s (IxK) and b_s (IxK) for all Uik with Gamma(a,h^U_i) prior, and h^U_i ~ Gamma(ap,ap/bp). """
+    assert hU.shape == (Z_sums.shape[0],)
+    return poisson_gamma_a_b(a=a, b=hU[:,numpy.newaxis], Z_sums=Z_sums, V_sums=V_sums)
+
+def gamma_hierarchical_hU_a_b(ap, bp, a, U):
+    """ a_s (vector) and b_s (vector) for all h^U_i with Gamma(ap,ap/bp) prior, 
+        and Uik ~ Gamma(a,h_i^U). """
+    I, K = U.shape
+    a_s = (ap + K * a) * numpy.ones(I)
+    b_s = ap / float(bp) + U.sum(axis=1)
     return (a_s, b_s)
 
 
 ''' (Poisson) Dirichlet '''
-def poisson_dirichlet_alpha(alpha, Mi, Zi):
-    """ alpha (vector) for Ui with Dir(alpha) prior in Poisson models. """
-    assert Mi.shape[0] == Zi.shape[0] and alpha.shape[0] == Zi.shape[1]
-    alpha_s = alpha + (Mi * Zi.T).sum(axis=1)
+def poisson_dirichlet_alpha(alpha, Zi_sum):
+    """ alpha (vector) for Ui with Dir(alpha) prior in Poisson models. 
+        Zi_sum is the sum of Zij (vector) over the observed j in row i. """
+    assert alpha.shape == Zi_sum.shape
+    alpha_s = alpha + Zi_sum
     assert alpha_s.shape == alpha.shape
     return alpha_s
\ No newline at end of file
@@ -0,0 +1,62 @@
+"""
+Class storing the residuals E_ij = R_ij - U_i*V_j for the observed entries
+(i,j) in Omega, so that the Gibbs updates do not have to recompute the full
+reconstruction U*V^T for each column k, or for updating tau.
+
+The residuals are a vector aligned with the entries of Omega. When column k of
+U changes, we apply the rank-1 correction E_ij -= (Uik_new - Uik_old) * Vjk.
+When the whole of U (or V) is redrawn at once, we simply recompute E.
+
+As with Omega, the transpose residuals.T shares the same vector, so the
+updates for V can use the updates for U by passing residuals.T.
+
+USAGE
+    residuals = Residuals.from_factors(Omega, U, V)
+    Ek = residuals.column(k, U, V)
+    residuals.update_column(Uk_old, Uk_new, Vk)
+    residuals.refresh(U, V)
+where
+    Omega is the set of observed entries (see observations.py).
+    Ek are the residuals excluding factor k, Rij - Ui*Vj + Uik*Vjk.
+"""
+
+import numpy
+
+class Residuals(object):
+    def __init__(self, Omega, values):
+        """ Set up the residuals :values (one per entry) of the observed entries Omega. """
+        assert values.shape == (Omega.size,), "Expected %s residuals, not %s." % (
+            Omega.size, values.shape)
+        self.Omega = Omega
+        self.values = values
+        self._transpose = None
+
+    @classmethod
+    def from_factors(cls, Omega, U, V):
+        """ Return the residuals of R - U*V^T for the observed entries. """
+        return cls(Omega=Omega, values=Omega.values - Omega.predict(U,V))
+
+    @property
+    def T(self):
+        """ The residuals of the transposed set of observed entries, sharing the values. """
+        if self._transpose is None:
+            self._transpose = Residuals(Omega=self.Omega.T, values=self.values)
+            self._transpose._transpose = self
+        return self._transpose
+
+    def column(self, k, U, V):
+        """ Return the residuals excluding factor k, Rij - Ui*Vj + Uik*Vjk. """
+        return self.values + U[self.Omega.rows,k] * V[self.Omega.cols,k]
+
+    def update_column(self, Uk_old, Uk_new, Vk):
+        """ Update the residuals after column k of U changed from Uk_old to Uk_new. """
+        delta_Uk = numpy.asarray(Uk_new) - Uk_old
+        self.values -= delta_Uk[self.Omega.rows] * Vk[self.Omega.cols]
+
+    def refresh(self, U, V):
+        """ Recompute the residuals for new U and V (in place, so the transpose stays valid). """
+        self.values[:] = self.Omega.values - self.Omega.predict(U,V)
+
+    def squared_error(self):
+        """ Return the sum of squared residuals. """
+        return numpy.dot(self.values, self.values)
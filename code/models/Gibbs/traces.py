@@ -0,0 +1,214 @@
+"""
+Classes storing the draws of the random variables in the Gibbs samplers, and
+computing their expectation (and variance) after burn-in and thinning.
+
+- Traces stores every draw in memory, as an (iterations x shape) array per
+  random variable. This is what the models use by default.
+- StreamingTraces is given the burn-in and thinning up front, and only keeps
+  the running mean and variance (Welford's algorithm) of the draws we would
+  use. Its memory use does not depend on the number of iterations. It can
+  also be given a list of burn-ins, keeping the running mean and variance
+  after each of them (e.g. to evaluate a chain at several checkpoints).
+- MemmapTraces stores every draw on disk, as a memory-mapped .npy file per
+  random variable in a given folder (so numpy.load(mmap_mode='r') can read it
+  back). Draws are buffered in memory and appended to the files in chunks of
+  chunk_size iterations, and the expectation and variance are computed by
+  reading the thinned draws back in blocks of chunk_size draws. So long chains
+  are bounded by disk space rather than memory.
+
+USAGE
+    traces = Traces(iterations, shapes)
+    traces = StreamingTraces(iterations, shapes, burn_in, thinning)
+    traces = MemmapTraces(iterations, shapes, folder, chunk_size)
+    traces.store(it, draws)
+    traces.extend(iterations)
+    exp_U = traces.mean('U', burn_in, thinning)
+    var_U = traces.variance('U', burn_in, thinning)
+    all_U = traces.samples('U', burn_in, thinning)
+where
+    shapes is a dictionary from the names of the random variables to their
+        shapes, e.g. { 'U': (I,K), 'V': (J,K), 'tau': () }.
+    draws is a dictionary from the names of the random variables to their
+        values in iteration it.
+    all_U are the draws of U after burn_in and thinning (not available for 
+        StreamingTraces), as an array (or memory-mapped array) of shape (S,I,K).
+    extend(iterations) makes room for :iterations draws in total, keeping the
+        draws so far (used to continue a chain).
+
+The classes can be pickled. For MemmapTraces we only pickle the names of the
+files, and open them again when unpickling.
+"""
+
+import numpy, os
+
+class Traces(object):
+    def __init__(self, iterations, shapes):
+        """ Set up arrays for storing all :iterations draws of each random variable. """
+        self.iterations, self.names = iterations, sorted(shapes)
+        self.draws = { name: numpy.zeros((iterations,)+tuple(shape)) for name,shape in shapes.items() }
+
+    def store(self, it, draws):
+        """ Store the values of the random variables in iteration it. """
+        for name, value in draws.items():
+            self.draws[name][it] = value
+
+    def extend(self, iterations):
+        """ Make room for :iterations draws in total, keeping the draws so far. """
+        for name, draws in self.draws.items():
+            n = min(iterations, self.iterations)
+            self.draws[name] = numpy.zeros((iterations,)+draws.shape[1:])
+            self.draws[name][:n] = draws[:n]
+        self.iterations = iterations
+
+    def mean(self, name, burn_in, thinning):
+        """ Return the average of the draws of :name after burn_in and thinning. """
+        return self.draws[name][burn_in::thinning].mean(axis=0)
+
+    def variance(self, name, burn_in, thinning):
+        """ Return the variance of the draws of :name after burn_in and thinning. """
+        return self.draws[name][burn_in::thinning].var(axis=0)
+
+    def samples(self, name, burn_in, thinning):
+        """ Return the draws of :name after burn_in and thinning. """
+        return self.draws[name][burn_in::thinning]
+
+
+class StreamingTraces(object):
+    def __init__(self, iterations, shapes, burn_in, thinning):
+        """ Set up the running means and sums of squared differences of each
+            random variable, for the draws after burn_in and thinning. If 
+            :burn_in is a list, we keep them for each of those burn-ins. """
+        self.burn_ins = sorted(set(burn_in)) if isinstance(burn_in, (list, tuple)) else [burn_in]
+        assert self.burn_ins[0] < iterations, "burn_in (%s) should be less than the number of iterations (%s)." % (
+            self.burn_ins[0], iterations)
+        self.iterations, self.thinning = iterations, thinning
+        self.names = sorted(shapes)
+        self.n = { b: 0 for b in self.burn_ins }
+        self.means = { b: { name: numpy.zeros(shape) for name,shape in shapes.items() } for b in self.burn_ins }
+        self.M2s = { b: { name: numpy.zeros(shape) for name,shape in shapes.items() } for b in self.burn_ins }
+
+    def store(self, it, draws):
+        """ Update the running means and variances with the values in iteration
+            it, for each burn-in after which we keep that iteration. """
+        for b in self.burn_ins:
+            if it < b or (it - b) % self.thinning != 0:
+                continue
+            self.n[b] += 1
+            for name, value in draws.items():
+                delta = value - self.means[b][name]
+                self.means[b][name] += delta / float(self.n[b])
+                self.M2s[b][name] += delta * (value - self.means[b][name])
+
+    def extend(self, iterations):
+        """ Allow :iterations draws in total. """
+        self.iterations = iterations
+
+    def check_burn_in_thinning(self, burn_in, thinning):
+        assert burn_in in self.burn_ins and thinning == self.thinning, \
+            "Only kept the draws for burn_in=%s and thinning=%s, not %s and %s." % (
+                self.burn_ins if len(self.burn_ins) > 1 else self.burn_ins[0], self.thinning, burn_in, thinning)
+
+    def mean(self, name, burn_in, thinning):
+        """ Return the average of the draws of :name after burn_in and thinning. """
+        self.check_burn_in_thinning(burn_in, thinning)
+        return numpy.copy(self.means[burn_in][name])
+
+    def variance(self, name, burn_in, thinning):
+        """ Return the variance of the draws of :name after burn_in and thinning. """
+        self.check_burn_in_thinning(burn_in, thinning)
+        return self.M2s[burn_in][name] / float(self.n[burn_in])
+
+    def samples(self, name, burn_in, thinning):
+        assert False, "Only kept the running mean and variance of the draws, not the draws themselves."
+
+
+class MemmapTraces(object):
+    def __init__(self, iterations, shapes, folder, chunk_size=100):
+        """ Set up a memory-mapped .npy file in :folder for all :iterations draws 
+            of each random variable, and a buffer of :chunk_size draws. """
+        if not os.path.exists(folder):
+            os.makedirs(folder)
+        self.iterations, self.folder, self.chunk_size = iterations, folder, chunk_size
+        self.names = sorted(shapes)
+        self.draws = { 
+            name: numpy.lib.format.open_memmap(
+                self.path(name), mode='w+', shape=(iterations,)+tuple(shape))
+            for name,shape in shapes.items() 
+        }
+        self.buffers = { name: numpy.zeros((chunk_size,)+tuple(shape)) for name,shape in shapes.items() }
+        self.buffer_start, self.buffer_size = 0, 0
+
+    def store(self, it, draws):
+        """ Store the values of the random variables in iteration it in the 
+            buffer, and write the buffer to disk when it is full. """
+        assert it == self.buffer_start + self.buffer_size, "Draws should be stored in order."
+        for name, value in draws.items():
+            self.buffers[name][self.buffer_size] = value
+        self.buffer_size += 1
+        if self.buffer_size == self.chunk_size or it == self.iterations - 1:
+            self.flush()
+
+    def flush(self):
+        """ Write the buffered draws to disk. """
+        start, end = self.buffer_start, self.buffer_start + self.buffer_size
+        for name in self.draws:
+            self.draws[name][start:end] = self.buffers[name][:self.buffer_size]
+            self.draws[name].flush()
+        self.buffer_start, self.buffer_size = end, 0
+
+    def path(self, name):
+        return os.path.join(self.folder, '%s.npy' % name)
+
+    def extend(self, iterations):
+        """ Make room for :iterations draws in total, copying the draws so far
+            to new (larger) files. """
+        self.flush()
+        for name, draws in self.draws.items():
+            extended = numpy.lib.format.open_memmap(
+                self.path(name)+'.tmp', mode='w+', shape=(iterations,)+draws.shape[1:])
+            extended[:self.buffer_start] = draws[:self.buffer_start]
+            extended.flush()
+            os.rename(self.path(name)+'.tmp', self.path(name))
+            self.draws[name] = extended
+        self.iterations = iterations
+
+    def __getstate__(self):
+        """ Write the buffered draws to disk, and pickle everything but the files. """
+        self.flush()
+        state = dict(self.__dict__)
+        state['draws'] = self.draws.keys()
+        return state
+
+    def __setstate__(self, state):
+        """ Open the files with the draws again. """
+        self.__dict__.update(state)
+        self.draws = { name: numpy.load(self.path(name), mmap_mode='r+') for name in state['draws'] }
+
+    def samples(self, name, burn_in, thinning):
+        """ Return the draws of :name after burn_in and thinning, as a 
+            memory-mapped array (so they are only read from disk when used). """
+        self.flush()
+        return self.draws[name][burn_in:self.buffer_start:thinning]
+
+    def blocks(self, name, burn_in, thinning):
+        """ Yield the draws of :name after burn_in and thinning, in blocks of 
+            chunk_size draws. """
+        self.flush()
+        step = self.chunk_size * thinning
+        for start in range(burn_in, self.buffer_start, step):
+            yield numpy.asarray(self.draws[name][start:min(start+step, self.buffer_start):thinning])
+
+    def mean(self, name, burn_in, thinning):
+        """ Return the average of the draws of :name after burn_in and thinning. """
+        total, n = 0., 0
+        for block in self.blocks(name, burn_in, thinning):
+            total, n = total + block.sum(axis=0), n + block.shape[0]
+        return total / float(n)
+
+    def variance(self, name, burn_in, thinning):
+        """ Return the variance of the draws of :name after burn_in and thinning. """
+        mean = self.mean(name, burn_in, thinning)
+        total, n = 0., 0
+        for block in self.blocks(name, burn_in, thinning):
+            total, n = total + ((block - mean)**2).sum(axis=0), n + block.shape[0]
+        return total / float(n)
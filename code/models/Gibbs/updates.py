@@ -32,10 +32,10 @@ Other updates:
 
 from parameters import gaussian_tau_alpha_beta
 from parameters import gaussian_gaussian_mu_tau
-from parameters import gaussian_gaussian_mu_sigma
-from parameters import gaussian_gaussian_wishart_mu_sigma
+from parameters import gaussian_gaussian_mus_precisions
+from parameters import gaussian_gaussian_wishart_mus_precisions
 from parameters import gaussian_wishart_beta0_v0_mu0_W0
-from parameters import gaussian_gaussian_ard_mu_sigma
+from parameters import gaussian_gaussian_ard_mus_precisions
 from parameters import gaussian_ard_alpha_beta
 from parameters import gaussian_l21_mu_tau
 from parameters import gaussian_laplace_mu_precision
@@ -51,111 +51,107 @@ from parameters import tn_hierarchical_mu_m_t
 from parameters import tn_hierarchical_tau_a_b
 from parameters import gaussian_hn_mu_tau
 from parameters import poisson_Z_n_p
+from parameters import poisson_Ui_sums
 from parameters import poisson_gamma_a_b
 from parameters import poisson_gamma_hierarchical_a_b
-from parameters import gamma_hierarchical_hUi_a_b
+from parameters import gamma_hierarchical_hU_a_b
 from parameters import poisson_dirichlet_alpha
 
 from distributions.gamma import gamma_draw
+from distributions.gamma_vector import gamma_vector_draw
 from distributions.multivariate_normal import multivariate_normal_draw
+from distributions.multivariate_normal_vector import multivariate_normal_vector_draw
 from distributions.normal_inverse_wishart import normal_inverse_wishart_draw
 from distributions.normal import normal_draw
 from distributions.truncated_normal import truncated_normal_draw
 from distributions.truncated_normal_vector import truncated_normal_vector_draw
 from distributions.multinomial import multinomial_draw
+from distributions.multinomial_vector import multinomial_vector_draw
 from distributions.dirichlet import dirichlet_draw
 from distributions.inverse_gaussian import inverse_gaussian_draw
 
+from gram import Gram
+
 import itertools
 import numpy
 
 
 ''' General Gaussian and Poisson models '''
-def update_tau_gaussian(alpha, beta, R, M, U, V):
-    """ Update tau (noise) in Gaussian models. """
-    alpha_s, beta_s = gaussian_tau_alpha_beta(alpha, beta, R, M, U, V)
+def update_tau_gaussian(alpha, beta, residuals):
+    """ Update tau (noise) in Gaussian models, using the current residuals. """
+    alpha_s, beta_s = gaussian_tau_alpha_beta(alpha, beta, residuals)
     new_tau = gamma_draw(alpha=alpha_s, beta=beta_s)
     return new_tau
 
 #def update_Z_poisson(R, M, Omega, Z, U, V):
 #    """ Update Z in Poisson models. """
-#    assert R.shape == M.shape and R.shape[0] == U.shape[0] and R.shape[1] == V.shape[0]
+#    assert Omega.shape == (U.shape[0], V.shape[0])
 #    n, p = poisson_Z_n_p(R=R, U=U, V=V)
 #    for i,j in Omega:
 #        Z[i,j,:] = multinomial_draw(n=n[i,j], p=p[i,j])
 #    return Z
     
-def update_Z_poisson(R, M, Omega, Z, U, V):
-    """ Update Z in Poisson models. """
-    assert R.shape == M.shape and R.shape[0] == U.shape[0] and R.shape[1] == V.shape[0]
-    n_list, p_list = poisson_Z_n_p(R=R, U=U, V=V, Omega=Omega)
-    for index,(i,j) in enumerate(Omega):
-        Z[i,j,:] = multinomial_draw(n=n_list[index], p=p_list[index])
+def update_Z_poisson(Omega, Z, U, V):
+    """ Update Z (|Omega|xK, one row per observed entry) in Poisson models. We 
+        draw all observed entries at once, and skip the entries with Rij = 0 
+        (for which Zij = 0 always). """
+    assert Omega.shape == (U.shape[0], V.shape[0]) and Z.shape == (Omega.size, U.shape[1])
+    nonzero = numpy.flatnonzero(Omega.values)
+    n_list, p_list = poisson_Z_n_p(Omega=Omega, U=U, V=V, entries=nonzero)
+    Z[nonzero,:] = multinomial_vector_draw(ns=n_list, ps=p_list)
     return Z    
     
     
 ''' (Gausian) Gaussian (univariate posterior) '''
-def update_U_gaussian_gaussian_univariate(lamb, R, M, U, V, tau):
+def update_U_gaussian_gaussian_univariate(lamb, residuals, U, V, tau):
     """ Update U for All Gaussian model (univariate posterior). """
-    I, K = R.shape[0], V.shape[1]
-    assert R.shape == M.shape and R.shape[1] == V.shape[0]
+    I, K = residuals.Omega.I, V.shape[1]
+    assert residuals.Omega.J == V.shape[0]
     for k in range(K):
-        muUk, tauUk = gaussian_gaussian_mu_tau(k=k, lamb=lamb, R=R, M=M, U=U, V=V, tau=tau)
+        muUk, tauUk = gaussian_gaussian_mu_tau(k=k, lamb=lamb, residuals=residuals, U=U, V=V, tau=tau)
+        Uk = numpy.zeros(I)
         for i in range(I):
-            U[i,k] = normal_draw(mu=muUk[i], tau=tauUk[i])
+            Uk[i] = normal_draw(mu=muUk[i], tau=tauUk[i])
+        residuals.update_column(Uk_old=U[:,k], Uk_new=Uk, Vk=V[:,k])
+        U[:,k] = Uk
     return U
 
-def update_V_gaussian_gaussian_univariate(lamb, R, M, U, V, tau):  
+def update_V_gaussian_gaussian_univariate(lamb, residuals, U, V, tau):  
     """ Update V for All Gaussian model (univariate posterior). """
-    return update_U_gaussian_gaussian_univariate(lamb=lamb, R=R.T, M=M.T, U=V, V=U, tau=tau)
+    return update_U_gaussian_gaussian_univariate(lamb=lamb, residuals=residuals.T, U=V, V=U, tau=tau)
 
 
 ''' (Gaussian) Gaussian (multivariate posterior) '''
-def update_U_gaussian_gaussian_multivariate(lamb, R, M, V, tau):
+def update_U_gaussian_gaussian_multivariate(lamb, residuals, V, tau):
     """ Update U for All Gaussian model (multivariate posterior). """
-    I, K = R.shape[0], V.shape[1]
-    assert R.shape == M.shape and R.shape[1] == V.shape[0]
-    U = numpy.zeros((I,K))
-    for i in range(I):
-        muUi, sigmaUi = gaussian_gaussian_mu_sigma(lamb=lamb, Ri=R[i], Mi=M[i], V=V, tau=tau)
-        U[i,:] = multivariate_normal_draw(mu=muUi, sigma=sigmaUi)
+    assert residuals.Omega.J == V.shape[0]
+    muU, precisionU_cholesky = gaussian_gaussian_mus_precisions(lamb=lamb, Omega=residuals.Omega, V=V, tau=tau)
+    U = multivariate_normal_vector_draw(mus=muU, precisions_cholesky=precisionU_cholesky)
+    residuals.refresh(U=U, V=V)
     return U
     
-#def update_U_gaussian_gaussian_multivariate(lamb, R, M, V, tau):
-#    """ Update U for All Gaussian model (multivariate posterior). """
-#    I, K = R.shape[0], V.shape[1]
-#    assert R.shape == M.shape and R.shape[1] == V.shape[0]
-#    U = numpy.zeros((I,K))
-#    muU, sigmaU = gaussian_gaussian_mu_sigma(lamb=lamb, R=R, M=M, V=V, tau=tau)
-#    for i in range(I):
-#        muUi, sigmaUi = gaussian_gaussian_mu_sigma_2(lamb, Ri=R[i], Mi=M[i], V=V, tau=tau)
-#        assert numpy.array_equal(muU[i], muUi) and numpy.array_equal(sigmaU[i], sigmaUi)
-#        U[i,:] = multivariate_normal_draw(mu=muU[i], sigma=sigmaU[i])
-#    return U
-
-def update_V_gaussian_gaussian_multivariate(lamb, R, M, U, tau):  
+def update_V_gaussian_gaussian_multivariate(lamb, residuals, U, tau):  
     """ Update V for All Gaussian model (multivariate posterior). """
-    return update_U_gaussian_gaussian_multivariate(lamb=lamb, R=R.T, M=M.T, V=U, tau=tau)
+    return update_U_gaussian_gaussian_multivariate(lamb=lamb, residuals=residuals.T, V=U, tau=tau)
 
 
 ''' (Gaussian) Gaussian + Wishart '''
-def update_U_gaussian_gaussian_wishart(muU, sigmaU, R, M, V, tau):
+def update_U_gaussian_gaussian_wishart(muU, sigmaU, residuals, V, tau):
     """ Update U for All Gaussian + Wishart model. """
-    I, K = R.shape[0], V.shape[1]
-    assert R.shape == M.shape and R.shape[1] == V.shape[0]
+    I, K = residuals.Omega.I, V.shape[1]
+    assert residuals.Omega.J == V.shape[0]
     assert muU.shape == (K,) and sigmaU.shape == (K,K)
     sigmaU_inv = numpy.linalg.inv(sigmaU)
-    U = numpy.zeros((I,K))
-    for i in range(I):
-        muUi, sigmaUi = gaussian_gaussian_wishart_mu_sigma(
-            muU=muU, sigmaU_inv=sigmaU_inv, Ri=R[i], Mi=M[i], V=V, tau=tau)
-        U[i,:] = multivariate_normal_draw(mu=muUi, sigma=sigmaUi)
+    muU_s, precisionU_s_cholesky = gaussian_gaussian_wishart_mus_precisions(
+        muU=muU, sigmaU_inv=sigmaU_inv, Omega=residuals.Omega, V=V, tau=tau)
+    U = multivariate_normal_vector_draw(mus=muU_s, precisions_cholesky=precisionU_s_cholesky)
+    residuals.refresh(U=U, V=V)
     return U
 
-def update_V_gaussian_gaussian_wishart(muV, sigmaV, R, M, U, tau):  
+def update_V_gaussian_gaussian_wishart(muV, sigmaV, residuals, U, tau):  
     """ Update V for All Gaussian + Wishart model. """
     return update_U_gaussian_gaussian_wishart(
-        muU=muV, sigmaU=sigmaV, R=R.T, M=M.T, V=U, tau=tau)
+        muU=muV, sigmaU=sigmaV, residuals=residuals.T, V=U, tau=tau)
 
 def update_muU_sigmaU_gaussian_gaussian_wishart(mu0, beta0, v0, W0, U):
     """ Update muU and sigmaU for All Gaussian + Wishart model. """
@@ -171,20 +167,17 @@ def update_muV_sigmaV_gaussian_gaussian_wishart(mu0, beta0, v0, W0, V):
     
 
 ''' (Gaussian) Gaussian + Automatic Relevance Determination '''
-def update_U_gaussian_gaussian_multivariate_ard(lamb, R, M, V, tau):
+def update_U_gaussian_gaussian_multivariate_ard(lamb, residuals, V, tau):
     """ Update U for All Gaussian + ARD model. """
-    I, K = R.shape[0], V.shape[1]
-    assert R.shape == M.shape and R.shape[1] == V.shape[0]
-    U = numpy.zeros((I,K))
-    for i in range(I):
-        muUi, sigmaUi = gaussian_gaussian_ard_mu_sigma(
-            lamb=lamb, Ri=R[i], Mi=M[i], V=V, tau=tau)
-        U[i,:] = multivariate_normal_draw(mu=muUi, sigma=sigmaUi)
+    assert residuals.Omega.J == V.shape[0]
+    muU, precisionU_cholesky = gaussian_gaussian_ard_mus_precisions(lamb=lamb, Omega=residuals.Omega, V=V, tau=tau)
+    U = multivariate_normal_vector_draw(mus=muU, precisions_cholesky=precisionU_cholesky)
+    residuals.refresh(U=U, V=V)
     return U
     
-def update_V_gaussian_gaussian_multivariate_ard(lamb, R, M, U, tau):
+def update_V_gaussian_gaussian_multivariate_ard(lamb, residuals, U, tau):
     """ Update V for All Gaussian + ARD model. """
-    return update_U_gaussian_gaussian_multivariate_ard(lamb=lamb, R=R.T, M=M.T, V=U, tau=tau)
+    return update_U_gaussian_gaussian_multivariate_ard(lamb=lamb, residuals=residuals.T, V=U, tau=tau)
 
 def update_lambda_gaussian_gaussian_ard(alpha0, beta0, U, V):
     """ Update lambda (vector) for All Gaussian + ARD model. """
@@ -198,35 +191,39 @@ def update_lambda_gaussian_gaussian_ard(alpha0, beta0, U, V):
 
 
 ''' (Gaussian) L^2_1 '''
-def update_U_gaussian_l21(lamb, R, M, U, V, tau):
+def update_U_gaussian_l21(lamb, residuals, U, V, tau):
     """ Update U for Gaussian + L^2_1 Prior model. """
     I, K = U.shape
-    assert R.shape == M.shape and R.shape[0] == U.shape[0] and R.shape[1] == V.shape[0]
+    assert residuals.Omega.shape == (U.shape[0], V.shape[0])
     for k in range(K):
-        muUk, tauUk = gaussian_l21_mu_tau(k=k, lamb=lamb, R=R, M=M, U=U, V=V, tau=tau)
-        U[:,k] = truncated_normal_vector_draw(mus=muUk, taus=tauUk)
+        muUk, tauUk = gaussian_l21_mu_tau(k=k, lamb=lamb, residuals=residuals, U=U, V=V, tau=tau)
+        Uk = truncated_normal_vector_draw(mus=muUk, taus=tauUk)
+        residuals.update_column(Uk_old=U[:,k], Uk_new=Uk, Vk=V[:,k])
+        U[:,k] = Uk
     return U
     
-def update_V_gaussian_l21(lamb, R, M, U, V, tau):
+def update_V_gaussian_l21(lamb, residuals, U, V, tau):
     """ Update V for Gaussian + Exponential model. """
-    return update_U_gaussian_l21(lamb=lamb, R=R.T, M=M.T, U=V, V=U, tau=tau)
+    return update_U_gaussian_l21(lamb=lamb, residuals=residuals.T, U=V, V=U, tau=tau)
 
 
 ''' (Gaussian) Laplace '''
-def update_U_gaussian_laplace(lambdaU, R, M, V, tau):
+def update_U_gaussian_laplace(lambdaU, residuals, V, tau):
     """ Update U for Gaussian + Laplace model. """
-    I, K = R.shape[0], V.shape[1]
-    assert R.shape == M.shape and R.shape[1] == V.shape[0]
+    I, K = residuals.Omega.I, V.shape[1]
+    assert residuals.Omega.J == V.shape[0]
     U = numpy.zeros((I,K))
     for i in range(I):
+        js, Ri = residuals.Omega.row(i)
         muUi, precisionUi = gaussian_laplace_mu_precision(
-            Ri=R[i], Mi=M[i], V=V, lambdaUi=lambdaU[i,:], tau=tau)
+            Ri=Ri, Vi=V[js], lambdaUi=lambdaU[i,:], tau=tau)
         U[i,:] = multivariate_normal_draw(mu=muUi, precision=precisionUi)
+    residuals.refresh(U=U, V=V)
     return U
 
-def update_V_gaussian_laplace(lambdaV, R, M, U, tau):
+def update_V_gaussian_laplace(lambdaV, residuals, U, tau):
     """ Update V for Gaussian + Laplace model. """
-    return update_U_gaussian_laplace(lambdaU=lambdaV, R=R.T, M=M.T, V=U, tau=tau)
+    return update_U_gaussian_laplace(lambdaU=lambdaV, residuals=residuals.T, V=U, tau=tau)
 
 def update_lambdaU_gaussian_laplace(U, etaU):
     """ Update lambdaU for Gaussian + Laplace model. """
@@ -258,66 +255,84 @@ def update_etaV_gaussian_laplace(lambdaV, a, b):
 
 
 ''' (Gaussian) Volume Prior '''
-def update_U_gaussian_volumeprior(gamma, R, M, U, V, tau):
+def update_U_gaussian_volumeprior(gamma, residuals, U, V, tau):
     """ Update U for Gaussian + Volume Prior model. """
     I, K = U.shape
-    assert R.shape == M.shape and R.shape[0] == U.shape[0] and R.shape[1] == V.shape[0]
-    for i,k in itertools.product(range(I),range(K)):
-        muUik, tauUik = gaussian_gaussian_volumeprior_mu_sigma(
-            i=i, k=k, gamma=gamma, Ri=R[i,:], Mi=M[i,:], U=U, V=V, tau=tau)
-        U[i,k] = normal_draw(mu=muUik, tau=tauUik)
+    assert residuals.Omega.shape == (U.shape[0], V.shape[0])
+    gram = Gram(U)
+    for i in range(I):
+        gram.factorise()
+        js, Ri = residuals.Omega.row(i)
+        for k in range(K):
+            muUik, tauUik = gaussian_gaussian_volumeprior_mu_sigma(
+                i=i, k=k, gamma=gamma, Ri=Ri, Vi=V[js], U=U, tau=tau, gram=gram)
+            Uik = normal_draw(mu=muUik, tau=tauUik)
+            gram.update_entry(Ui=U[i], k=k, Uik_new=Uik)
+            U[i,k] = Uik
+    residuals.refresh(U=U, V=V)
     return U
     
-def update_V_gaussian_volumeprior(gamma, R, M, U, V, tau):
+def update_V_gaussian_volumeprior(gamma, residuals, U, V, tau):
     """ Update V for Gaussian + Volume Prior model. """
-    return update_U_gaussian_volumeprior(gamma=gamma, R=R.T, M=M.T, U=V, V=U, tau=tau)
+    return update_U_gaussian_volumeprior(gamma=gamma, residuals=residuals.T, U=V, V=U, tau=tau)
 
 
 ''' (Gausian) Gaussian + Volume Prior '''
-def update_U_gaussian_volumeprior_nonnegative(gamma, R, M, U, V, tau):
+def update_U_gaussian_volumeprior_nonnegative(gamma, residuals, U, V, tau):
     """ Update U for Gaussian + nonnegative Volume Prior model. """
     I, K = U.shape
-    assert R.shape == M.shape and R.shape[0] == U.shape[0] and R.shape[1] == V.shape[0]
-    for i,k in itertools.product(range(I),range(K)):
-        muUik, tauUik = gaussian_gaussian_volumeprior_mu_sigma(
-            i=i, k=k, gamma=gamma, Ri=R[i,:], Mi=M[i,:], U=U, V=V, tau=tau)
-        U[i,k] = truncated_normal_draw(mu=muUik, tau=tauUik)
+    assert residuals.Omega.shape == (U.shape[0], V.shape[0])
+    gram = Gram(U)
+    for i in range(I):
+        gram.factorise()
+        js, Ri = residuals.Omega.row(i)
+        for k in range(K):
+            muUik, tauUik = gaussian_gaussian_volumeprior_mu_sigma(
+                i=i, k=k, gamma=gamma, Ri=Ri, Vi=V[js], U=U, tau=tau, gram=gram)
+            Uik = truncated_normal_draw(mu=muUik, tau=tauUik)
+            gram.update_entry(Ui=U[i], k=k, Uik_new=Uik)
+            U[i,k] = Uik
+    residuals.refresh(U=U, V=V)
     return U
     
-def update_V_gaussian_volumeprior_nonnegative(gamma, R, M, U, V, tau):
+def update_V_gaussian_volumeprior_nonnegative(gamma, residuals, U, V, tau):
     """ Update V for All Gaussian + nonnegative Volume Prior model. """
     return update_U_gaussian_volumeprior_nonnegative(
-        gamma=gamma, R=R.T, M=M.T, U=V, V=U, tau=tau)
+        gamma=gamma, residuals=residuals.T, U=V, V=U, tau=tau)
 
 
 ''' (Gaussian) Exponential '''
-def update_U_gaussian_exponential(lamb, R, M, U, V, tau):
+def update_U_gaussian_exponential(lamb, residuals, U, V, tau):
     """ Update U for Gaussian + Exponential model. """
     I, K = U.shape
-    assert R.shape == M.shape and R.shape[0] == U.shape[0] and R.shape[1] == V.shape[0]
+    assert residuals.Omega.shape == (U.shape[0], V.shape[0])
     for k in range(K):
-        muUk, tauUk = gaussian_exponential_mu_tau(k=k, lamb=lamb, R=R, M=M, U=U, V=V, tau=tau)
-        U[:,k] = truncated_normal_vector_draw(mus=muUk, taus=tauUk)
+        muUk, tauUk = gaussian_exponential_mu_tau(k=k, lamb=lamb, residuals=residuals, U=U, V=V, tau=tau)
+        Uk = truncated_normal_vector_draw(mus=muUk, taus=tauUk)
+        residuals.update_column(Uk_old=U[:,k], Uk_new=Uk, Vk=V[:,k])
+        U[:,k] = Uk
     return U
     
-def update_V_gaussian_exponential(lamb, R, M, U, V, tau):
+def update_V_gaussian_exponential(lamb, residuals, U, V, tau):
     """ Update V for Gaussian + Exponential model. """
-    return update_U_gaussian_exponential(lamb=lamb, R=R.T, M=M.T, U=V, V=U, tau=tau)
+    return update_U_gaussian_exponential(lamb=lamb, residuals=residuals.T, U=V, V=U, tau=tau)
     
 
 ''' (Gaussian) Exponential + Automatic Relevance Determination '''
-def update_U_gaussian_exponential_ard(lamb, R, M, U, V, tau):
+def update_U_gaussian_exponential_ard(lamb, residuals, U, V, tau):
     """ Update U for Gaussian + Exponential + ARD model. """
     I, K = U.shape
-    assert R.shape == M.shape and R.shape[0] == U.shape[0] and R.shape[1] == V.shape[0]
+    assert residuals.Omega.shape == (U.shape[0], V.shape[0])
     for k in range(K):
-        muUk, tauUk = gaussian_exponential_ard_mu_tau(k=k, lambdak=lamb[k], R=R, M=M, U=U, V=V, tau=tau)
-        U[:,k] = truncated_normal_vector_draw(mus=muUk, taus=tauUk)
+        muUk, tauUk = gaussian_exponential_ard_mu_tau(k=k, lambdak=lamb[k], residuals=residuals, U=U, V=V, tau=tau)
+        Uk = truncated_normal_vector_draw(mus=muUk, taus=tauUk)
+        residuals.update_column(Uk_old=U[:,k], Uk_new=Uk, Vk=V[:,k])
+        U[:,k] = Uk
     return U
     
-def update_V_gaussian_exponential_ard(lamb, R, M, U, V, tau):
+def update_V_gaussian_exponential_ard(lamb, residuals, U, V, tau):
     """ Update V for Gaussian + Exponential + ARD model. """
-    return update_U_gaussian_exponential_ard(lamb=lamb, R=R.T, M=M.T, U=V, V=U, tau=tau)
+    return update_U_gaussian_exponential_ard(lamb=lamb, residuals=residuals.T, U=V, V=U, tau=tau)
     
 def update_lambda_gaussian_exponential_ard(alpha0, beta0, U, V):
     """ Update lambda (vector) for Gaussian + Exponential + ARD model. """
@@ -331,37 +346,41 @@ def update_lambda_gaussian_exponential_ard(alpha0, beta0, U, V):
     
 
 ''' (Gaussian) Truncated Normal '''
-def update_U_gaussian_truncatednormal(muU, tauU, R, M, U, V, tau):
+def update_U_gaussian_truncatednormal(muU, tauU, residuals, U, V, tau):
     """ Update U for Gaussian + Truncated Normal model. """
     I, K = U.shape
-    assert R.shape == M.shape and R.shape[0] == U.shape[0] and R.shape[1] == V.shape[0]
+    assert residuals.Omega.shape == (U.shape[0], V.shape[0])
     for k in range(K):
         muUk_s, tauUk_s = gaussian_tn_mu_tau(
-            k=k, muU=muU, tauU=tauU, R=R, M=M, U=U, V=V, tau=tau)
-        U[:,k] = truncated_normal_vector_draw(mus=muUk_s, taus=tauUk_s)
+            k=k, muU=muU, tauU=tauU, residuals=residuals, U=U, V=V, tau=tau)
+        Uk = truncated_normal_vector_draw(mus=muUk_s, taus=tauUk_s)
+        residuals.update_column(Uk_old=U[:,k], Uk_new=Uk, Vk=V[:,k])
+        U[:,k] = Uk
     return U
     
-def update_V_gaussian_truncatednormal(muV, tauV, R, M, U, V, tau):
+def update_V_gaussian_truncatednormal(muV, tauV, residuals, U, V, tau):
     """ Update V for Gaussian + Truncated Normal model. """
     return update_U_gaussian_truncatednormal(
-        muU=muV, tauU=tauV, R=R.T, M=M.T, U=V, V=U, tau=tau)
+        muU=muV, tauU=tauV, residuals=residuals.T, U=V, V=U, tau=tau)
 
 
 ''' (Gaussian) Truncated Normal + hierarchical '''
-def update_U_gaussian_truncatednormal_hierarchical(muU, tauU, R, M, U, V, tau):
+def update_U_gaussian_truncatednormal_hierarchical(muU, tauU, residuals, U, V, tau):
     """ Update U for Gaussian + Truncated Normal + hierarchical model. """
     I, K = U.shape
-    assert R.shape == M.shape and R.shape[0] == U.shape[0] and R.shape[1] == V.shape[0]
+    assert residuals.Omega.shape == (U.shape[0], V.shape[0])
     for k in range(K):
         muUk_s, tauUk_s = gaussian_tn_hierarchical_mu_tau(
-            k=k, muUk=muU[:,k], tauUk=tauU[:,k], R=R, M=M, U=U, V=V, tau=tau)
-        U[:,k] = truncated_normal_vector_draw(mus=muUk_s, taus=tauUk_s)
+            k=k, muUk=muU[:,k], tauUk=tauU[:,k], residuals=residuals, U=U, V=V, tau=tau)
+        Uk = truncated_normal_vector_draw(mus=muUk_s, taus=tauUk_s)
+        residuals.update_column(Uk_old=U[:,k], Uk_new=Uk, Vk=V[:,k])
+        U[:,k] = Uk
     return U
     
-def update_V_gaussian_truncatednormal_hierarchical(muV, tauV, R, M, U, V, tau):
+def update_V_gaussian_truncatednormal_hierarchical(muV, tauV, residuals, U, V, tau):
     """ Update V for Gaussian + Truncated Normal + hierarchical model. """
     return update_U_gaussian_truncatednormal_hierarchical(
-        muU=muV, tauU=tauV, R=R.T, M=M.T, U=V, V=U, tau=tau)
+        muU=muV, tauU=tauV, residuals=residuals.T, U=V, V=U, tau=tau)
     
 def update_muU_gaussian_truncatednormal_hierarchical(mu_mu, tau_mu, U, tauU):
     """ Update muU (matrix) for Gaussian + Truncated Normal + hierarchical model. """
@@ -394,31 +413,32 @@ def update_tauV_gaussian_truncatednormal_hierarchical(a, b, V, muV):
 
 
 ''' (Gaussian) Half Normal '''
-def update_U_gaussian_halfnormal(sigma, R, M, U, V, tau):
+def update_U_gaussian_halfnormal(sigma, residuals, U, V, tau):
     """ Update U for Gaussian + Half Normal model. """
     I, K = U.shape
-    assert R.shape == M.shape and U.shape[0] == R.shape[0] and V.shape[0] == R.shape[1]
+    assert residuals.Omega.shape == (U.shape[0], V.shape[0])
     for k in range(K):
         muUk_s, tauUk_s = gaussian_hn_mu_tau(
-            k=k, sigma=sigma, R=R, M=M, U=U, V=V, tau=tau)
-        U[:,k] = truncated_normal_vector_draw(mus=muUk_s, taus=tauUk_s)
+            k=k, sigma=sigma, residuals=residuals, U=U, V=V, tau=tau)
+        Uk = truncated_normal_vector_draw(mus=muUk_s, taus=tauUk_s)
+        residuals.update_column(Uk_old=U[:,k], Uk_new=Uk, Vk=V[:,k])
+        U[:,k] = Uk
     return U
     
-def update_V_gaussian_halfnormal(sigma, R, M, U, V, tau):
+def update_V_gaussian_halfnormal(sigma, residuals, U, V, tau):
     """ Update V for Gaussian + Half Normal model. """
-    return update_U_gaussian_halfnormal(sigma=sigma, R=R.T, M=M.T, U=V, V=U, tau=tau)
+    return update_U_gaussian_halfnormal(sigma=sigma, residuals=residuals.T, U=V, V=U, tau=tau)
 
 
 
 ''' (Poisson) Gamma '''
-def update_U_poisson_gamma(a, b, M, V, Z):
+def update_U_poisson_gamma(a, b, Omega, V, Z):
     """ Update U for Poisson + Gamma model. """
-    I, J, K = Z.shape
-    assert V.shape == (J,K) and M.shape == (I,J)
-    U = numpy.zeros((I,K))
-    for i,k in itertools.product(range(I),range(K)):
-        (a_s, b_s) = poisson_gamma_a_b(a=a, b=b, Mi=M[i,:], Vk=V[:,k], Zik=Z[i,:,k]) 
-        U[i,k] = gamma_draw(alpha=a_s, beta=b_s)
+    (I, J), K = Omega.shape, V.shape[1]
+    assert V.shape == (J,K) and Z.shape == (Omega.size,K)
+    Z_sums, V_sums = poisson_Ui_sums(Omega=Omega, V=V, Z=Z)
+    a_s, b_s = poisson_gamma_a_b(a=a, b=b, Z_sums=Z_sums, V_sums=V_sums) 
+    U = gamma_vector_draw(alphas=a_s, betas=b_s)
     return U
     
 #def update_U_poisson_gamma(a, b, M, V, Z):
@@ -431,34 +451,30 @@ def update_U_poisson_gamma(a, b, M, V, Z):
 #        U[i,k] = gamma_draw(alpha=a_s[i,k], beta=b_s[i,k])
 #    return U
     
-def update_V_poisson_gamma(a, b, M, U, Z):
+def update_V_poisson_gamma(a, b, Omega, U, Z):
     """ Update V for Poisson + Gamma model. """
-    return update_U_poisson_gamma(a=a, b=b, M=M.T, V=U, Z=Z.transpose(1,0,2))
+    return update_U_poisson_gamma(a=a, b=b, Omega=Omega.T, V=U, Z=Z)
     
     
 ''' (Poisson) Gamma + hierarchical '''
-def update_U_poisson_gamma_hierarchical(a, hU, M, V, Z):
+def update_U_poisson_gamma_hierarchical(a, hU, Omega, V, Z):
     """ Update U for Poisson + Gamma + hierarchical model. """
-    I, J, K = Z.shape
-    assert hU.shape == (I,) and V.shape == (J,K)
-    U = numpy.zeros((I,K))
-    for i,k in itertools.product(range(I),range(K)):
-        (a_s, b_s) = poisson_gamma_hierarchical_a_b(
-            a=a, hUi=hU[i], Mi=M[i,:], Vk=V[:,k], Zik=Z[i,:,k])
-        U[i,k] = gamma_draw(alpha=a_s, beta=b_s)
+    (I, J), K = Omega.shape, V.shape[1]
+    assert hU.shape == (I,) and V.shape == (J,K) and Z.shape == (Omega.size,K)
+    Z_sums, V_sums = poisson_Ui_sums(Omega=Omega, V=V, Z=Z)
+    a_s, b_s = poisson_gamma_hierarchical_a_b(a=a, hU=hU, Z_sums=Z_sums, V_sums=V_sums)
+    U = gamma_vector_draw(alphas=a_s, betas=b_s)
     return U
 
-def update_V_poisson_gamma_hierarchical(a, hV, M, U, Z):
+def update_V_poisson_gamma_hierarchical(a, hV, Omega, U, Z):
     """ Update V for Poisson + Gamma + hierarchical model. """
-    return update_U_poisson_gamma_hierarchical(a=a, hU=hV, M=M.T, V=U, Z=Z.transpose(1,0,2))
+    return update_U_poisson_gamma_hierarchical(
+        a=a, hU=hV, Omega=Omega.T, V=U, Z=Z)
     
 def update_hU_poisson_gamma_hierarchical(ap, bp, a, U):
     """ Update hU (vector) for Poisson + Gamma + hierarchical model. """
-    I, K = U.shape
-    hU = numpy.zeros(I)
-    for i in range(I):
-        (a_s, b_s) = gamma_hierarchical_hUi_a_b(ap=ap, bp=bp, a=a, Ui=U[i,:])
-        hU[i] = gamma_draw(alpha=a_s, beta=b_s)
+    a_s, b_s = gamma_hierarchical_hU_a_b(ap=ap, bp=bp, a=a, U=U)
+    hU = gamma_vector_draw(alphas=a_s, betas=b_s)
     return hU
 
 def update_hV_poisson_gamma_hierarchical(ap, bp, a, V):
@@ -467,16 +483,17 @@ def update_hV_poisson_gamma_hierarchical(ap, bp, a, V):
     
 
 ''' (Poisson) Dirichlet '''
-def update_U_poisson_dirichlet(alpha, M, Z):
+def update_U_poisson_dirichlet(alpha, Omega, Z):
     """ Update U for Poisson + Dirichlet model. """
-    I, J, K = Z.shape
-    assert M.shape == (I,J) and alpha.shape == (K,)
+    I, K = Omega.I, alpha.shape[0]
+    assert Z.shape == (Omega.size,K)
     U = numpy.zeros((I,K))
+    Z_sums = Omega.row_sums(Z)
     for i in range(I):
-        alpha_s = poisson_dirichlet_alpha(alpha=alpha, Mi=M[i], Zi=Z[i,:,:])
+        alpha_s = poisson_dirichlet_alpha(alpha=alpha, Zi_sum=Z_sums[i])
         U[i,:] = dirichlet_draw(alpha=alpha_s)
     return U
         
-def update_V_poisson_dirichlet(alpha, M, Z):
+def update_V_poisson_dirichlet(alpha, Omega, Z):
     """ Update V for Poisson + Dirichlet model. """
-    return update_U_poisson_dirichlet(alpha=alpha, M=M.T, Z=Z.transpose(1,0,2))
\ No newline at end of file
+    return update_U_poisson_dirichlet(alpha=alpha, Omega=Omega.T, Z=Z)
\ No newline at end of file
@@ -20,19 +20,12 @@ class ColumnAverage(BMF):
         
     def run(self,iterations):
         """ Compute the row averages of R. """
-        column_averages = []
-        for j in range(self.J):
-            Rj_masked = [self.R[i,j] for i in range(self.I) if self.M[i,j]]
-            average = numpy.average(Rj_masked)
-            column_averages.append(average)
-        self.column_averages = numpy.array(column_averages)
+        self.column_averages = self.Omega.T.row_sums(self.Omega.values) / self.Omega.T.counts
         
             
-    """ Override the predict() method to use the row averages. """
-    def predict(self,M_pred,burn_in,thinning):
+    """ Override the predict_entries() method to use the row averages. """
+    def predict_entries(self,M_pred,burn_in,thinning,posterior_predictive=False):
         """ Use the row averages predict missing values. """
-        R_pred = numpy.reshape(numpy.repeat(self.column_averages, self.I), (self.J, self.I)).T
-        MSE = self.compute_MSE(M_pred,self.R,R_pred)
-        R2 = self.compute_R2(M_pred,self.R,R_pred)    
-        Rp = self.compute_Rp(M_pred,self.R,R_pred)        
-        return {'MSE':MSE,'R^2':R2,'Rp':Rp}
\ No newline at end of file
+        Omega_pred = self.observations(M_pred)
+        R_pred = self.column_averages[Omega_pred.cols]
+        return (Omega_pred, R_pred)
\ No newline at end of file
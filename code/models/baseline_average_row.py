@@ -21,19 +21,12 @@ class RowAverage(BMF):
         
     def run(self,iterations):
         """ Compute the row averages of R. """
-        row_averages = []
-        for i in range(self.I):
-            Ri_masked = [self.R[i,j] for j in range(self.J) if self.M[i,j]]
-            average = numpy.average(Ri_masked)
-            row_averages.append(average)
-        self.row_averages = numpy.array(row_averages)
+        self.row_averages = self.Omega.row_sums(self.Omega.values) / self.Omega.counts
         
             
-    """ Override the predict() method to use the row averages. """
-    def predict(self,M_pred,burn_in,thinning):
+    """ Override the predict_entries() method to use the row averages. """
+    def predict_entries(self,M_pred,burn_in,thinning,posterior_predictive=False):
         """ Use the row averages predict missing values. """
-        R_pred = numpy.reshape(numpy.repeat(self.row_averages, self.J), (self.I, self.J))
-        MSE = self.compute_MSE(M_pred,self.R,R_pred)
-        R2 = self.compute_R2(M_pred,self.R,R_pred)    
-        Rp = self.compute_Rp(M_pred,self.R,R_pred)        
-        return {'MSE':MSE,'R^2':R2,'Rp':Rp}
\ No newline at end of file
+        Omega_pred = self.observations(M_pred)
+        R_pred = self.row_averages[Omega_pred.rows]
+        return (Omega_pred, R_pred)
\ No newline at end of file
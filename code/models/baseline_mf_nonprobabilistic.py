@@ -14,6 +14,8 @@ Or more efficiently using matrix operations:
 And realising that elements in each column in U and V are independent:
 - U.k <- U.k * sum(M * [V.k * (R / (U dot V.T))], axis=1) / sum(M dot V.k, axis=1)
 - V.k <- V.k * sum(M * [U.k * (R / (U dot V.T))], axis=0) / sum(M dot U.k, axis=0)
+We compute these sums over the observed entries in Omega only, so the V updates
+are the U updates on Omega.T.
 
 We expect the following arguments:
 - R, the matrix
@@ -32,7 +34,6 @@ from Gibbs.distributions.exponential import exponential_draw
 
 import itertools
 import numpy
-import time
 
 METRICS = ['MSE', 'R^2', 'Rp']
 OPTIONS_INIT = ['ones', 'random', 'exponential']
@@ -46,16 +47,11 @@ class MF_Nonprobabilistic(BMF):
         """ Set up the class. """
         super(MF_Nonprobabilistic, self).__init__(R, M, K)
         self.exponential_prior = hyperparameters.get('exponential_prior',  DEFAULT_HYPERPARAMETERS['exponential_prior'])
+        self.hyperparameters = { 'exponential_prior': self.exponential_prior }
                    
         # Add a tiny amount of each R value, to prevent NaN to come up if an  
         # entire row/column in R is just 0.'s
-        self.R += MINIMUM_R
-        
-        # For computing the I-div it is easier if unknown values are 1's, not 0's, to avoid numerical issues
-        self.R_excl_unknown = numpy.empty((self.I,self.J))
-        for i,j in itertools.product(range(0,self.I),range(0,self.J)):
-            self.R_excl_unknown[i,j] = self.R[i,j] if self.M[i,j] else 1.
-                    
+        self.Omega.values += MINIMUM_R
                 
                       
     def initialise(self,init):
@@ -81,13 +77,7 @@ class MF_Nonprobabilistic(BMF):
     def run(self,iterations):
         """ Run the Gibbs sampler for the specified number of iterations. """
         assert hasattr(self,'U') and hasattr(self,'V'), "U and V have not been initialised - please run initialise() first."        
-        self.all_U = numpy.zeros((iterations,self.I,self.K))  
-        self.all_V = numpy.zeros((iterations,self.J,self.K))
-        self.all_times = []
-        self.all_performances = { metric: [] for metric in METRICS } 
-            
-        time_start = time.time()
-        for it in range(iterations):
+        for it in self.iterate(iterations, METRICS, U=(self.I,self.K), V=(self.J,self.K)):
             # Update the matrices U, V
             for k in range(self.K):
                 self.update_U(k)
@@ -95,35 +85,31 @@ class MF_Nonprobabilistic(BMF):
                 self.update_V(k)
             
             # Store the values
-            self.all_U[it], self.all_V[it] = numpy.copy(self.U), numpy.copy(self.V)
-            
-            # Print the performance, store performance and time
-            perf = self.predict_while_running()
-            for metric in METRICS:
-                self.all_performances[metric].append(perf[metric])
-            time_iteration = time.time()
-            self.all_times.append(time_iteration-time_start)   
-            print "Iteration %s. MSE: %s. R^2: %s. Rp: %s." % (it+1,perf['MSE'],perf['R^2'],perf['Rp'])
+            self.store_draws(it, U=self.U, V=self.V)
             
 
     ''' Updates for U and V. '''
     def update_U(self,k):
         ''' Update values for U. '''
-        self.U[:,k] = self.U[:,k] * (self.M * (self.V[:,k] * ( self.R / numpy.dot(self.U,self.V.T) ) )).sum(axis=1) / (self.M * self.V[:,k]).sum(axis=1)
+        self.U[:,k] = self.multiplicative_update(k=k, Omega=self.Omega, U=self.U, V=self.V)
         
     def update_V(self,k):
         ''' Update values for V. '''
-        self.V[:,k] = self.V[:,k] * ( (self.U[:,k] * ( self.R / numpy.dot(self.U,self.V.T) ).T ).T * self.M ).sum(axis=0) / (self.U[:,k] * self.M.T).T.sum(axis=0)
+        self.V[:,k] = self.multiplicative_update(k=k, Omega=self.Omega.T, U=self.V, V=self.U)
+        
+    def multiplicative_update(self,k,Omega,U,V):
+        ''' Return the new values for U.k, using the observed entries in Omega. '''
+        Vk = V[Omega.cols,k]
+        ratio = Omega.values / Omega.predict(U,V)
+        return U[:,k] * Omega.row_sums(Vk * ratio) / Omega.row_sums(Vk)
         
         
-    ''' Override the predict() method to simply use U and V directly. '''
-    def predict(self,M_pred,burn_in,thinning):
+    ''' Override the predict_entries() method to simply use U and V directly. '''
+    def predict_entries(self,M_pred,burn_in,thinning,posterior_predictive=False):
         ''' Use U and V to predict missing values. '''
-        R_pred = numpy.dot(self.U, self.V.T)
-        MSE = self.compute_MSE(M_pred,self.R,R_pred)
-        R2 = self.compute_R2(M_pred,self.R,R_pred)    
-        Rp = self.compute_Rp(M_pred,self.R,R_pred)        
-        return {'MSE':MSE,'R^2':R2,'Rp':Rp}
+        Omega_pred = self.observations(M_pred)
+        R_pred = Omega_pred.predict(self.U,self.V)
+        return (Omega_pred, R_pred)
     
     
     ''' Override the approx_expectation_UV() method to simply return the final U, V. '''
@@ -8,41 +8,129 @@ Each specific model should extend this class, and implement methods:
 USAGE
     BMF = bmf_gibbs(R, M, K, hyperparameters)
     BMF.initialise(init)
+    BMF.set_evaluation(every, sink)
     BMF.run(it)
     performance = BMF.predict(M_pred, burn_in, thinning)
+    performance = BMF.predict(M_pred, burn_in, thinning, posterior_predictive=True)
+    Omega_pred, R_pred = BMF.predict_entries(M_pred, burn_in, thinning)
     U, V = BMF.approx_expectation_UV(burn_in, thinning)
+    Omega_pred, means, variances = BMF.posterior_predictive(M_pred, burn_in, thinning)
+    items, scores = BMF.recommend(users, n, burn_in, thinning, exclude_observed)
+    BMF.save(path, burn_in, thinning, samples)
+Or, to only keep the running mean and variance of the draws:
+    BMF.stream_draws(burn_in, thinning)
+    BMF.run(it)
+Or, to store the draws on disk (memory-mapped) rather than in memory:
+    BMF.memmap_draws(folder)
+    BMF.run(it)
+Or, to save the state of the sampler every so often, and continue the chain
+from the last checkpoint (e.g. after a job was pre-empted):
+    BMF.set_checkpoint(path, every)
+    BMF.run(it)
+    BMF = resume(path, extra_iterations)
 where
     R is the matrix with observed values
     M is the mask matrix indicating observed values (1) and unobserved (0)
+        (R and M can be numpy arrays or scipy.sparse matrices, or R can be the
+        Observations of the observed entries with M None - see chains.py)
     K is the number of latent factors
     hyperparameters is a dictionary defining the priors over U, V, tau, etc. (or {} if using defaults)
     init defines the method of initialising the random variables ('random' or 'expectation')
     iterations is the number of iterations we run the method for
     burn_in is the number of iterations we skip before estimating the expectation
     thinning indicates which iterations we thin out (after burn_in)
-    performance is a dictionary { 'MSE', 'R^2', 'Rp' }
+    performance is a dictionary { 'MSE', 'R^2', 'Rp', 'RMSE', 'MAE' } (see evaluation.py)
+    posterior_predictive indicates whether we predict using the average of 
+        U_s*V_s^T over the draws s (True), or using the average of U and V (False)
+    Omega_pred are the entries of M_pred (see Gibbs/observations.py), and R_pred
+        the vector of predictions for them
+    means and variances are the mean and variance of U_s,i*V_s,j over the 
+        draws s, for the entries (i,j) in Omega_pred (the entries of M_pred)
+    users is a list of row indices, and items and scores are (len(users) x n) 
+        arrays with for each user the n columns with the highest predictions, 
+        and those predictions, in descending order. If exclude_observed, the 
+        columns observed in M are skipped (and users with fewer than n other 
+        columns get score -inf for the remaining ones).
+    every is how often (in iterations) run() evaluates the performance on the 
+        observed entries - default 1, or 0/None to switch this off
+    sink is called as sink(it, performance) with each in-run evaluation - 
+        default print_performance, or None to only store them
+    path is the file we save the checkpoints to, every :every iterations 
+        (default None, for no checkpoints)
+    extra_iterations is the number of iterations we run after the checkpoint
+    samples indicates whether save() also stores the draws (see storage.py)
     
-The draw values are stored in all_U, all_V, all_tau, etc; performances in
-all_performances; and timestamps in all_times.
+The draw values are stored in traces (see Gibbs/traces.py), and can also be 
+accessed as all_U, all_V, all_tau, etc; performances are stored in 
+all_performances (one per evaluation, so every :every iterations); and 
+timestamps in all_times. Each model's run() loops over 
+iterate(), declaring its random variables, and stores them every iteration 
+with store_draws(). If stream_draws() was called, we only keep the running 
+mean and variance of the draws, and there are no all_U, all_V, etc. If 
+memmap_draws() was called, all_U, all_V, etc are memory-mapped files.
+
+A checkpoint is the pickled model (including the draws so far, or for 
+memmap_draws() the files they are in) together with the numpy random state, 
+so resume() continues the chain exactly as if it had not been stopped. The 
+evaluation sink is not saved, but can be passed to resume().
+
+The observed entries are stored in Omega (see Gibbs/observations.py), so that 
+the Gibbs updates only do work for the observed entries of R.
 """
 
-import numpy, math
+from Gibbs.observations import Observations
+from Gibbs.traces import Traces, StreamingTraces, MemmapTraces
+from evaluation import evaluate
+import storage
+
+import numpy, math, scipy.sparse, time, os, cPickle
+
+def print_performance(it,performance):
+    """ Default sink for the in-run evaluations: print the performance. """
+    print "Iteration %s. MSE: %s. R^2: %s. Rp: %s." % (
+        it+1,performance['MSE'],performance['R^2'],performance['Rp'])
+
+def resume(path,extra_iterations,sink=print_performance):
+    """ Load the model from the checkpoint :path, and continue its chain for 
+        :extra_iterations iterations after the checkpoint. Returns the model. """
+    with open(path, 'rb') as fin:
+        model = cPickle.load(fin)
+    numpy.random.set_state(model.random_state)
+    model.evaluation_sink = sink
+    model.resuming = True
+    model.run(model.iteration + extra_iterations)
+    return model
 
 class BMF(object):
     def __init__(self,R,M,K):
-        """ Set up the class. """
-        self.R = numpy.array(R,dtype=float)
-        self.M = numpy.array(M,dtype=float)
+        """ Set up the class. R can also be the Observations of the observed 
+            entries (and M None), which we then use as Omega without copying. """
         self.K = K
+        self.hyperparameters = {}
         
-        assert len(self.R.shape) == 2, "Input matrix R is not a two-dimensional array, " \
-            "but instead %s-dimensional." % len(self.R.shape)
-        assert self.R.shape == self.M.shape, "Input matrix R is not of the same size as " \
-            "the indicator matrix M: %s and %s respectively." % (self.R.shape,self.M.shape)
+        if isinstance(R, Observations):
+            assert M is None, "M should be None if R is given as Observations."
+            self.R, self.M = None, None
+            self.Omega = R
+        else:
+            self.R = scipy.sparse.csr_matrix(R,dtype=float) if scipy.sparse.issparse(R) \
+                     else numpy.array(R,dtype=float)
+            self.M = scipy.sparse.csr_matrix(M,dtype=float) if scipy.sparse.issparse(M) \
+                     else numpy.array(M,dtype=float)
             
-        (self.I,self.J) = self.R.shape
-        self.size_Omega = self.M.sum()
+            assert len(self.R.shape) == 2, "Input matrix R is not a two-dimensional array, " \
+                "but instead %s-dimensional." % len(self.R.shape)
+            assert self.R.shape == self.M.shape, "Input matrix R is not of the same size as " \
+                "the indicator matrix M: %s and %s respectively." % (self.R.shape,self.M.shape)
+            self.Omega = Observations.from_matrices(R=self.R, M=self.M)
+            
+        (self.I,self.J) = self.Omega.shape
+        self.size_Omega = self.Omega.size
         self.check_empty_rows_columns()      
+        self.traces_class, self.traces_options = Traces, {}
+        self.set_evaluation(every=1, sink=print_performance)
+        self.set_checkpoint(path=None, every=None)
+        self.resuming = False
         
         
     def train(self,init,iterations):
@@ -59,63 +147,264 @@ class BMF(object):
         assert False, "Implement this method for your class!"
         
     
+    def set_evaluation(self,every=1,sink=print_performance):
+        """ Evaluate the performance on the observed entries every :every 
+            iterations in run() (never if every is 0 or None), and pass it to 
+            sink(it, performance) (unless sink is None). """
+        self.evaluate_every, self.evaluation_sink = every, sink
+        
+    def evaluate_while_running(self,it):
+        """ Evaluate and store the performance in iteration it, if we evaluate
+            in this iteration. """
+        if not self.evaluate_every or (it+1) % self.evaluate_every != 0:
+            return
+        perf = self.predict_while_running()
+        for metric in self.all_performances:
+            self.all_performances[metric].append(perf[metric])
+        if self.evaluation_sink is not None:
+            self.evaluation_sink(it, perf)
+        
+    def set_checkpoint(self,path,every):
+        """ Save the state of the sampler to :path every :every iterations in 
+            run() (never if every is 0 or None), so that we can continue the 
+            chain with resume(path, extra_iterations). """
+        self.checkpoint_path, self.checkpoint_every = path, every
+        
+    def checkpoint(self):
+        """ Save the model and numpy random state to self.checkpoint_path. We 
+            write to a temporary file first, so that a job stopped halfway 
+            through never leaves a broken checkpoint. """
+        self.random_state = numpy.random.get_state()
+        sink, self.evaluation_sink = self.evaluation_sink, None
+        try:
+            with open(self.checkpoint_path+'.tmp', 'wb') as fout:
+                cPickle.dump(self, fout, protocol=cPickle.HIGHEST_PROTOCOL)
+            os.rename(self.checkpoint_path+'.tmp', self.checkpoint_path)
+        finally:
+            self.evaluation_sink = sink
+        
+    def iterate(self,iterations,metrics,**shapes):
+        """ Yield the iterations for run(). First set up the storage of the draws 
+            (with the given shapes), times, and performances - or if we are 
+            resuming a chain, extend them to :iterations iterations and start 
+            after the checkpoint. After each iteration, store the time, evaluate 
+            the performance (see set_evaluation), and save a checkpoint (see 
+            set_checkpoint). """
+        if self.resuming:
+            self.traces.extend(iterations)
+            self.alias_draws()
+            time_start = time.time() - (self.all_times[-1] if self.all_times else 0.)
+            self.resuming = False
+        else:
+            self.initialise_draws(iterations, **shapes)
+            self.all_times = []
+            self.all_performances = { metric: [] for metric in metrics }
+            self.iteration = 0
+            time_start = time.time()
+            
+        for it in range(self.iteration, iterations):
+            yield it
+            self.iteration = it + 1
+            self.all_times.append(time.time()-time_start)
+            self.evaluate_while_running(it)
+            if self.checkpoint_every and (it+1) % self.checkpoint_every == 0:
+                self.checkpoint()
+        
+    def stream_draws(self,burn_in,thinning):
+        """ Only keep the running mean and variance of the draws (after burn_in 
+            and thinning) in the next run(), rather than all draws. :burn_in 
+            can also be a list of burn-ins, to keep them after each of those. """
+        self.traces_class = StreamingTraces
+        self.traces_options = { 'burn_in': burn_in, 'thinning': thinning }
+        
+    def memmap_draws(self,folder,chunk_size=100):
+        """ Store all draws of the next run() in memory-mapped files in :folder, 
+            writing them to disk in chunks of :chunk_size iterations. """
+        self.traces_class = MemmapTraces
+        self.traces_options = { 'folder': folder, 'chunk_size': chunk_size }
+        
+    def initialise_draws(self,iterations,**shapes):
+        """ Set up the storage of the draws of the random variables (with the 
+            given shapes) for :iterations iterations. """
+        self.traces = self.traces_class(iterations=iterations, shapes=shapes, **self.traces_options)
+        self.alias_draws()
+        
+    def alias_draws(self):
+        """ Make the draws accessible as all_U, all_V, etc (if we store them). """
+        if hasattr(self.traces, 'draws'):
+            for name in self.traces.draws:
+                setattr(self, 'all_%s' % name, self.traces.draws[name])
+                
+    def store_draws(self,it,**draws):
+        """ Store the values of the random variables in iteration it. """
+        self.traces.store(it, draws)
+        
+    
     def check_empty_rows_columns(self):
         """ Check if each row and column of M has at least 1 observed entry. """
-        sums_columns = self.M.sum(axis=0)
-        sums_rows = self.M.sum(axis=1)
+        sums_columns = self.Omega.T.counts
+        sums_rows = self.Omega.counts
         for i,c in enumerate(sums_rows):
             assert c != 0, "Fully unobserved row in R, row %s." % i
         for j,c in enumerate(sums_columns):
             assert c != 0, "Fully unobserved column in R, column %s." % j
 
 
+    def save(self,path,burn_in,thinning,samples=False):
+        """ Save the hyperparameters, posterior means and variances, times, and
+            performances to :path, and the draws if :samples (see storage.py). """
+        storage.save(model=self, path=path, burn_in=burn_in, thinning=thinning, samples=samples)
+
+
     def approx_expectation_UV(self,burn_in,thinning):
         """ Approximate the expectation of U and V (after burn_in and thinning), 
             returning a a tuple (U, V). """
-        indices = range(burn_in,len(self.all_U),thinning)
-        exp_U = numpy.array([self.all_U[i] for i in indices]).sum(axis=0) / float(len(indices))      
-        exp_V = numpy.array([self.all_V[i] for i in indices]).sum(axis=0) / float(len(indices))  
+        exp_U = self.traces.mean('U', burn_in, thinning)
+        exp_V = self.traces.mean('V', burn_in, thinning)
         return (exp_U, exp_V)
 
-    def predict(self,M_pred,burn_in,thinning):
-        """ Compute the expectation of U and V, and use it to predict missing values. """
-        U, V = self.approx_expectation_UV(burn_in,thinning)
-        R_pred = numpy.dot(U,V.T)
-        MSE = self.compute_MSE(M_pred,self.R,R_pred)
-        R2 = self.compute_R2(M_pred,self.R,R_pred)    
-        Rp = self.compute_Rp(M_pred,self.R,R_pred)        
-        return {'MSE':MSE,'R^2':R2,'Rp':Rp}
+    def observations(self,M_pred):
+        """ Return the entries of M_pred with their values in R (or in Omega, if 
+            we were not given R), as Observations. """
+        R = self.Omega.matrix(weights=self.Omega.values) if self.R is None else self.R
+        return Observations.from_matrices(R=R, M=M_pred)
+        
+    def predict(self,M_pred,burn_in,thinning,posterior_predictive=False):
+        """ Compute the expectation of U and V, and use it to predict missing values. 
+            If posterior_predictive, use the average of U_s*V_s^T over the draws s
+            instead. Either way we only compute the predictions for M_pred. """
+        Omega_pred, R_pred = self.predict_entries(M_pred,burn_in,thinning,posterior_predictive)
+        return self.compute_performances(Omega_pred,R_pred)
+        
+    def predict_entries(self,M_pred,burn_in,thinning,posterior_predictive=False):
+        """ Return the entries Omega_pred of M_pred, and the vector of predictions 
+            R_pred for those entries (see predict). """
+        if posterior_predictive:
+            Omega_pred, R_pred, _ = self.posterior_predictive(M_pred,burn_in,thinning)
+        else:
+            U, V = self.approx_expectation_UV(burn_in,thinning)
+            Omega_pred = self.observations(M_pred)
+            R_pred = Omega_pred.predict(U,V)
+        return (Omega_pred, R_pred)
+        
+    def posterior_predictive(self,M_pred,burn_in,thinning,batch_size=2**16):
+        """ Return the entries Omega_pred of M_pred, and the mean and variance of
+            the predictions U_s,i*V_s,j over the draws s (after burn_in and 
+            thinning) for those entries. We go through the draws one at a time,
+            and compute the predictions in batches of :batch_size entries, so 
+            this takes O(|Omega_pred|*K*S) time and never forms U*V^T. """
+        Omega_pred = self.observations(M_pred)
+        all_U = self.traces.samples('U', burn_in, thinning)
+        all_V = self.traces.samples('V', burn_in, thinning)
+        means, M2s = numpy.zeros(Omega_pred.size), numpy.zeros(Omega_pred.size)
+        for s in range(len(all_U)):
+            U, V = numpy.asarray(all_U[s]), numpy.asarray(all_V[s])
+            for start in range(0, Omega_pred.size, batch_size):
+                batch = slice(start, start+batch_size)
+                R_pred = numpy.einsum('nk,nk->n', U[Omega_pred.rows[batch]], V[Omega_pred.cols[batch]])
+                delta = R_pred - means[batch]
+                means[batch] += delta / float(s+1)
+                M2s[batch] += delta * (R_pred - means[batch])
+        return (Omega_pred, means, M2s / float(len(all_U)))
+        
+    def recommend(self,users,n,burn_in,thinning,exclude_observed=True,posterior_predictive=False,
+                  user_block=1024,item_block=4096):
+        """ Return the top :n columns (and their predictions) for each of the rows 
+            :users, using the expectation of U and V (or the average of U_s*V_s^T 
+            over the draws s if posterior_predictive). We score blocks of 
+            :user_block users against blocks of :item_block items, and only keep
+            the best n items per user after each block, so we never form U*V^T. 
+            The average over the S draws is a single product of the draws 
+            concatenated along K, [U_1,..,U_S] * [V_1,..,V_S]^T / S. """
+        users, n = numpy.asarray(users, dtype=int), min(n, self.J)
+        if posterior_predictive:
+            all_U = self.traces.samples('U', burn_in, thinning)
+            all_V = self.traces.samples('V', burn_in, thinning)
+        else:
+            exp_U, exp_V = self.approx_expectation_UV(burn_in,thinning)
+            all_U, all_V = [exp_U], [exp_V]
+        V_concat = numpy.hstack([numpy.asarray(V) for V in all_V]) / float(len(all_V))
+        observed = self.Omega.matrix()
+        
+        items, scores = numpy.zeros((len(users),n), dtype=int), numpy.zeros((len(users),n))
+        for start in range(0, len(users), user_block):
+            users_block = users[start:start+user_block]
+            U_concat = numpy.hstack([numpy.asarray(U[users_block]) for U in all_U])
+            best_items = numpy.zeros((len(users_block),0), dtype=int)
+            best_scores = numpy.zeros((len(users_block),0))
+            for j_start in range(0, self.J, item_block):
+                j_end = min(j_start+item_block, self.J)
+                block_scores = numpy.dot(U_concat, V_concat[j_start:j_end].T)
+                if exclude_observed:
+                    block_scores[observed[users_block,j_start:j_end].nonzero()] = -numpy.inf
+                block_items = self.top_n(block_scores, n)
+                block_scores = numpy.take_along_axis(block_scores, block_items, axis=1)
+                
+                # Keep the best n items out of the previous best and this block
+                best_scores = numpy.hstack((best_scores, block_scores))
+                best_items = numpy.hstack((best_items, block_items + j_start))
+                best = self.top_n(best_scores, n)
+                best_scores = numpy.take_along_axis(best_scores, best, axis=1)
+                best_items = numpy.take_along_axis(best_items, best, axis=1)
+            scores[start:start+user_block], items[start:start+user_block] = best_scores, best_items
+        return (items, scores)
+        
+    def top_n(self,scores,n):
+        """ Return the column indices of the n highest scores per row, in 
+            descending order. The lowest of the maxima of n disjoint groups of 
+            columns is at most the n-th highest score, so we only need to sort 
+            the (few) scores that are at least that high. """
+        (B, b) = scores.shape
+        if b <= n:
+            return numpy.argsort(-scores, axis=1, kind='mergesort')
+        group = b // n
+        thresholds = scores[:,:n*group].reshape(B,n,group).max(axis=2).min(axis=1)
+        rows, cols = numpy.divmod(numpy.flatnonzero(scores >= thresholds[:,None]), b)
+        order = numpy.lexsort((-scores[rows,cols], rows))
+        rows, cols = rows[order], cols[order]
+        counts = numpy.bincount(rows, minlength=B)
+        ranks = numpy.arange(len(rows)) - numpy.repeat(numpy.cumsum(counts) - counts, counts)
+        return cols[ranks < n].reshape(B,n)
         
     def predict_while_running(self):
-        R_pred = numpy.dot(self.U,self.V.T)
-        MSE = self.compute_MSE(self.M,self.R,R_pred)
-        R2 = self.compute_R2(self.M,self.R,R_pred)    
-        Rp = self.compute_Rp(self.M,self.R,R_pred)        
-        return {'MSE':MSE,'R^2':R2,'Rp':Rp}
+        """ Compute the performance on the observed entries, using the residuals
+            if the model keeps them up to date (so R - residuals = U*V^T). """
+        if hasattr(self,'residuals'):
+            R_pred = self.Omega.values - self.residuals.values
+        else:
+            R_pred = self.Omega.predict(self.U,self.V)
+        return self.compute_performances(self.Omega,R_pred)
+        
+    def compute_performances(self,Omega,R_pred):
+        """ Compute the MSE, R^2, Rp, RMSE and MAE of the entries in Omega, 
+            comparing their values with R_pred (the predictions for those 
+            entries), in a single pass (see evaluation.py). """
+        return evaluate(rows=Omega.rows, cols=Omega.cols, truth=Omega.values, 
+                        predicted=R_pred, shape=Omega.shape)
         
     
+    def compute_performances_masked(self,M,R,R_pred):
+        """ Compute the performances of the entries in M (a vector or matrix), 
+            comparing R with R_pred (of the same shape as M). """
+        M, R, R_pred = numpy.atleast_2d(M), numpy.atleast_2d(R), numpy.atleast_2d(R_pred)
+        rows, cols = numpy.nonzero(M)
+        return evaluate(rows=rows, cols=cols, truth=R[rows,cols], 
+                        predicted=R_pred[rows,cols], shape=M.shape)
+        
     def compute_MSE(self,M,R,R_pred):
         """ Compute the MSE of entries in M, comparing R with R_pred. """
-        return (M * (R-R_pred)**2).sum() / float(M.sum())
+        return self.compute_performances_masked(M,R,R_pred)['MSE']
         
     def compute_R2(self,M,R,R_pred):
         """ Compute the R^2 of entries in M, comparing R with R_pred. """
-        mean = (M*R).sum() / float(M.sum())
-        SS_total = float((M*(R-mean)**2).sum())
-        SS_res = float((M*(R-R_pred)**2).sum())
-        return 1. - SS_res / SS_total if SS_total != 0. else numpy.inf
+        return self.compute_performances_masked(M,R,R_pred)['R^2']
         
     def compute_Rp(self,M,R,R_pred):
         """ Compute the Rp of entries in M, comparing R with R_pred. """
-        mean_real = (M*R).sum() / float(M.sum())
-        mean_pred = (M*R_pred).sum() / float(M.sum())
-        covariance = (M*(R-mean_real)*(R_pred-mean_pred)).sum()
-        variance_real = (M*(R-mean_real)**2).sum()
-        variance_pred = (M*(R_pred-mean_pred)**2).sum()
-        return covariance / float(math.sqrt(variance_real)*math.sqrt(variance_pred))
+        return self.compute_performances_masked(M,R,R_pred)['Rp']
 
     def log_likelihood(self,expU,expV,exptau):
         """ Return the likelihood of the data given the trained model's parameters. """
         explogtau = math.log(exptau)
         return self.size_Omega / 2. * ( explogtau - math.log(2*math.pi) ) \
-             - exptau / 2. * (self.M*( self.R - numpy.dot(expU,expV.T))**2).sum()
\ No newline at end of file
+             - exptau / 2. * ((self.Omega.values - self.Omega.predict(expU,expV))**2).sum()
\ No newline at end of file
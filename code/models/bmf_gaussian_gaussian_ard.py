@@ -9,6 +9,7 @@ Hyperparameters: alpha, beta, lamb.
 """
 
 from bmf import BMF
+from Gibbs.residuals import Residuals
 from Gibbs.updates import update_tau_gaussian
 from Gibbs.updates import update_U_gaussian_gaussian_multivariate_ard
 from Gibbs.updates import update_V_gaussian_gaussian_multivariate_ard
@@ -18,7 +19,6 @@ from Gibbs.initialise import initialise_U_gaussian
 from Gibbs.initialise import initialise_lamb_ard
 
 import numpy
-import time
 
 METRICS = ['MSE', 'R^2', 'Rp']
 OPTIONS_INIT = ['random', 'exp']
@@ -37,6 +37,7 @@ class BMF_Gaussian_Gaussian_ARD(BMF):
         self.beta =    hyperparameters.get('beta',   DEFAULT_HYPERPARAMETERS['beta'])   
         self.alpha0 =  hyperparameters.get('alpha0', DEFAULT_HYPERPARAMETERS['alpha0']) 
         self.beta0 =   hyperparameters.get('beta0',  DEFAULT_HYPERPARAMETERS['beta0'])  
+        self.hyperparameters = { 'alpha': self.alpha, 'beta': self.beta, 'alpha0': self.alpha0, 'beta0': self.beta0 }
         
         
     def initialise(self,init):
@@ -47,40 +48,23 @@ class BMF_Gaussian_Gaussian_ARD(BMF):
             init=init, K=self.K, alpha0=self.alpha0, beta0=self.beta0)
         self.U = initialise_U_gaussian(init=init, I=self.I, K=self.K, lamb=self.lamb)
         self.V = initialise_U_gaussian(init=init, I=self.J, K=self.K, lamb=self.lamb)
+        self.residuals = Residuals.from_factors(Omega=self.Omega, U=self.U, V=self.V)
         self.tau = initialise_tau_gamma(
-            alpha=self.alpha, beta=self.beta, R=self.R, M=self.M, U=self.U, V=self.V)
+            alpha=self.alpha, beta=self.beta, residuals=self.residuals)
         
         
     def run(self,iterations):
         """ Run the Gibbs sampler for the specified number of iterations. """
-        self.all_U = numpy.zeros((iterations,self.I,self.K))  
-        self.all_V = numpy.zeros((iterations,self.J,self.K))   
-        self.all_lamb = numpy.zeros((iterations,self.K))
-        self.all_tau = numpy.zeros(iterations) 
-        self.all_times = []
-        self.all_performances = { metric: [] for metric in METRICS } 
-        
-        time_start = time.time()
-        for it in range(iterations):
+        for it in self.iterate(iterations, METRICS, U=(self.I,self.K), V=(self.J,self.K), lamb=(self.K,), tau=()):
             # Update the random variables
             self.U = update_U_gaussian_gaussian_multivariate_ard(
-                lamb=self.lamb, R=self.R, M=self.M, V=self.V, tau=self.tau) 
+                lamb=self.lamb, residuals=self.residuals, V=self.V, tau=self.tau) 
             self.V = update_V_gaussian_gaussian_multivariate_ard(
-                lamb=self.lamb, R=self.R, M=self.M, U=self.U, tau=self.tau)
+                lamb=self.lamb, residuals=self.residuals, U=self.U, tau=self.tau)
             self.lamb = update_lambda_gaussian_gaussian_ard(
                 alpha0=self.alpha0, beta0=self.beta0, U=self.U, V=self.V)
             self.tau = update_tau_gaussian(
-                alpha=self.alpha, beta=self.beta, R=self.R, M=self.M, U=self.U, V=self.V)
+                alpha=self.alpha, beta=self.beta, residuals=self.residuals)
             
             # Store the draws
-            self.all_U[it], self.all_V[it] = numpy.copy(self.U), numpy.copy(self.V)
-            self.all_lamb[it] = numpy.copy(self.lamb)
-            self.all_tau[it] = self.tau
-            
-            # Print the performance, store performance and time
-            perf = self.predict_while_running()
-            for metric in METRICS:
-                self.all_performances[metric].append(perf[metric])
-            time_iteration = time.time()
-            self.all_times.append(time_iteration-time_start)   
-            print "Iteration %s. MSE: %s. R^2: %s. Rp: %s." % (it+1,perf['MSE'],perf['R^2'],perf['Rp'])
+            self.store_draws(it, U=self.U, V=self.V, lamb=self.lamb, tau=self.tau)
@@ -9,6 +9,7 @@ Hyperparameters: alpha, beta, lamb, gamma.
 """
 
 from bmf import BMF
+from Gibbs.residuals import Residuals
 from Gibbs.updates import update_tau_gaussian
 from Gibbs.updates import update_U_gaussian_volumeprior
 from Gibbs.updates import update_V_gaussian_gaussian_multivariate
@@ -17,7 +18,6 @@ from Gibbs.initialise import initialise_U_gaussian
 from Gibbs.initialise import initialise_U_volumeprior
 
 import numpy
-import time
 
 METRICS = ['MSE', 'R^2', 'Rp']
 OPTIONS_INIT = ['random', 'exp']
@@ -36,6 +36,7 @@ class BMF_Gaussian_Gaussian_VolumePrior(BMF):
         self.beta =  hyperparameters.get('beta',  DEFAULT_HYPERPARAMETERS['beta'])   
         self.lamb =  hyperparameters.get('lamb',  DEFAULT_HYPERPARAMETERS['lamb'])  
         self.gamma = hyperparameters.get('gamma', DEFAULT_HYPERPARAMETERS['gamma'])
+        self.hyperparameters = { 'alpha': self.alpha, 'beta': self.beta, 'lamb': self.lamb, 'gamma': self.gamma }
         
         
     def initialise(self,init):
@@ -44,36 +45,21 @@ class BMF_Gaussian_Gaussian_VolumePrior(BMF):
             "Unknown initialisation option: %s. Should be one of %s." % (init, OPTIONS_INIT)
         self.U = initialise_U_volumeprior(init=init, I=self.I, K=self.K, gamma=self.gamma)
         self.V = initialise_U_gaussian(init=init, I=self.J, K=self.K, lamb=self.lamb)
+        self.residuals = Residuals.from_factors(Omega=self.Omega, U=self.U, V=self.V)
         self.tau = initialise_tau_gamma(
-            alpha=self.alpha, beta=self.beta, R=self.R, M=self.M, U=self.U, V=self.V)
+            alpha=self.alpha, beta=self.beta, residuals=self.residuals)
         
         
     def run(self,iterations):
         """ Run the Gibbs sampler for the specified number of iterations. """
-        self.all_U = numpy.zeros((iterations,self.I,self.K))  
-        self.all_V = numpy.zeros((iterations,self.J,self.K))   
-        self.all_tau = numpy.zeros(iterations) 
-        self.all_times = []
-        self.all_performances = { metric: [] for metric in METRICS } 
-        
-        time_start = time.time()
-        for it in range(iterations):
+        for it in self.iterate(iterations, METRICS, U=(self.I,self.K), V=(self.J,self.K), tau=()):
             # Update the random variables
             self.U = update_U_gaussian_volumeprior(
-                gamma=self.gamma, R=self.R, M=self.M, U=self.U, V=self.V, tau=self.tau) 
+                gamma=self.gamma, residuals=self.residuals, U=self.U, V=self.V, tau=self.tau) 
             self.V = update_V_gaussian_gaussian_multivariate(
-                lamb=self.lamb, R=self.R, M=self.M, U=self.U, tau=self.tau)
+                lamb=self.lamb, residuals=self.residuals, U=self.U, tau=self.tau)
             self.tau = update_tau_gaussian(
-                alpha=self.alpha, beta=self.beta, R=self.R, M=self.M, U=self.U, V=self.V)
+                alpha=self.alpha, beta=self.beta, residuals=self.residuals)
             
             # Store the draws
-            self.all_U[it], self.all_V[it] = numpy.copy(self.U), numpy.copy(self.V)
-            self.all_tau[it] = self.tau
-            
-            # Print the performance, store performance and time
-            perf = self.predict_while_running()
-            for metric in METRICS:
-                self.all_performances[metric].append(perf[metric])
-            time_iteration = time.time()
-            self.all_times.append(time_iteration-time_start)   
-            print "Iteration %s. MSE: %s. R^2: %s. Rp: %s." % (it+1,perf['MSE'],perf['R^2'],perf['Rp'])
+            self.store_draws(it, U=self.U, V=self.V, tau=self.tau)
@@ -14,6 +14,7 @@ if W0 is given as an integer, make it a K by K diagonal matrix with that value.
 """
 
 from bmf import BMF
+from Gibbs.residuals import Residuals
 from Gibbs.updates import update_tau_gaussian
 from Gibbs.updates import update_U_gaussian_gaussian_wishart
 from Gibbs.updates import update_V_gaussian_gaussian_wishart
@@ -24,7 +25,6 @@ from Gibbs.initialise import initialise_U_gaussian_wishart
 from Gibbs.initialise import initialise_muU_sigmaU_wishart
 
 import numpy
-import time
 
 METRICS = ['MSE', 'R^2', 'Rp']
 OPTIONS_INIT = ['random', 'exp']
@@ -56,6 +56,8 @@ class BMF_Gaussian_Gaussian_Wishart(BMF):
         assert self.W0.shape == (K,K), "W0 should be shape (%s,%s), not %s." % (
             self.K, self.K, self.W0.shape)
         assert self.v0 > self.K - 1, "v0 = %s should be greater than K - 1 = %s." % (self.v0, self.K-1)
+        self.hyperparameters = { 'alpha': self.alpha, 'beta': self.beta, 'mu0': self.mu0, 
+                                 'beta0': self.beta0, 'v0': self.v0, 'W0': self.W0 }
         
         
     def initialise(self,init):
@@ -68,48 +70,31 @@ class BMF_Gaussian_Gaussian_Wishart(BMF):
             init=init, mu0=self.mu0, beta0=self.beta0, v0=self.v0, W0=self.W0)
         self.U = initialise_U_gaussian_wishart(init=init, I=self.I, K=self.K, muU=self.muU, sigmaU=self.sigmaU)
         self.V = initialise_U_gaussian_wishart(init=init, I=self.J, K=self.K, muU=self.muU, sigmaU=self.sigmaV)
+        self.residuals = Residuals.from_factors(Omega=self.Omega, U=self.U, V=self.V)
         self.tau = initialise_tau_gamma(
-            alpha=self.alpha, beta=self.beta, R=self.R, M=self.M, U=self.U, V=self.V)
+            alpha=self.alpha, beta=self.beta, residuals=self.residuals)
         
         
     def run(self,iterations):
         """ Run the Gibbs sampler for the specified number of iterations. """
-        self.all_U = numpy.zeros((iterations,self.I,self.K))  
-        self.all_V = numpy.zeros((iterations,self.J,self.K))   
-        self.all_muU = numpy.zeros((iterations,self.K))  
-        self.all_muV = numpy.zeros((iterations,self.K))  
-        self.all_sigmaU = numpy.zeros((iterations,self.K,self.K))  
-        self.all_sigmaV = numpy.zeros((iterations,self.K,self.K))  
-        self.all_tau = numpy.zeros(iterations) 
-        self.all_times = []
-        self.all_performances = { metric: [] for metric in METRICS } 
-        
-        time_start = time.time()
-        for it in range(iterations):
+        for it in self.iterate(iterations, METRICS, U=(self.I,self.K), V=(self.J,self.K), 
+                muU=(self.K,), muV=(self.K,), 
+                sigmaU=(self.K,self.K), sigmaV=(self.K,self.K), tau=()):
             # Update the random variables
             self.muU, self.sigmaU = update_muU_sigmaU_gaussian_gaussian_wishart(
                 mu0=self.mu0, beta0=self.beta0, v0=self.v0, W0=self.W0, U=self.U)
             self.U = update_U_gaussian_gaussian_wishart(
-                muU=self.muU, sigmaU=self.sigmaU, R=self.R, M=self.M, V=self.V, tau=self.tau)
+                muU=self.muU, sigmaU=self.sigmaU, residuals=self.residuals, V=self.V, tau=self.tau)
             
             self.muV, self.sigmaV = update_muV_sigmaV_gaussian_gaussian_wishart(
                 mu0=self.mu0, beta0=self.beta0, v0=self.v0, W0=self.W0, V=self.V)
             self.V = update_V_gaussian_gaussian_wishart(
-                muV=self.muV, sigmaV=self.sigmaV, R=self.R, M=self.M, U=self.U, tau=self.tau)
+                muV=self.muV, sigmaV=self.sigmaV, residuals=self.residuals, U=self.U, tau=self.tau)
                  
             self.tau = update_tau_gaussian(
-                alpha=self.alpha, beta=self.beta, R=self.R, M=self.M, U=self.U, V=self.V)
+                alpha=self.alpha, beta=self.beta, residuals=self.residuals)
             
             # Store the draws
-            self.all_U[it], self.all_V[it] = numpy.copy(self.U), numpy.copy(self.V)
-            self.all_muU[it], self.all_sigmaU[it] = numpy.copy(self.muU), numpy.copy(self.sigmaU)
-            self.all_muV[it], self.all_sigmaV[it] = numpy.copy(self.muV), numpy.copy(self.sigmaV)
-            self.all_tau[it] = self.tau
-            
-            # Print the performance, store performance and time
-            perf = self.predict_while_running()
-            for metric in METRICS:
-                self.all_performances[metric].append(perf[metric])
-            time_iteration = time.time()
-            self.all_times.append(time_iteration-time_start)   
-            print "Iteration %s. MSE: %s. R^2: %s. Rp: %s." % (it+1,perf['MSE'],perf['R^2'],perf['Rp'])
+            self.store_draws(it, U=self.U, V=self.V, 
+                muU=self.muU, sigmaU=self.sigmaU, 
+                muV=self.muV, sigmaV=self.sigmaV, tau=self.tau)
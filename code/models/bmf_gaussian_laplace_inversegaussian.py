@@ -13,6 +13,7 @@ Hyperparameters: alpha, beta, a, b.
 """
 
 from bmf import BMF
+from Gibbs.residuals import Residuals
 from Gibbs.updates import update_tau_gaussian
 from Gibbs.updates import update_U_gaussian_laplace
 from Gibbs.updates import update_V_gaussian_laplace
@@ -26,7 +27,6 @@ from Gibbs.initialise import initialise_lambdaU_laplace
 from Gibbs.initialise import initialise_etaU_laplace
 
 import numpy
-import time
 
 METRICS = ['MSE', 'R^2', 'Rp']
 OPTIONS_INIT = ['random', 'exp']
@@ -45,6 +45,7 @@ class BMF_Gaussian_Laplace_IG(BMF):
         self.beta =  hyperparameters.get('beta',  DEFAULT_HYPERPARAMETERS['beta'])  
         self.a =     hyperparameters.get('a',     1. / K) 
         self.b =     hyperparameters.get('b',     K) 
+        self.hyperparameters = { 'alpha': self.alpha, 'beta': self.beta, 'a': self.a, 'b': self.b }
         
         
     def initialise(self,init):
@@ -57,40 +58,25 @@ class BMF_Gaussian_Laplace_IG(BMF):
         self.V = initialise_U_laplace(init=init, I=self.J, K=self.K, etaU=self.etaV)
         self.lambdaU = initialise_lambdaU_laplace(init=init, I=self.I, K=self.K, etaU=self.etaU)
         self.lambdaV = initialise_lambdaU_laplace(init=init, I=self.J, K=self.K, etaU=self.etaV)
+        self.residuals = Residuals.from_factors(Omega=self.Omega, U=self.U, V=self.V)
         self.tau = initialise_tau_gamma(
-            alpha=self.alpha, beta=self.beta, R=self.R, M=self.M, U=self.U, V=self.V)
+            alpha=self.alpha, beta=self.beta, residuals=self.residuals)
         
         
     def run(self,iterations):
         """ Run the Gibbs sampler for the specified number of iterations. """
-        self.all_U = numpy.zeros((iterations,self.I,self.K))  
-        self.all_V = numpy.zeros((iterations,self.J,self.K))   
-        self.all_tau = numpy.zeros(iterations) 
-        self.all_times = []
-        self.all_performances = { metric: [] for metric in METRICS } 
-        
-        time_start = time.time()
-        for it in range(iterations):
+        for it in self.iterate(iterations, METRICS, U=(self.I,self.K), V=(self.J,self.K), tau=()):
             # Update the random variables
             self.lambdaU = update_lambdaU_gaussian_laplace(U=self.U, etaU=self.etaU)
             self.etaU = update_etaU_gaussian_laplace(lambdaU=self.lambdaU, a=self.a, b=self.b)
             self.U = update_U_gaussian_laplace(
-                R=self.R, M=self.M, V=self.V, lambdaU=self.lambdaU, tau=self.tau) 
+                residuals=self.residuals, V=self.V, lambdaU=self.lambdaU, tau=self.tau) 
             self.lambdaV = update_lambdaV_gaussian_laplace(V=self.V, etaV=self.etaV)
             self.etaV = update_etaV_gaussian_laplace(lambdaV=self.lambdaV, a=self.a, b=self.b)
             self.V = update_V_gaussian_laplace(
-                R=self.R, M=self.M, U=self.U, lambdaV=self.lambdaV, tau=self.tau)
+                residuals=self.residuals, U=self.U, lambdaV=self.lambdaV, tau=self.tau)
             self.tau = update_tau_gaussian(
-                alpha=self.alpha, beta=self.beta, R=self.R, M=self.M, U=self.U, V=self.V)
+                alpha=self.alpha, beta=self.beta, residuals=self.residuals)
             
             # Store the draws
-            self.all_U[it], self.all_V[it] = numpy.copy(self.U), numpy.copy(self.V)
-            self.all_tau[it] = self.tau
-            
-            # Print the performance, store performance and time
-            perf = self.predict_while_running()
-            for metric in METRICS:
-                self.all_performances[metric].append(perf[metric])
-            time_iteration = time.time()
-            self.all_times.append(time_iteration-time_start)   
-            print "Iteration %s. MSE: %s. R^2: %s. Rp: %s." % (it+1,perf['MSE'],perf['R^2'],perf['Rp'])
+            self.store_draws(it, U=self.U, V=self.V, tau=self.tau)
@@ -21,7 +21,6 @@ from Gibbs.initialise import initialise_U_gamma
 from Gibbs.initialise import initialise_U_dirichlet
 
 import numpy
-import time
 
 METRICS = ['MSE', 'R^2', 'Rp']
 OPTIONS_INIT = ['random', 'exp']
@@ -42,6 +41,7 @@ class BMF_Poisson_Gamma_Dirichlet(BMF):
                      else self.alpha * numpy.ones(K)
         assert self.alpha.shape == (K,), "alpha should be shape (%s,), not %s." % (
             self.K, self.alpha.shape)
+        self.hyperparameters = { 'alpha': self.alpha, 'a': self.a, 'b': self.b }
         
         
     def initialise(self,init):
@@ -50,35 +50,19 @@ class BMF_Poisson_Gamma_Dirichlet(BMF):
             "Unknown initialisation option: %s. Should be one of %s." % (init, OPTIONS_INIT)
         self.U = initialise_U_dirichlet(init=init, I=self.I, K=self.K, alpha=self.alpha)
         self.V = initialise_U_gamma(init=init, I=self.J, K=self.K, a=self.a, b=self.b)
-        self.Z = initialise_Z_multinomial(init=init, R=self.R, U=self.U, V=self.V)
+        self.Z = initialise_Z_multinomial(init=init, Omega=self.Omega, U=self.U, V=self.V)
         
         
     def run(self,iterations):
         """ Run the Gibbs sampler for the specified number of iterations. """
-        self.all_U = numpy.zeros((iterations,self.I,self.K))  
-        self.all_V = numpy.zeros((iterations,self.J,self.K))
-        #self.all_Z = numpy.zeros((iterations,self.I,self.J,self.K))
-        self.all_times = []
-        self.all_performances = { metric: [] for metric in METRICS } 
-        
-        time_start = time.time()
-        for it in range(iterations):
+        for it in self.iterate(iterations, METRICS, U=(self.I,self.K), V=(self.J,self.K)):
             # Update the random variables
             self.Z = update_Z_poisson(
-                R=self.R, M=self.M, U=self.U, V=self.V)
+                Omega=self.Omega, Z=self.Z, U=self.U, V=self.V)
             self.U = update_U_poisson_dirichlet(
-                alpha=self.alpha, M=self.M, Z=self.Z)
+                alpha=self.alpha, Omega=self.Omega, Z=self.Z)
             self.V = update_V_poisson_gamma(
-                a=self.a, b=self.b, M=self.M, U=self.U, Z=self.Z)
+                a=self.a, b=self.b, Omega=self.Omega, U=self.U, Z=self.Z)
             
             # Store the draws
-            self.all_U[it], self.all_V[it] = numpy.copy(self.U), numpy.copy(self.V)
-            #self.all_Z[it] = numpy.copy(self.Z)
-            
-            # Print the performance, store performance and time
-            perf = self.predict_while_running()
-            for metric in METRICS:
-                self.all_performances[metric].append(perf[metric])
-            time_iteration = time.time()
-            self.all_times.append(time_iteration-time_start)   
-            print "Iteration %s. MSE: %s. R^2: %s. Rp: %s." % (it+1,perf['MSE'],perf['R^2'],perf['Rp'])
+            self.store_draws(it, U=self.U, V=self.V)
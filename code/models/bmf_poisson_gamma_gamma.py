@@ -21,7 +21,6 @@ from Gibbs.initialise import initialise_U_gamma_hierarchical
 from Gibbs.initialise import initialise_hU_gamma_hierarchical
 
 import numpy
-import time
 
 METRICS = ['MSE', 'R^2', 'Rp']
 OPTIONS_INIT = ['random', 'exp']
@@ -38,9 +37,7 @@ class BMF_Poisson_Gamma_Gamma(BMF):
         self.a =  hyperparameters.get('a',  DEFAULT_HYPERPARAMETERS['a'])
         self.ap = hyperparameters.get('ap', DEFAULT_HYPERPARAMETERS['ap'])     
         self.bp = hyperparameters.get('bp', DEFAULT_HYPERPARAMETERS['bp'])   
-        
-        indices_row, indices_column = numpy.nonzero(M)
-        self.Omega = zip(indices_row, indices_column)  
+        self.hyperparameters = { 'a': self.a, 'ap': self.ap, 'bp': self.bp }
         
         
     def initialise(self,init):
@@ -55,44 +52,25 @@ class BMF_Poisson_Gamma_Gamma(BMF):
             init=init, I=self.I, K=self.K, a=self.a, hU=self.hU)
         self.V = initialise_U_gamma_hierarchical(
             init=init, I=self.J, K=self.K, a=self.a, hU=self.hV)
-        self.Z = initialise_Z_multinomial(init=init, R=self.R, U=self.U, V=self.V)
+        self.Z = initialise_Z_multinomial(init=init, Omega=self.Omega, U=self.U, V=self.V)
         
         
     def run(self,iterations):
         """ Run the Gibbs sampler for the specified number of iterations. """
-        self.all_U = numpy.zeros((iterations,self.I,self.K))  
-        self.all_V = numpy.zeros((iterations,self.J,self.K))
-        self.all_hU = numpy.zeros((iterations,self.I))  
-        self.all_hV = numpy.zeros((iterations,self.J))
-        #self.all_Z = numpy.zeros((iterations,self.I,self.J,self.K))
-        self.all_times = []
-        self.all_performances = { metric: [] for metric in METRICS } 
-        
-        time_start = time.time()
-        for it in range(iterations):
+        for it in self.iterate(iterations, METRICS, U=(self.I,self.K), V=(self.J,self.K), hU=(self.I,), hV=(self.J,)):
             # Update the random variables
             self.Z = update_Z_poisson(
-                R=self.R, M=self.M, Omega=self.Omega, Z=self.Z, U=self.U, V=self.V)
+                Omega=self.Omega, Z=self.Z, U=self.U, V=self.V)
                 
             self.hU = update_hU_poisson_gamma_hierarchical(
                 ap=self.ap, bp=self.bp, a=self.a, U=self.U)
             self.U = update_U_poisson_gamma_hierarchical(
-                a=self.a, hU=self.hU, M=self.M, V=self.V, Z=self.Z)
+                a=self.a, hU=self.hU, Omega=self.Omega, V=self.V, Z=self.Z)
                 
             self.hV = update_hV_poisson_gamma_hierarchical(
                 ap=self.ap, bp=self.bp, a=self.a, V=self.V)
             self.V = update_V_poisson_gamma_hierarchical(
-                a=self.a, hV=self.hV, M=self.M, U=self.U, Z=self.Z)
+                a=self.a, hV=self.hV, Omega=self.Omega, U=self.U, Z=self.Z)
             
             # Store the draws
-            self.all_U[it], self.all_V[it] = numpy.copy(self.U), numpy.copy(self.V)
-            self.all_hU[it], self.all_hV[it] = numpy.copy(self.hU), numpy.copy(self.hV)
-            #self.all_Z[it] = numpy.copy(self.Z)
-            
-            # Print the performance, store performance and time
-            perf = self.predict_while_running()
-            for metric in METRICS:
-                self.all_performances[metric].append(perf[metric])
-            time_iteration = time.time()
-            self.all_times.append(time_iteration-time_start)   
-            print "Iteration %s. MSE: %s. R^2: %s. Rp: %s." % (it+1,perf['MSE'],perf['R^2'],perf['Rp'])
+            self.store_draws(it, U=self.U, V=self.V, hU=self.hU, hV=self.hV)
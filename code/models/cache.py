@@ -0,0 +1,126 @@
+"""
+Class for caching the results of training a model and predicting a test set
+on disk, so that running the same model on the same data again (e.g. when
+rerunning an experiment after a crash, or in a script for plotting) only
+costs a lookup rather than running the Gibbs sampler.
+
+Each run is identified by a hash (SHA-1) of:
+- the name of the model class, K, hyperparameters, init, iterations, burn_in,
+  and thinning;
+- the buffers (dtype, shape, and values) of R, M_train, and M_test;
+- the numpy random state just before the run (after seeding it with :seed,
+  if given).
+So we only use a cached result if running the model would give exactly the
+same result. In that case we also set the numpy random state to what it was
+after the run, so that the runs after it can be found in the cache too.
+
+For each run we store the performances on M_test, the predictions for its
+entries, and the random state after the run, in a .npz file in :folder. If the
+files take up more than :max_size bytes, we remove the least recently used
+ones - each time we use a file we update its modification time.
+
+USAGE
+    cache = ResultCache(folder, max_size)
+    performance, predictions = cache.run(model_class, R, M_train, M_test, K, hyperparameters,
+                                         init, iterations, burn_in, thinning, seed)
+where
+    folder is the folder for the cached results (default ~/.cache/bmf_priors).
+    max_size is the maximum total size of the cached results in bytes
+        (default 2**30).
+    model_class, R, M_train, K, hyperparameters, init, iterations are used to
+        train the model (see bmf.py), and M_test, burn_in, thinning to predict.
+    seed is the seed for numpy.random before the run (default None, to use the
+        current random state).
+    performance is a dictionary { 'MSE', 'R^2', 'Rp', 'RMSE', 'MAE' }, and
+        predictions a dictionary { 'rows', 'cols', 'values' } with the entries
+        of M_test and their predicted values.
+"""
+
+import glob, hashlib, json, numpy, os, scipy.sparse
+
+CACHE_FOLDER = os.path.join(os.path.expanduser('~'), '.cache', 'bmf_priors')
+MAX_SIZE = 2**30
+
+class ResultCache(object):
+    def __init__(self, folder=CACHE_FOLDER, max_size=MAX_SIZE):
+        """ Set up the cache in :folder, using at most :max_size bytes. """
+        if not os.path.exists(folder):
+            os.makedirs(folder)
+        self.folder, self.max_size = folder, max_size
+
+    def run(self, model_class, R, M_train, M_test, K, hyperparameters,
+            init, iterations, burn_in, thinning, seed=None):
+        """ Return the performance and predictions of the model on M_test - from
+            the cache if we ran it before, otherwise by training it. """
+        if seed is not None:
+            numpy.random.seed(seed)
+        key = self.key(model_class, R, M_train, M_test, K, hyperparameters, init, iterations, burn_in, thinning)
+        path = os.path.join(self.folder, '%s.npz' % key)
+        if os.path.exists(path):
+            os.utime(path, None)
+            return self.load(path)
+
+        model = model_class(R, M_train, K, hyperparameters)
+        model.train(init=init, iterations=iterations)
+        Omega_pred, R_pred = model.predict_entries(M_test, burn_in, thinning)
+        performance = model.compute_performances(Omega_pred, R_pred)
+        predictions = { 'rows': Omega_pred.rows, 'cols': Omega_pred.cols, 'values': R_pred }
+        self.store(path, performance, predictions)
+        self.evict()
+        return (performance, predictions)
+
+    def key(self, model_class, R, M_train, M_test, K, hyperparameters, init, iterations, burn_in, thinning):
+        """ Return the hash of the configuration, data, and random state. """
+        sha = hashlib.sha1()
+        config = {
+            'model': model_class.__name__, 'K': K, 'hyperparameters': hyperparameters, 'init': init,
+            'iterations': iterations, 'burn_in': burn_in, 'thinning': thinning,
+        }
+        sha.update(json.dumps(config, sort_keys=True, default=lambda value: numpy.asarray(value).tolist()))
+        for matrix in [R, M_train, M_test]:
+            if scipy.sparse.issparse(matrix):
+                matrix = scipy.sparse.csr_matrix(matrix)
+                arrays = [numpy.array(matrix.shape), matrix.data, matrix.indices, matrix.indptr]
+            else:
+                arrays = [numpy.asarray(matrix)]
+            for array in arrays:
+                sha.update('%s %s' % (array.dtype.str, array.shape))
+                sha.update(numpy.ascontiguousarray(array).data)
+        (_, keys, position, has_gauss, cached_gaussian) = numpy.random.get_state()
+        sha.update(keys.data)
+        sha.update('%s %s %r' % (position, has_gauss, cached_gaussian))
+        return sha.hexdigest()
+
+    def store(self, path, performance, predictions):
+        """ Store the performance, predictions, and random state in :path. We
+            write to a temporary file first, so we never leave a broken file. """
+        (_, keys, position, has_gauss, cached_gaussian) = numpy.random.get_state()
+        arrays = { 'random_state/%s' % name: value for name, value in [
+            ('keys', keys), ('position', position), ('has_gauss', has_gauss), ('cached_gaussian', cached_gaussian)] }
+        arrays.update({ 'performances/%s' % metric: value for metric, value in performance.items() })
+        arrays.update({ 'predictions/%s' % name: value for name, value in predictions.items() })
+        with open(path+'.tmp', 'wb') as fout:
+            numpy.savez(fout, **arrays)
+        os.rename(path+'.tmp', path)
+
+    def load(self, path):
+        """ Load the performance and predictions from :path, and set the random
+            state to what it was after the run. """
+        with numpy.load(path) as arrays:
+            performance = { name.split('/', 1)[1]: float(arrays[name]) for name in arrays.files if name.startswith('performances/') }
+            predictions = { name.split('/', 1)[1]: arrays[name] for name in arrays.files if name.startswith('predictions/') }
+            numpy.random.set_state(('MT19937', arrays['random_state/keys'], int(arrays['random_state/position']),
+                                    int(arrays['random_state/has_gauss']), float(arrays['random_state/cached_gaussian'])))
+        return (performance, predictions)
+
+    def evict(self):
+        """ Remove the least recently used results until they take up at most
+            max_size bytes. """
+        files = [(os.path.getmtime(path), os.path.getsize(path), path)
+                 for path in glob.glob(os.path.join(self.folder, '*.npz'))]
+        total = sum(size for (_, size, _) in files)
+        for (_, size, path) in sorted(files):
+            if total <= self.max_size:
+                break
+            os.remove(path)
+            total -= size
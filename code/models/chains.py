@@ -0,0 +1,101 @@
+"""
+Method for running several independent Gibbs chains of a model in parallel,
+in a pool of processes - for convergence diagnostics, and for averaging the
+predictions over chains.
+
+The observed entries of R are put in shared memory once, as the rows, cols,
+and values of their Observations (see shared.py and Gibbs/observations.py, 
+with the dtypes it uses), and each worker builds the Observations of its model
+directly on top of them, so we do not send or copy R and M for each chain. Chain c is seeded with
+numpy.random.seed([seed, c]), so the chains use different random streams, and
+the results are reproducible given :seed.
+
+Each chain returns the posterior mean and variance of its random variables
+(after burn_in and thinning), its times and performances, and its thinned
+draws. If :folder is given, each chain stores its draws in memory-mapped files
+in folder/chain_<c> (see BMF.memmap_draws), and we open those files rather
+than sending the draws back through the pool. We merge the chains into the
+pooled posterior mean and variance:
+    mean = average of the chain means,
+    variance = average of the chain variances + variance of the chain means.
+
+USAGE
+    results = run_chains(model_class, R, M, K, hyperparameters, n_chains, n_workers,
+                         init, iterations, burn_in, thinning, seed, folder)
+where
+    model_class is one of the BMF models (e.g. BMF_Gaussian_Gaussian).
+    R, M, K, hyperparameters are the arguments for the model (see bmf.py).
+    n_chains is the number of chains, and n_workers the number of processes.
+    init, iterations are the arguments for BMF.train.
+    burn_in, thinning are used for the posterior means, variances, and draws.
+    seed is the seed for the chains (default None, for a random one).
+    folder is the folder for the draws of each chain (default None, to keep
+        them in memory).
+    results is a dictionary { 'means', 'variances', 'chains' }, with the pooled
+        posterior means and variances (dictionaries from names to arrays), and
+        a list with for each chain a dictionary { 'seed', 'means', 'variances',
+        'samples', 'times', 'performances' }.
+"""
+
+from Gibbs.observations import Observations
+from shared import SharedArrays
+
+from multiprocessing import Pool
+import numpy, os
+
+def run_chains(model_class, R, M, K, hyperparameters, n_chains, n_workers,
+               init, iterations, burn_in, thinning, seed=None, folder=None):
+    """ Run :n_chains chains of the model in :n_workers processes, and merge them. """
+    Omega = Observations.from_matrices(R=R, M=M)
+    shared = SharedArrays({ 'rows': Omega.rows, 'cols': Omega.cols, 'values': Omega.values })
+    seed = numpy.random.RandomState().randint(2**31) if seed is None else seed
+    tasks = [{
+        'shared': shared, 'shape': Omega.shape, 'chain': c, 'seed': [seed, c],
+        'model_class': model_class, 'K': K, 'hyperparameters': hyperparameters,
+        'init': init, 'iterations': iterations, 'burn_in': burn_in, 'thinning': thinning,
+        'folder': None if folder is None else os.path.join(folder, 'chain_%s' % c),
+    } for c in range(n_chains)]
+
+    try:
+        pool = Pool(n_workers)
+        chains = pool.map(run_chain, tasks)
+        pool.close()
+        pool.join()
+    finally:
+        shared.close()
+
+    for task, chain in zip(tasks, chains):
+        if task['folder'] is not None:
+            chain['samples'] = {
+                name: numpy.load(os.path.join(task['folder'], '%s.npy' % name), mmap_mode='r')[burn_in::thinning]
+                for name in chain['means']
+            }
+    means = { name: numpy.mean([chain['means'][name] for chain in chains], axis=0) for name in chains[0]['means'] }
+    variances = {
+        name: numpy.mean([chain['variances'][name] + (chain['means'][name] - means[name])**2 for chain in chains], axis=0)
+        for name in chains[0]['means']
+    }
+    return { 'means': means, 'variances': variances, 'chains': chains }
+
+def run_chain(task):
+    """ Run one chain, with the model built on the shared observed entries. """
+    shared = task['shared']
+    Omega = Observations(shape=task['shape'], rows=shared['rows'], cols=shared['cols'], values=shared['values'])
+
+    numpy.random.seed(task['seed'])
+    model = task['model_class'](Omega, None, task['K'], task['hyperparameters'])
+    model.set_evaluation(every=1, sink=None)
+    if task['folder'] is not None:
+        model.memmap_draws(folder=task['folder'])
+    model.train(init=task['init'], iterations=task['iterations'])
+
+    (burn_in, thinning) = (task['burn_in'], task['thinning'])
+    return {
+        'seed': task['seed'],
+        'means': { name: model.traces.mean(name, burn_in, thinning) for name in model.traces.names },
+        'variances': { name: model.traces.variance(name, burn_in, thinning) for name in model.traces.names },
+        'samples': None if task['folder'] is not None else
+                   { name: numpy.array(model.traces.samples(name, burn_in, thinning)) for name in model.traces.names },
+        'times': model.all_times,
+        'performances': model.all_performances,
+    }
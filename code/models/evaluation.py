@@ -0,0 +1,119 @@
+"""
+Class for computing the performance of predictions for a set of entries
+(i,j), given as vectors of row indices, column indices, true values, and
+predicted values. We compute the MSE, R^2, Rp (Pearson correlation), RMSE and
+MAE, as well as the MSE, RMSE and MAE per row and per column.
+
+All measures are computed in a single pass over the entries, in chunks of
+chunk_size entries, so we never need more than a few chunk-sized temporaries.
+For each chunk we compute the number of entries, the means of the true and
+predicted values, the sums of squared differences from those means (M2), and
+the sum of the products of the differences (the co-moment C). We merge these
+with the running totals using the pairwise update of Chan et al.:
+    delta = mean_b - mean_a,   n = n_a + n_b,
+    mean = mean_a + delta * n_b / n,
+    M2 = M2_a + M2_b + delta^2 * n_a * n_b / n,
+which is numerically stable, unlike sum(x^2) - n * mean^2. The errors are
+summed directly (per row and column using bincount).
+
+USAGE
+    performances = evaluate(rows, cols, truth, predicted, shape)
+Or, adding the entries in chunks ourselves:
+    evaluator = Evaluator(shape)
+    evaluator.add(rows, cols, truth, predicted)
+    performances = evaluator.performances()
+    performances_rows = evaluator.performances_per_row()
+    performances_columns = evaluator.performances_per_column()
+where
+    rows, cols, truth, predicted are vectors with the row and column indices,
+        the true values, and the predicted values of the entries.
+    shape is the shape (I,J) of the matrix, used for the per row and per
+        column measures.
+    performances is a dictionary { 'MSE', 'R^2', 'Rp', 'RMSE', 'MAE' }.
+    performances_rows is a dictionary { 'MSE', 'RMSE', 'MAE', 'count' } of
+        vectors of length I (nan for rows without entries).
+    performances_columns is the same, for the columns.
+"""
+
+import numpy, math
+
+CHUNK_SIZE = 2**16
+
+def evaluate(rows, cols, truth, predicted, shape, chunk_size=CHUNK_SIZE):
+    """ Return the performances of the predictions for the given entries. """
+    evaluator = Evaluator(shape=shape)
+    for start in range(0, len(truth), chunk_size):
+        end = start + chunk_size
+        evaluator.add(rows=rows[start:end], cols=cols[start:end],
+                      truth=truth[start:end], predicted=predicted[start:end])
+    return evaluator.performances()
+
+
+class Evaluator(object):
+    def __init__(self, shape):
+        """ Set up the accumulators for a matrix of the given shape (I,J). """
+        (self.I, self.J) = shape
+        self.n = 0
+        self.mean_real, self.mean_pred = 0., 0.
+        self.M2_real, self.M2_pred, self.C = 0., 0., 0.
+        self.SSE, self.SAE = 0., 0.
+        self.SSE_rows, self.SAE_rows, self.count_rows = numpy.zeros(self.I), numpy.zeros(self.I), numpy.zeros(self.I)
+        self.SSE_cols, self.SAE_cols, self.count_cols = numpy.zeros(self.J), numpy.zeros(self.J), numpy.zeros(self.J)
+
+    def add(self, rows, cols, truth, predicted):
+        """ Add a chunk of entries, merging their statistics with the totals. """
+        truth, predicted = numpy.asarray(truth, dtype=float), numpy.asarray(predicted, dtype=float)
+        n_b = truth.shape[0]
+        assert predicted.shape == (n_b,) and len(rows) == n_b and len(cols) == n_b, \
+            "rows, cols, truth, and predicted should be vectors of the same length."
+        if n_b == 0:
+            return
+
+        # Statistics of this chunk
+        mean_real_b, mean_pred_b = truth.mean(), predicted.mean()
+        real_centered, pred_centered = truth - mean_real_b, predicted - mean_pred_b
+        errors = truth - predicted
+        squared_errors, absolute_errors = errors**2, numpy.abs(errors)
+
+        # Merge with the totals
+        n_a, n = self.n, self.n + n_b
+        delta_real, delta_pred = mean_real_b - self.mean_real, mean_pred_b - self.mean_pred
+        weight = n_a * n_b / float(n)
+        self.mean_real += delta_real * n_b / float(n)
+        self.mean_pred += delta_pred * n_b / float(n)
+        self.M2_real += numpy.dot(real_centered, real_centered) + delta_real**2 * weight
+        self.M2_pred += numpy.dot(pred_centered, pred_centered) + delta_pred**2 * weight
+        self.C += numpy.dot(real_centered, pred_centered) + delta_real * delta_pred * weight
+        self.SSE += squared_errors.sum()
+        self.SAE += absolute_errors.sum()
+        self.n = n
+
+        # Per row and column sums
+        self.SSE_rows += numpy.bincount(rows, weights=squared_errors, minlength=self.I)
+        self.SAE_rows += numpy.bincount(rows, weights=absolute_errors, minlength=self.I)
+        self.count_rows += numpy.bincount(rows, minlength=self.I)
+        self.SSE_cols += numpy.bincount(cols, weights=squared_errors, minlength=self.J)
+        self.SAE_cols += numpy.bincount(cols, weights=absolute_errors, minlength=self.J)
+        self.count_cols += numpy.bincount(cols, minlength=self.J)
+
+    def performances(self):
+        """ Return the MSE, R^2, Rp, RMSE, and MAE of the entries added so far. """
+        MSE = self.SSE / float(self.n) if self.n != 0 else numpy.nan
+        MAE = self.SAE / float(self.n) if self.n != 0 else numpy.nan
+        R2 = 1. - self.SSE / self.M2_real if self.M2_real != 0. else numpy.inf
+        Rp = self.C / float(math.sqrt(self.M2_real)*math.sqrt(self.M2_pred)) \
+             if self.M2_real != 0. and self.M2_pred != 0. else numpy.nan
+        return {'MSE':MSE,'R^2':R2,'Rp':Rp,'RMSE':math.sqrt(MSE),'MAE':MAE}
+
+    def performances_per_row(self):
+        """ Return the MSE, RMSE, MAE, and number of entries of each row. """
+        return self.performances_per_index(self.SSE_rows, self.SAE_rows, self.count_rows)
+
+    def performances_per_column(self):
+        """ Return the MSE, RMSE, MAE, and number of entries of each column. """
+        return self.performances_per_index(self.SSE_cols, self.SAE_cols, self.count_cols)
+
+    def performances_per_index(self, SSE, SAE, count):
+        with numpy.errstate(divide='ignore', invalid='ignore'):
+            MSE, MAE = SSE / count, SAE / count
+        return {'MSE':MSE,'RMSE':numpy.sqrt(MSE),'MAE':MAE,'count':count}
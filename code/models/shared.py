@@ -0,0 +1,54 @@
+"""
+Class for sharing numpy arrays between processes without giving each process
+its own copy. The arrays are written once to .npy files in a new folder (in 
+/dev/shm if it exists, so the files live in memory), and each process 
+memory-maps them when it first accesses them, so all processes read the same 
+physical pages. The arrays are mapped copy-on-write: a process that writes to 
+them gets a private copy of the pages it changes, and the others never see it.
+
+Pickling a SharedArrays object only pickles the folder and the names of the 
+arrays, so it can be sent to the workers of a multiprocessing.Pool (e.g. as an 
+argument of each task) cheaply.
+
+USAGE
+    shared = SharedArrays(arrays, folder)
+    R = shared['R']
+    shared.close()
+where
+    arrays is a dictionary from names to numpy arrays.
+    folder is the folder in which we create the folder with the .npy files 
+        (default None, for /dev/shm or otherwise the temporary folder).
+    close() removes the files - call it when all processes are done.
+"""
+
+import numpy, os, shutil, tempfile
+
+SHARED_FOLDER = '/dev/shm' if os.path.isdir('/dev/shm') else None
+
+class SharedArrays(object):
+    def __init__(self, arrays, folder=None):
+        """ Write the :arrays to .npy files in a new folder in :folder. """
+        self.folder = tempfile.mkdtemp(prefix='bmf_shared_', dir=folder if folder else SHARED_FOLDER)
+        self.names = sorted(arrays)
+        for name, array in arrays.items():
+            numpy.save(self.path(name), numpy.asarray(array))
+        self.arrays = {}
+
+    def path(self, name):
+        return os.path.join(self.folder, '%s.npy' % name)
+
+    def __getitem__(self, name):
+        """ Return the array :name, memory-mapping it on the first access. """
+        if name not in self.arrays:
+            self.arrays[name] = numpy.load(self.path(name), mmap_mode='c')
+        return self.arrays[name]
+
+    def __getstate__(self):
+        """ Only pickle the folder and names - each process maps the files itself. """
+        state = dict(self.__dict__)
+        state['arrays'] = {}
+        return state
+
+    def close(self):
+        """ Remove the files. """
+        shutil.rmtree(self.folder, ignore_errors=True)
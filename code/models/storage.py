@@ -0,0 +1,107 @@
+"""
+Methods for saving a trained model to a single binary file, and loading it
+back. We store the class of the model, its hyperparameters, the posterior
+mean and variance of each random variable (after burn-in and thinning), the
+times and performances of each iteration, and optionally the thinned draws
+themselves.
+
+The file is a .npz archive (so numpy.load can also read it), with one .npy
+array per entry. The small arrays are compressed, but the draws are stored
+uncompressed, so that load() can memory-map them straight from the archive:
+they are only read from disk when used. We use .npz rather than the PyTables
+files of store_pytable (see data/movielens/load_data.py), so that saving a
+model needs no dependency besides numpy, and so that the draws can be stored
+uncompressed and memory-mapped.
+
+USAGE
+    save(model, path, burn_in, thinning, samples)
+    saved = load(path)
+where
+    model is a BMF model (see bmf.py) that has been run - or use
+        model.save(path, burn_in, thinning, samples).
+    samples indicates whether we also store the draws after burn_in and
+        thinning (default False).
+    saved is a dictionary { 'model', 'K', 'burn_in', 'thinning',
+        'hyperparameters', 'means', 'variances', 'samples', 'times',
+        'performances' }, where 'model' is the name of the class,
+        'hyperparameters', 'means', 'variances', 'performances', and 'samples'
+        are dictionaries from names to arrays (for 'samples' memory-mapped,
+        of shape (S,) + the shape of the random variable).
+"""
+
+import numpy, os, struct, tempfile, zipfile
+
+GROUPS = ['hyperparameters', 'means', 'variances', 'samples', 'performances']
+
+def save(model, path, burn_in, thinning, samples=False):
+    """ Save the hyperparameters, posterior means and variances, times, and
+        performances of :model to :path - and the draws if :samples. """
+    arrays = {
+        'model': numpy.array(model.__class__.__name__),
+        'K': numpy.array(model.K),
+        'burn_in': numpy.array(burn_in),
+        'thinning': numpy.array(thinning),
+        'times': numpy.array(getattr(model, 'all_times', [])),
+    }
+    for name, value in model.hyperparameters.items():
+        arrays['hyperparameters/%s' % name] = numpy.array(value)
+    for metric, values in getattr(model, 'all_performances', {}).items():
+        arrays['performances/%s' % metric] = numpy.array(values)
+    draws = {}
+    if hasattr(model, 'traces'):
+        for name in model.traces.names:
+            arrays['means/%s' % name] = model.traces.mean(name, burn_in, thinning)
+            arrays['variances/%s' % name] = model.traces.variance(name, burn_in, thinning)
+            if samples:
+                draws['samples/%s' % name] = model.traces.samples(name, burn_in, thinning)
+
+    with zipfile.ZipFile(path, mode='w', allowZip64=True) as archive:
+        for name, array in arrays.items():
+            write_array(archive, name, array, zipfile.ZIP_DEFLATED)
+        for name, array in draws.items():
+            write_array(archive, name, array, zipfile.ZIP_STORED)
+
+def write_array(archive, name, array, compression):
+    """ Add :array to the zip :archive as name.npy. We write it to a temporary
+        file first, so that large (memory-mapped) arrays are never copied into
+        memory as a whole. """
+    (handle, filename) = tempfile.mkstemp(suffix='.npy')
+    try:
+        with os.fdopen(handle, 'wb') as fout:
+            numpy.lib.format.write_array(fout, numpy.asanyarray(array))
+        archive.write(filename, arcname='%s.npy' % name, compress_type=compression)
+    finally:
+        os.remove(filename)
+
+def load(path):
+    """ Load a model saved with save(). The draws are memory-mapped. """
+    saved = { group: {} for group in GROUPS }
+    with zipfile.ZipFile(path, mode='r') as archive, open(path, 'rb') as fin:
+        for info in archive.infolist():
+            name = info.filename[:-len('.npy')]
+            if info.compress_type == zipfile.ZIP_STORED:
+                array = memmap_array(fin, path, info)
+            else:
+                array = numpy.lib.format.read_array(archive.open(info))
+                array = array[()] if array.shape == () else array
+            if '/' in name:
+                (group, name) = name.split('/', 1)
+                saved[group][name] = array
+            else:
+                saved[name] = array
+    return saved
+
+def memmap_array(fin, path, info):
+    """ Memory-map the uncompressed .npy file :info in the zip file :path (open
+        as :fin). The .npy file starts after the local header of the entry,
+        which is 30 bytes followed by the name and extra field. """
+    fin.seek(info.header_offset + 26)
+    (length_name, length_extra) = struct.unpack('<HH', fin.read(4))
+    fin.seek(info.header_offset + 30 + length_name + length_extra)
+    version = numpy.lib.format.read_magic(fin)
+    if version == (1, 0):
+        (shape, fortran_order, dtype) = numpy.lib.format.read_array_header_1_0(fin)
+    else:
+        (shape, fortran_order, dtype) = numpy.lib.format.read_array_header_2_0(fin)
+    return numpy.memmap(path, dtype=dtype, mode='r', offset=fin.tell(), shape=shape,
+                        order='F' if fortran_order else 'C')
@@ -1,7 +1,12 @@
 '''
 Methods for loading in the MovieLens datasets, which we construct from the raw
-data. We could also store the numpy arrays and load those, but that is only
-slightly faster (for MovieLens 1M, 1 minute vs 1:40 minutes).
+data. We read the whole file with numpy at once, map the user and movie ids 
+to row and column indices with numpy.unique, and filter out the rows and 
+columns with fewer than MIN_NO_ENTRIES ratings using the counts of the 
+entries, so we never construct the dense matrices unless asked to (dense=True).
+By default R and M are scipy.sparse CSR matrices, which the models can use 
+directly. This takes about a second for MovieLens 1M (it used to take 1:40 
+minutes, and loading the stored binary arrays 1 minute).
 
 Rows are users, columns are movies. Ratings are 0-5 (0 means no rating).
 
@@ -18,7 +23,7 @@ SUMMARY: n_users, n_movies, n_entries, fraction_obs
 1M:      6040     3503      999917     0.047259255548224514
 '''
 
-import numpy
+import numpy, scipy.sparse
 import tables
 
 folder_data = '/Users/thomasbrouwer/Documents/Projects/libraries/BMF_Priors/data/movielens/' # '/home/tab43/Documents/Projects/libraries/BMF_Priors/data/movielens/' # 
@@ -39,60 +44,69 @@ DELIM_1M = '::'
 
 MIN_NO_ENTRIES = 3
 
-def construct_dataset_from_raw(fin, delim):
+def read_ratings(fin, delim):
+    ''' Return the user ids, movie ids, and ratings in the file, which we parse
+        in one go by replacing :delim with spaces. '''
+    text = open(fin, 'r').read().replace(delim, ' ')
+    values = numpy.fromstring(text, dtype=numpy.int64, sep=' ').reshape(-1, 4)
+    return values[:,0], values[:,1], values[:,2]
+
+def construct_dataset_from_raw(fin, delim, dense=False):
     ''' Return (R, M), which we construct from a file with one rating per line,
-        of the form: user_id<delim>movie_id<delim>rating<delim>timestamp\n '''
-    lines = [line.split('\n')[0].split(delim) for line in open(fin, 'r').readlines()]
-    user_ids, movie_ids, ratings, timestamps = zip(*lines)
-    user_ids = numpy.array(user_ids, dtype=int)
-    movie_ids = numpy.array(movie_ids, dtype=int)
-    ratings = numpy.array(ratings, dtype=int)
+        of the form: user_id<delim>movie_id<delim>rating<delim>timestamp\n 
+        R and M are scipy.sparse CSR matrices, or numpy arrays if :dense. '''
+    user_ids, movie_ids, ratings = read_ratings(fin, delim)
+    
+    # Map the ids to row and column indices
+    unique_user_ids, rows = numpy.unique(user_ids, return_inverse=True)
+    unique_movie_ids, cols = numpy.unique(movie_ids, return_inverse=True)
+    shape = (len(unique_user_ids), len(unique_movie_ids))
     
-    # Construct the matrix
-    unique_user_ids, unique_movie_ids = sorted(set(user_ids)), sorted(set(movie_ids))
-    n_users, n_movies = len(unique_user_ids), len(unique_movie_ids)
-    R, M = numpy.zeros((n_users, n_movies)), numpy.zeros((n_users, n_movies))
-    for c, (user_id, movie_id, rating) in enumerate(zip(user_ids, movie_ids, ratings)):
-        i, j = unique_user_ids.index(user_id), unique_movie_ids.index(movie_id)
-        R[i,j], M[i,j] = rating, 1.
-        if c % 10000 == 0:
-            print "Constructing dataset... Done %s lines." % c
-    print "Constructing dataset... Finished!"
+    # If a user rated a movie more than once, keep the last rating
+    _, index_last = numpy.unique((rows * shape[1] + cols)[::-1], return_index=True)
+    keep = numpy.sort(len(rows) - 1 - index_last)
+    rows, cols, ratings = rows[keep], cols[keep], ratings[keep]
     
     # Filter out any rows or columns with less than MIN_NO_ENTRIES  
-    print "Before filtering, shape is (%s, %s)." % (R.shape)
-    R, M = filter_rows(R, M, MIN_NO_ENTRIES) 
-    print "After row filtering, shape is (%s, %s)." % (R.shape)
-    R, M = filter_columns(R, M, MIN_NO_ENTRIES)
-    print "After column filtering, shape is (%s, %s)." % (R.shape)
-    R, M = filter_rows(R, M, MIN_NO_ENTRIES) 
-    print "After second row filtering, shape is (%s, %s)." % (R.shape)
-    return (R, M)
-
-def filter_rows(R, M, min_no_entries):
-    I, J = R.shape
-    entries_per_row = M.sum(axis=1)
-    indices_enough_entries = [i for i in range(I) if entries_per_row[i] >= min_no_entries]
-    return R[indices_enough_entries,:], M[indices_enough_entries,:]
-
-def filter_columns(R, M, min_no_entries):
-    R_new, M_new = filter_rows(R.T, M.T, min_no_entries)
-    return R_new.T, M_new.T
-
-def load_movielens_100K():
+    print "Before filtering, shape is (%s, %s)." % shape
+    rows, cols, ratings, shape = filter_rows(rows, cols, ratings, shape, MIN_NO_ENTRIES) 
+    print "After row filtering, shape is (%s, %s)." % shape
+    rows, cols, ratings, shape = filter_columns(rows, cols, ratings, shape, MIN_NO_ENTRIES)
+    print "After column filtering, shape is (%s, %s)." % shape
+    rows, cols, ratings, shape = filter_rows(rows, cols, ratings, shape, MIN_NO_ENTRIES) 
+    print "After second row filtering, shape is (%s, %s)." % shape
+    
+    R = scipy.sparse.csr_matrix((ratings.astype(float), (rows, cols)), shape=shape)
+    M = scipy.sparse.csr_matrix((numpy.ones(len(ratings)), (rows, cols)), shape=shape)
+    return (R.toarray(), M.toarray()) if dense else (R, M)
+
+def filter_rows(rows, cols, ratings, shape, min_no_entries):
+    ''' Remove the entries in rows with fewer than :min_no_entries entries, and
+        renumber the remaining rows. Return (rows, cols, ratings, shape). '''
+    entries_per_row = numpy.bincount(rows, minlength=shape[0])
+    enough_entries = entries_per_row >= min_no_entries
+    new_rows = numpy.cumsum(enough_entries) - 1
+    keep = enough_entries[rows]
+    return new_rows[rows[keep]], cols[keep], ratings[keep], (enough_entries.sum(), shape[1])
+
+def filter_columns(rows, cols, ratings, shape, min_no_entries):
+    cols, rows, ratings, (J, I) = filter_rows(cols, rows, ratings, (shape[1], shape[0]), min_no_entries)
+    return rows, cols, ratings, (I, J)
+
+def load_movielens_100K(dense=False):
     ''' Process and store files for MovieLens 100K. '''
-    R, M = construct_dataset_from_raw(fin=fin_100K, delim=DELIM_100K)  
+    R, M = construct_dataset_from_raw(fin=fin_100K, delim=DELIM_100K, dense=dense)  
     return (R, M)
     
-def load_movielens_1M():
+def load_movielens_1M(dense=False):
     ''' Process and store files for MovieLens 1M. '''
-    R, M = construct_dataset_from_raw(fin=fin_1M, delim=DELIM_1M)  
+    R, M = construct_dataset_from_raw(fin=fin_1M, delim=DELIM_1M, dense=dense)  
     return (R, M)
 
 def store_processed_movielens():
     ''' Construct the datasets, and efficiently store them as binary HDF5 PyTables. '''
-    R_100K, M_100K = load_movielens_100K()
-    R_1M, M_1M = load_movielens_1M()
+    R_100K, M_100K = load_movielens_100K(dense=True)
+    R_1M, M_1M = load_movielens_1M(dense=True)
     
     def store_pytable(filename, dataset):
         # Method for storing each file as a binary HDF5 file
@@ -14,7 +14,7 @@ import numpy
 ATTEMPTS_GENERATE_FOLDS = 100
 METRICS = ['MSE', 'R^2', 'Rp']
 
-def measure_model_selection(n_folds, values_K, model_class, settings, fout=None):
+def measure_model_selection(n_folds, values_K, model_class, settings, fout=None, cache=None):
     ''' Run the model selection experiment.
         For each K in :values_K, run :n_folds cross-validation and measure the
         performances.
@@ -30,6 +30,8 @@ def measure_model_selection(n_folds, values_K, model_class, settings, fout=None)
         - model_class -- the BMF class we should use.
         - settings -- dictionary {'R', 'M', 'hyperparameters', 'init', 'iterations', 'burn_in', 'thinning'}.
         - fout -- string giving location of output file.
+        - cache -- a ResultCache (see code/models/cache.py) to look up and store 
+          the runs in, or None to always run the model.
     '''
     # Extract the settings
     R, M, hyperparameters = settings['R'], settings['M'], settings['hyperparameters']
@@ -54,10 +56,13 @@ def measure_model_selection(n_folds, values_K, model_class, settings, fout=None)
     
         for i, (M_train, M_test) in enumerate(zip(Ms_train, Ms_test)):
             print "Fold %s for K=%s." % (i+1, K)
-            BMF = model_class(R, M_train, K, hyperparameters) 
-            BMF.initialise(init)
-            BMF.run(iterations)
-            performance = BMF.predict(M_pred=M_test, burn_in=burn_in, thinning=thinning)
+            if cache is not None:
+                performance, _ = cache.run(model_class, R, M_train, M_test, K, hyperparameters, init, iterations, burn_in, thinning)
+            else:
+                BMF = model_class(R, M_train, K, hyperparameters) 
+                BMF.initialise(init)
+                BMF.run(iterations)
+                performance = BMF.predict(M_pred=M_test, burn_in=burn_in, thinning=thinning)
             for metric in METRICS:
                 performances[metric].append(performance[metric])
         for metric in METRICS:
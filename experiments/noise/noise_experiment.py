@@ -15,7 +15,7 @@ ATTEMPTS_GENERATE_FOLDS = 100
 METRICS = ['MSE', 'R^2', 'Rp']
 FRACTION_TRAIN = 0.9
 
-def noise_experiment(n_repeats, Rs_noise, noise_to_signal_ratios, stratify_rows, model_class, settings, fout=None):
+def noise_experiment(n_repeats, Rs_noise, noise_to_signal_ratios, stratify_rows, model_class, settings, fout=None, cache=None):
     ''' Run the noise experiment.
         For each noise-to-signal ratio in :noise_to_signal_ratios, run the noise
         test :n_repeats times. We use the R in :Rs_noise, which has added Gaussian 
@@ -38,6 +38,8 @@ def noise_experiment(n_repeats, Rs_noise, noise_to_signal_ratios, stratify_rows,
         - model_class -- the BMF class we should use.
         - settings -- dictionary {'M', 'K', 'hyperparameters', 'init', 'iterations', 'burn_in', 'thinning'}.
         - fout -- string giving location of output file.
+        - cache -- a ResultCache (see code/models/cache.py) to look up and store 
+          the runs in, or None to always run the model.
     '''
     assert len(Rs_noise) == len(noise_to_signal_ratios), "Rs_noise should be of the same length as noise_to_signal_ratios!"
     
@@ -69,10 +71,13 @@ def noise_experiment(n_repeats, Rs_noise, noise_to_signal_ratios, stratify_rows,
         for i, (M_train, M_test) in enumerate(Ms_train_and_test):
             print "Repeat %s for NSR=%s." % (i+1, NSR)
             
-            BMF = model_class(R_noise, M_train, K, hyperparameters) 
-            BMF.initialise(init)
-            BMF.run(iterations)
-            performance = BMF.predict(M_pred=M_test, burn_in=burn_in, thinning=thinning)
+            if cache is not None:
+                performance, _ = cache.run(model_class, R_noise, M_train, M_test, K, hyperparameters, init, iterations, burn_in, thinning)
+            else:
+                BMF = model_class(R_noise, M_train, K, hyperparameters) 
+                BMF.initialise(init)
+                BMF.run(iterations)
+                performance = BMF.predict(M_pred=M_test, burn_in=burn_in, thinning=thinning)
             for metric in METRICS:
                 performances[metric].append(performance[metric])
         for metric in METRICS:
@@ -14,7 +14,7 @@ import numpy
 ATTEMPTS_GENERATE_FOLDS = 100
 METRICS = ['MSE', 'R^2', 'Rp']
 
-def sparsity_experiment(n_repeats, fractions_unknown, stratify_rows, model_class, settings, fout=None):
+def sparsity_experiment(n_repeats, fractions_unknown, stratify_rows, model_class, settings, fout=None, cache=None):
     ''' Run the sparsity experiment.
         For each fraction in :fractions_unknown, run the sparsity test :n_repeats
         times. We split the data randomly into :fractions_unknown missing values
@@ -35,6 +35,8 @@ def sparsity_experiment(n_repeats, fractions_unknown, stratify_rows, model_class
         - model_class -- the BMF class we should use.
         - settings -- dictionary {'R', 'M', 'K', 'hyperparameters', 'init', 'iterations', 'burn_in', 'thinning'}.
         - fout -- string giving location of output file.
+        - cache -- a ResultCache (see code/models/cache.py) to look up and store 
+          the runs in, or None to always run the model.
     '''
     # Extract the settings
     R, M, K, hyperparameters = settings['R'], settings['M'], settings['K'], settings['hyperparameters']
@@ -59,10 +61,13 @@ def sparsity_experiment(n_repeats, fractions_unknown, stratify_rows, model_class
     
         for i, (M_train, M_test) in enumerate(Ms_train_and_test):
             print "Repeat %s for fraction=%s." % (i+1, fraction)
-            BMF = model_class(R, M_train, K, hyperparameters) 
-            BMF.initialise(init)
-            BMF.run(iterations)
-            performance = BMF.predict(M_pred=M_test, burn_in=burn_in, thinning=thinning)
+            if cache is not None:
+                performance, _ = cache.run(model_class, R, M_train, M_test, K, hyperparameters, init, iterations, burn_in, thinning)
+            else:
+                BMF = model_class(R, M_train, K, hyperparameters) 
+                BMF.initialise(init)
+                BMF.run(iterations)
+                performance = BMF.predict(M_pred=M_test, burn_in=burn_in, thinning=thinning)
             for metric in METRICS:
                 performances[metric].append(performance[metric])
         for metric in METRICS:
@@ -0,0 +1,52 @@
+'''
+Measure the cold-import latency of the models package: the time it takes a
+fresh Python process to import the truncated normal sampler (rtnorm), and one
+of the models that use it. Each measurement is done in a new interpreter, so
+that nothing is cached in sys.modules. We report the median over the repeats.
+
+We measure this both with numpy/scipy already imported (the cost of our own
+modules), and without (the total cost a user pays when starting a script).
+
+Cold-import time in seconds (Python 2.7, numpy 1.16, scipy 1.2, no .pyc files):
+    Tables as Python list literals in rtnorm.py:
+        rtnorm (preloaded): 0.044.
+        rtnorm (cold): 0.135.
+        bmf_gaussian_truncatednormal (preloaded): 0.153.
+        bmf_gaussian_truncatednormal (cold): 0.503.
+    Tables memory-mapped from rtnorm_tables.bin on first use:
+        rtnorm (preloaded): 0.004.
+        rtnorm (cold): 0.090.
+        bmf_gaussian_truncatednormal (preloaded): 0.154.
+        bmf_gaussian_truncatednormal (cold): 0.426.
+'''
+project_location = "/home/tab43/libraries" # "/Users/thomasbrouwer/Documents/Projects/libraries/" #
+import sys
+sys.path.append(project_location)
+
+import subprocess
+import numpy
+
+
+''' Settings. '''
+repeats = 10
+preload = "import numpy, scipy.special, scipy.stats, matplotlib; "
+modules = [
+    'BMF_Priors.code.models.Gibbs.distributions.rtnorm',
+    'BMF_Priors.code.models.bmf_gaussian_truncatednormal',
+]
+
+
+''' Time a single import of :module in a fresh interpreter. '''
+def time_cold_import(module, preload=""):
+    script = (
+        "import sys, time; sys.path.append(%r); %s"
+        "time0 = time.time(); import %s; print time.time() - time0") % (project_location, preload, module)
+    output = subprocess.check_output([sys.executable, "-c", script])
+    return float(output.split()[-1])
+
+
+''' Time each import, and print the median time. '''
+for module in modules:
+    for (name, pre) in [('preloaded', preload), ('cold', "")]:
+        times = [time_cold_import(module, pre) for repeat in range(repeats)]
+        print "%s (%s): %.3f." % (module.split('.')[-1], name, numpy.median(times))